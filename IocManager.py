@@ -29,6 +29,7 @@ from imutils.IMUtil import (
     execute_config,
     execute_cluster,
     execute_registry,
+    watch_panel,
 )
 
 if __name__ == "__main__":
@@ -246,14 +247,35 @@ if __name__ == "__main__":
     parser_execute.add_argument(
         "--gen-swarm-file",
         action="store_true",
-        help="generate docker service compose file of IOC projects for swarm deploying.",
+        help="generate docker service compose file of IOC projects for swarm deploying."
+        '\nset "--stack-file" to also aggregate all swarm IOC services into stack files.',
     )
     parser_execute.add_argument(
         "--deploy",
         action="store_true",
         help="generate and export startup files, then generate swarm file for deploying."
         '\nset "--force-overwrite" to enable exporting overwrite when IOC in running dir '
-        "conflicts with the one in repository.",
+        "conflicts with the one in repository."
+        "\nimages of IOC projects are checked against registry first, "
+        'set "--skip-image-check" to skip.',
+    )
+    parser_execute.add_argument(
+        "--skip-image-check",
+        action="store_true",
+        help="do not check whether images of IOC projects exist in registry before deploying.",
+    )
+    parser_execute.add_argument(
+        "--stack-file",
+        action="store_true",
+        help="aggregate compose files of all swarm IOC projects into stack files "
+        "after generating swarm files."
+        '\nset "--shards" to split IOC services into several stack files.',
+    )
+    parser_execute.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="number of stack files to split IOC services into.\ndefault: 1",
     )
     parser_execute.add_argument(
         "-b",
@@ -363,6 +385,29 @@ if __name__ == "__main__":
     parser_list.set_defaults(func="parse_list")
     # endregion
 
+    # region for subparser command "watch"
+    parser_watch = subparsers.add_parser(
+        "watch",
+        help="Show live panel of IOC projects updated by changes pushed from IocDockServer.",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+    parser_watch.add_argument(
+        "name",
+        type=str,
+        nargs="*",
+        help="names or glob patterns of IOC projects to show, show all if not given.",
+    )
+    parser_watch.add_argument(
+        "--services",
+        action="store_true",
+        help="show all managed services instead of IOC projects.",
+    )
+    parser_watch.add_argument(
+        "-v", "--verbose", action="store_true", help="show processing details."
+    )
+    parser_watch.set_defaults(func="parse_watch")
+    # endregion
+
     # region for subparser command "rename"
     parser_rename = subparsers.add_parser(
         "rename",
@@ -485,12 +530,30 @@ if __name__ == "__main__":
     parser_cluster.add_argument(
         "--prepare-service-images",
         action="store_true",
-        help="prepare service images.",
+        help="prepare service images: mirror public images and build images of tools concurrently,"
+        "\nthen push them into registry.",
     )
     parser_cluster.add_argument(
         "--prepare-ioc-images",
         action="store_true",
-        help="prepare IOC images.",
+        help="prepare IOC images: build EPICS base images and ioc-exec images concurrently,"
+        "\nthen push them into registry.",
+    )
+    parser_cluster.add_argument(
+        "--max-workers",
+        type=int,
+        default=3,
+        help='max number of images prepared at the same time for "--prepare-*-images". default: 3.',
+    )
+    parser_cluster.add_argument(
+        "--force-build",
+        action="store_true",
+        help="build and push images even if their build context is unchanged since the pushed tag.",
+    )
+    parser_cluster.add_argument(
+        "--no-push",
+        action="store_true",
+        help="build images without pushing them into registry.",
     )
     parser_cluster.add_argument(
         "--registry-login",
@@ -527,6 +590,28 @@ if __name__ == "__main__":
         default=None,
         help="list all images in registry.\nlist tags for specified image if image name is given.",
     )
+    parser_registry.add_argument(
+        "--list-all",
+        action="store_true",
+        help="list all images in registry with all their tags, as image:tag.",
+    )
+    parser_registry.add_argument(
+        "--analyze",
+        action="store_true",
+        help="show disk usage of each repository and tag as unique and shared bytes,"
+        "\nand list tags not used by any IOC project or service as candidates for garbage collection.",
+    )
+    parser_registry.add_argument(
+        "--max-workers",
+        type=int,
+        default=8,
+        help="max number of concurrent requests to registry. default: 8.",
+    )
+    parser_registry.add_argument(
+        "--refresh",
+        action="store_true",
+        help="ignore the local cache of registry responses.",
+    )
     parser_registry.add_argument(
         "-v", "--verbose", action="store_true", help="show processing details."
     )
@@ -578,7 +663,27 @@ if __name__ == "__main__":
     parser_swarm.add_argument(
         "--deploy-all-iocs",
         action="store_true",
-        help="deploy all IOC projects that are available but not deployed into running.",
+        help="deploy all IOC projects that are available but not deployed into running."
+        '\nset "--stack-file" to deploy all IOC services by a single stack deploy '
+        "with aggregated stack files."
+        "\nimages of IOC projects are checked against registry first, "
+        'set "--skip-image-check" to skip.',
+    )
+    parser_swarm.add_argument(
+        "--skip-image-check",
+        action="store_true",
+        help="do not check whether images of IOC projects exist in registry before deploying.",
+    )
+    parser_swarm.add_argument(
+        "--stack-file",
+        action="store_true",
+        help="use aggregated stack files of all swarm IOC services.",
+    )
+    parser_swarm.add_argument(
+        "--shards",
+        type=int,
+        default=1,
+        help="number of stack files to split IOC services into.\ndefault: 1",
     )
     parser_swarm.add_argument(
         "--remove-global-services",
@@ -590,10 +695,25 @@ if __name__ == "__main__":
         action="store_true",
         help="remove all deployed ioc projects services.",
     )
+    parser_swarm.add_argument(
+        "--pause-iocs",
+        type=str,
+        nargs="*",
+        help="scale deployed IOC services to 0 replicas for maintenance, original replicas are recorded."
+        "\naccept IOC names or shell-style patterns, all IOC services will be paused if none given.",
+    )
+    parser_swarm.add_argument(
+        "--resume-iocs",
+        type=str,
+        nargs="*",
+        help="scale paused IOC services back to the recorded replicas."
+        "\naccept IOC names or shell-style patterns, all paused IOC services will be resumed if none given.",
+    )
     parser_swarm.add_argument(
         "--remove-all-services",
         action="store_true",
-        help="remove all deployed services including global services.",
+        help="remove all deployed services including global services."
+        '\nservices are removed concurrently, set "--max-workers" to control the concurrency.',
     )
     parser_swarm.add_argument(
         "--show-digest",
@@ -647,6 +767,112 @@ if __name__ == "__main__":
     parser_swarm.add_argument(
         "--backup-file", type=str, default="", help="tgz backup file for swarm."
     )
+    parser_swarm.add_argument(
+        "--plan",
+        action="store_true",
+        help="show the difference between compose definition and deployed service of all IOC projects."
+        '\nset "--verbose" to show unchanged services and details of changes.',
+    )
+    parser_swarm.add_argument(
+        "--apply",
+        action="store_true",
+        help="deploy only IOC services that are not deployed or whose specification has changed.",
+    )
+    parser_swarm.add_argument(
+        "--plan-placement",
+        action="store_true",
+        help="assign IOC services to worker nodes by bin packing according to [DEPLOY] resources settings "
+        "and node capacities, then regenerate swarm files of IOC projects with node placement constraints.",
+    )
+    parser_swarm.add_argument(
+        "--capacity",
+        action="store_true",
+        help="show resources of IOC services aggregated per node with headroom, "
+        "and simulate the loss of each single worker node."
+        '\nset "--verbose" to show names of IOC services left unscheduled.',
+    )
+    parser_swarm.add_argument(
+        "--recommend-resources",
+        action="store_true",
+        help="recommend [DEPLOY] resources settings of IOC projects from CPU and memory usage history "
+        "of cAdvisor metrics in prometheus."
+        '\nset "--window" to choose the time range of history.'
+        '\nset "--write" to write recommended settings into IOC projects in repository.',
+    )
+    parser_swarm.add_argument(
+        "--window",
+        type=str,
+        default="7d",
+        help="time range of usage history, in prometheus duration format.\ndefault: 7d",
+    )
+    parser_swarm.add_argument(
+        "--prometheus-url",
+        type=str,
+        default="",
+        help="url of prometheus http api.\ndefault: PROMETHEUS_URL in settings",
+    )
+    parser_swarm.add_argument(
+        "--write", action="store_true", help="write recommended resources settings."
+    )
+    parser_swarm.add_argument(
+        "--prepull-images",
+        action="store_true",
+        help="pull images of IOC services to be created or updated to their target nodes concurrently "
+        'through ansible before "--apply" or "--update-in-place".'
+        '\nset "--all-nodes" to pull images to all available worker nodes.'
+        '\nset "--max-workers" to control how many nodes pull at the same time.',
+    )
+    parser_swarm.add_argument(
+        "--all-nodes",
+        action="store_true",
+        help="pull images to all available worker nodes.",
+    )
+    parser_swarm.add_argument(
+        "--update-in-place",
+        action="store_true",
+        help="update changed IOC services concurrently by patching image, resources, labels and environment "
+        "of deployed services in place, without a stack deploy."
+        '\nset "--max-workers" to control how many services are updated concurrently.',
+    )
+    parser_swarm.add_argument(
+        "--max-workers",
+        type=int,
+        default=8,
+        help="max number of services operated concurrently.\ndefault: 8",
+    )
+    parser_swarm.add_argument(
+        "--drain-node",
+        type=str,
+        help="move IOC services on the given node to other nodes in batches, lower priority IOC first."
+        '\nset "--batch-size" to control how many IOC services are moved in each batch.'
+        '\nset "--timeout" to control seconds to wait for each batch to be running.',
+    )
+    parser_swarm.add_argument(
+        "--prepare-cold-start",
+        action="store_true",
+        help="stop running IOC services before powering off the cluster, "
+        'so that they are started by "--cold-start" group by group after power on.'
+        '\nset "--max-workers" to control how many IOC services are stopped at the same time.',
+    )
+    parser_swarm.add_argument(
+        "--cold-start",
+        action="store_true",
+        help='start IOC services stopped by "--prepare-cold-start" group by group according to '
+        "[DEPLOY] start_group and priority, each group waits for the previous one to be running."
+        '\nset "--max-workers" to control how many IOC services are started at the same time.',
+    )
+    parser_swarm.add_argument(
+        "--batch-size",
+        type=int,
+        default=5,
+        help="number of services operated in each batch.\ndefault: 5",
+    )
+    parser_swarm.add_argument(
+        "--timeout",
+        type=int,
+        default=300,
+        help="seconds to wait for each batch of services to be running.\ndefault: 300",
+    )
     parser_swarm.add_argument(
         "--update-deployed-services",
         action="store_true",
@@ -698,7 +924,22 @@ if __name__ == "__main__":
         "--show-logs", action="store_true", help="show logs of running service."
     )
     parser_service.add_argument(
-        "--update", action="store_true", help="restart running service."
+        "--update",
+        action="store_true",
+        help="restart running service."
+        '\nset "--in-place" to only patch changed specification of IOC services by docker API.',
+    )
+    parser_service.add_argument(
+        "--in-place",
+        action="store_true",
+        help="update IOC services in place concurrently with docker API."
+        '\nset "--max-workers" to control how many services are updated concurrently.',
+    )
+    parser_service.add_argument(
+        "--max-workers",
+        type=int,
+        default=8,
+        help="max number of services operated concurrently.\ndefault: 8",
     )
     parser_service.add_argument(
         "-v", "--verbose", action="store_true", help="show processing details."
@@ -833,6 +1074,9 @@ if __name__ == "__main__":
             show_panel=args.show_panel,
             verbose=args.verbose,
         )
+    if args.func == "parse_watch":
+        # ./IocManager.py watch
+        watch_panel(args.name, show_services=args.services, verbose=args.verbose)
     if args.func == "parse_remove":
         # ./IocManager.py remove
         for item in args.name:
@@ -15,13 +15,13 @@ _mycommand_completion() {
 	option_set_last=""
 	
 	# 
-	sub_command_opts="create set edit exec list rename remove config cluster registry ansible swarm service client make-certs manage-certs"
+	sub_command_opts="create set edit exec list watch rename remove config cluster registry ansible swarm service client make-certs manage-certs"
 	
 	#
 	create_prompt="--options --section --ini-file --caputlog --status-ioc --status-os --autosave --add-asyn --add-stream --add-raw"
 	#
 	exec_prompt="" # general prompt for all exec commands.
-	exec_ioc_prompt="--generate-and-export --gen-startup-file --export-for-mount --add-src-file --add-snapshot-file --check-snapshot --restore-snapshot-file --gen-swarm-file --deploy --check-deploy" # exec commands for specified IOC projects.
+	exec_ioc_prompt="--generate-and-export --gen-startup-file --export-for-mount --add-src-file --add-snapshot-file --check-snapshot --restore-snapshot-file --gen-swarm-file --deploy --check-deploy --stack-file --shards --skip-image-check" # exec commands for specified IOC projects.
 	#
 	list_prompt="--section --list-from --show-info --show-description --show-panel"
 	_condition_type_prompt="name= state=normal state=warning state=error"
@@ -30,11 +30,11 @@ _mycommand_completion() {
 	#
 	rename_prompt=""
 	#
-	swarm_prompt="--gen-built-in-services --deploy-global-services --deploy-all-iocs --remove-global-services --remove-all-iocs --remove-all-services --show-digest --show-services --show-nodes --show-tokens --backup-swarm --restore-swarm --update-deployed-services"
+	swarm_prompt="--gen-built-in-services --deploy-global-services --deploy-all-iocs --remove-global-services --remove-all-iocs --remove-all-services --show-digest --show-services --show-nodes --show-tokens --backup-swarm --restore-swarm --update-deployed-services --stack-file --shards --plan --apply --update-in-place --max-workers --pause-iocs --resume-iocs --drain-node --batch-size --timeout --prepare-cold-start --cold-start --plan-placement --capacity --recommend-resources --window --prometheus-url --write --prepull-images --all-nodes --skip-image-check"
 	#
-	service_prompt="--deploy --remove --show-config --show-info --show-logs --update"
+	service_prompt="--deploy --remove --show-config --show-info --show-logs --update --in-place --max-workers"
 	#
-	cluster_prompt="--gen-inventory-files --create-remote-user --set-up-ssh-connection --set-up-basic-environment --set-up-swarm --set-up-cluster --ping --registry-login --set-up-file-and-dir --set-up-root-cert --prepare-service-images --prepare-ioc-images"
+	cluster_prompt="--gen-inventory-files --create-remote-user --set-up-ssh-connection --set-up-basic-environment --set-up-swarm --set-up-cluster --ping --registry-login --set-up-file-and-dir --set-up-root-cert --prepare-service-images --prepare-ioc-images --max-workers --force-build --no-push"
 	
 
 	# sub-commands completion.( 2nd position )
@@ -76,6 +76,10 @@ _mycommand_completion() {
 			compopt -o nospace
 			prompt="$list_prompt $_condition_type_prompt"
 			;;
+			"watch")
+			prompt="--services"
+			prompt="$ioc_list $prompt"
+			;;
 			"remove")
 			prompt="" # "remove" should specify an IOC project firstly.
 			prompt="$ioc_list $prompt"
@@ -105,7 +109,7 @@ _mycommand_completion() {
 			prompt="$cluster_prompt"
 			;;
 			"registry")
-			prompt="--list"
+			prompt="--list --list-all --analyze --max-workers --refresh"
 			;;
 			*)
 			return 1
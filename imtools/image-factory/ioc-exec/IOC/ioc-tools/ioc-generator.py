@@ -5,20 +5,25 @@ IOC Generator Script
 This script creates an IOC (Input/Output Controller) project with specified modules for EPICS (Experimental Physics and Industrial Control System).
 
 Usage:
-    python ioc-generator.py --modules="module1 module2 ..." [--with-seq]
+    python ioc-generator.py --modules="module1 module2 ..." [--with-seq] [--incremental]
 
 Arguments:
     --modules="module1 module2 ..."   Specify modules to install as a space-separated list in quotes
                                       Supported modules: seq, asyn, StreamDevice, caPutLog, 
                                       autosave, iocStats, modbus, s7nodave, BACnet
     --with-seq                        Enable seq (sequencer) module installation (optional)
+    --incremental                     Keep IOC project of last run and only redo steps whose inputs changed,
+                                      inputs of last run are recorded in manifest file of IOC project (optional)
 
 Examples:
     python ioc-generator.py --modules="asyn autosave iocStats"
     python ioc-generator.py --modules="seq autosave caPutLog iocStats" --with-seq
+    python ioc-generator.py --modules="seq asyn StreamDevice" --with-seq --incremental
 """
 
 import os, shutil
+import json
+import hashlib
 from subprocess import Popen, TimeoutExpired, PIPE
 import sys
 import argparse
@@ -37,8 +42,11 @@ MODULES_TO_INSTALL = [
 ]
 IOC_NAME = "ST-IOC"
 MODULES_DIR_NAME = "SUPPORT"
+# directory in IOC project to keep manifest of inputs and Makefiles created by makeBaseApp.pl.
+MANIFEST_DIR_NAME = ".ioc-generator"
 
 with_seq = False
+incremental = False
 seq_file_list = []
 
 # Register supported modules.
@@ -206,27 +214,84 @@ def _escape_str(string: str):
     return string.replace("\n", "\\n")
 
 
+# 根据给定的字符串匹配位置，添加列表里的字符串至文本行中第一个匹配的位置处, 不存在匹配位置时返回None
+def insert_lines(lines: list, idx_str, str_list: list):
+    try:
+        idx = lines.index(idx_str)
+    except ValueError:
+        return None
+    else:
+        return lines[0 : idx + 1] + list(str_list) + lines[idx + 1 :]
+
+
 # 读取文件，根据给定的字符串匹配位置，添加列表里的字符串至文件中第一个匹配的位置处
 def add_lines(file_path, idx_str, str_list: list):
     with open(file_path, "r") as f:
         file = f.readlines()
-    try:
-        idx = file.index(idx_str)
-    except ValueError:
+    new_file = insert_lines(file, idx_str, str_list)
+    if new_file is None:
         print(
             f'add_lines: 文件"{file_path}"中不存在与"{_escape_str(idx_str)}"匹配的文本行.'
         )
     else:
-        first_half = file[0 : idx + 1]
-        second_half = file[idx + 1 :]
-        new_file = []
-        new_file.extend(first_half)
-        new_file.extend(str_list)
-        new_file.extend(second_half)
         with open(file_path, "w") as f:
             f.writelines(new_file)
 
 
+def file_digest(file_path):
+    # sha256 of file content, "" if file not exists.
+    if not os.path.isfile(file_path):
+        return ""
+    with open(file_path, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def text_digest(lines):
+    return hashlib.sha256("".join(lines).encode()).hexdigest()
+
+
+def write_if_changed(file_path, lines):
+    """
+    Write lines to file only if its content differs, so that make does not rebuild targets depending on it.
+
+    :return: whether file was written.
+    """
+    if os.path.isfile(file_path):
+        with open(file_path, "r") as f:
+            if f.readlines() == list(lines):
+                return False
+    with open(file_path, "w") as f:
+        f.writelines(lines)
+    return True
+
+
+def copy_if_changed(src, dest, mode="r"):
+    """
+    Copy file only if content of destination file differs, modification time of unchanged files is kept.
+
+    :return: whether file was copied.
+    """
+    if os.path.isfile(src) and file_digest(src) == file_digest(dest):
+        return False
+    return file_copy(src, dest, mode=mode, verbose=True)
+
+
+def load_manifest(ioc_top_dir):
+    # manifest of inputs of last successful run, {} if not exists.
+    try:
+        with open(os.path.join(ioc_top_dir, MANIFEST_DIR_NAME, "manifest.json"), "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_manifest(ioc_top_dir, manifest):
+    file_path = os.path.join(ioc_top_dir, MANIFEST_DIR_NAME, "manifest.json")
+    with open(f"{file_path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(f"{file_path}.tmp", file_path)
+
+
 # Return module path from SUPPORT dir.
 def get_module_path(support_dir):
     support_dir = os.path.normpath(support_dir)
@@ -246,6 +311,22 @@ def get_module_path(support_dir):
     return path_list
 
 
+def get_support_key(path_list):
+    # Identify builds of support modules by ".build-key" written by build-planner.py, or by their libraries.
+    lines = list(path_list)
+    for item in path_list:
+        module_dir = item.strip().split("=", 1)[1]
+        if os.path.isfile(os.path.join(module_dir, ".build-key")):
+            with open(os.path.join(module_dir, ".build-key"), "r") as f:
+                lines.append(f"{f.read().strip()}\n")
+        else:
+            for root, _, files in sorted(os.walk(os.path.join(module_dir, "lib"))):
+                for name in sorted(files):
+                    file_path = os.path.join(root, name)
+                    lines.append(f"{file_path}:{os.path.getmtime(file_path)}\n")
+    return text_digest(lines)
+
+
 def parse_arguments():
     import sys
     # 解析命令行参数，以支持 --modules="a b c" 的格式
@@ -268,6 +349,10 @@ def parse_arguments():
             
         elif arg == '--with-seq':
             args['with_seq'] = True
+
+        elif arg == '--incremental':
+            global incremental
+            incremental = True
             
         i += 1
 
@@ -321,20 +406,8 @@ def preparation_for_seq():
     return True
 
 
-def main():
-    #
-    if with_seq:
-        preparation_for_seq()
-    #
-    tool_path = os.getcwd()
-    top_dir = os.path.normpath(os.path.join(os.getcwd(), ".."))
-    ioc_top_dir = os.path.join(top_dir, IOC_NAME)
-    seq_src_dir = os.path.normpath(os.path.join(top_dir, "src", "seq"))
-
-    # Create IOC directory
-    print(f"Creating IOC project...")
-    print(f"MODULES_TO_INSTALL: {', '.join(MODULES_TO_INSTALL)}")
-    create_flag = False
+def create_ioc_skeleton(ioc_top_dir):
+    # Create IOC directory by makeBaseApp.pl, Makefiles created are kept in manifest directory.
     if os.path.isdir(ioc_top_dir):
         print(f"IOC project directory exists, deleting it...")
         if os.system(f"rm -rf {ioc_top_dir}"):
@@ -358,6 +431,7 @@ def main():
         stdout=PIPE,
         stderr=PIPE,
     )
+    create_flag = False
     try:
         outs, errs = proc.communicate(input=f"{IOC_NAME}\n", timeout=15)
         print()
@@ -384,73 +458,149 @@ def main():
     file_path = os.path.join(ioc_top_dir, "iocBoot", f"ioc{IOC_NAME}", "st.cmd")
     os.system(f"chmod u+x {file_path}")
 
+    # Keep Makefiles created, Makefiles of IOC project are generated from them.
+    try_makedirs(os.path.join(ioc_top_dir, MANIFEST_DIR_NAME))
+    for item in ("src", "Db"):
+        shutil.copy(
+            os.path.join(ioc_top_dir, f"{IOC_NAME}App", item, "Makefile"),
+            os.path.join(ioc_top_dir, MANIFEST_DIR_NAME, f"{item}.Makefile"),
+        )
+
+
+def main():
+    #
+    if with_seq:
+        preparation_for_seq()
+    #
+    tool_path = os.getcwd()
+    top_dir = os.path.normpath(os.path.join(os.getcwd(), ".."))
+    ioc_top_dir = os.path.join(top_dir, IOC_NAME)
+    seq_src_dir = os.path.normpath(os.path.join(top_dir, "src", "seq"))
+
+    # Inputs of each step, a step is redone only if its inputs differ from those in manifest of last run.
+    print(f"Creating IOC project...")
+    print(f"MODULES_TO_INSTALL: {', '.join(MODULES_TO_INSTALL)}")
+    make_base_app = shutil.which("makeBaseApp.pl") or ""
+    manifest = {
+        "skeleton": text_digest(
+            [
+                f"{IOC_NAME}\n",
+                f'{os.environ.get("EPICS_BASE", "")}\n',
+                f"{file_digest(make_base_app)}\n",
+            ]
+        ),
+    }
+    last_manifest = load_manifest(ioc_top_dir) if incremental else {}
+    redone = []
+
+    # Create IOC directory.
+    if last_manifest.get("skeleton") != manifest["skeleton"] or not os.path.isfile(
+        os.path.join(ioc_top_dir, MANIFEST_DIR_NAME, "src.Makefile")
+    ):
+        create_ioc_skeleton(ioc_top_dir)
+        last_manifest = {}
+        redone.append("skeleton")
+    else:
+        print(f'Reuse IOC project at "{ioc_top_dir}".')
+        os.chdir(ioc_top_dir)
+
     # Generate configure/RELEASE.
     support_dir_path = os.path.normpath(os.path.join(top_dir, "..", MODULES_DIR_NAME))
     lines_to_add = get_module_path(support_dir_path)
     if lines_to_add:
         file_path = os.path.join(top_dir, "RELEASE.local")
-        with open(file_path, "w") as f:
-            f.writelines(lines_to_add)
+        if write_if_changed(file_path, lines_to_add):
             print(f'Create RELEASE.local at "{file_path}".')
     else:
         print(f"failed to create RELEASE.local.")
         exit(1)
+    manifest["support"] = get_support_key(lines_to_add)
 
     # Copy .dbd files
-    print(f'Copy file "systemCommand.dbd".')
-    file_copy(
+    dest_dir = os.path.join(ioc_top_dir, f"{IOC_NAME}App", "src")
+    if copy_if_changed(
         os.path.join(tool_path, "systemCommand.dbd"),
-        os.path.join(ioc_top_dir, f"{IOC_NAME}App", "src", "systemCommand.dbd"),
+        os.path.join(dest_dir, "systemCommand.dbd"),
         mode="rw",
-        verbose=True,
-    )
-
-    # Handle Makefile
-    print(f"Handle IOC Makefile.")
-    lines_to_add = [
-        "\n",
-    ]
-    lines_to_add.extend(DEFAULT_MAKEFILE_TEMPLATE)
-    # if sequencer to be installed, add src files.
+    ):
+        redone.append("systemCommand.dbd")
+    # if sequencer to be installed, add src files, src files removed from seq dir are removed too.
     if with_seq:
-        dest_dir = os.path.join(ioc_top_dir, f"{IOC_NAME}App", "src")
-        file_copy(
+        if copy_if_changed(
             os.path.join(tool_path, "sncPrograms.dbd"),
             os.path.join(dest_dir, "sncPrograms.dbd"),
             mode="r",
-            verbose=True,
-        )
+        ):
+            redone.append("sncPrograms.dbd")
         for st_file in seq_file_list:
-            file_copy(
+            if copy_if_changed(
                 os.path.join(seq_src_dir, st_file),
                 os.path.join(dest_dir, st_file),
                 mode="r",
-                verbose=True,
-            )
+            ):
+                redone.append(st_file)
+    for item in os.listdir(dest_dir):
+        if item.endswith(".stt") and item not in seq_file_list:
+            file_remove(os.path.join(dest_dir, item), verbose=True)
+            redone.append(item)
+    manifest["sources"] = {
+        item: file_digest(os.path.join(dest_dir, item))
+        for item in sorted(os.listdir(dest_dir))
+        if item.endswith((".stt", ".dbd"))
+    }
+
+    # Handle Makefile
+    print(f"Handle IOC Makefile.")
+    lines_to_add = [
+        "\n",
+    ]
+    lines_to_add.extend(DEFAULT_MAKEFILE_TEMPLATE)
     for item in MODULES_TO_INSTALL:
         lines_to_add.extend(MODULES_MAKEFILE_TEMPLATE[item])
     for i in range(0, len(lines_to_add)):
         lines_to_add[i] = lines_to_add[i].replace("template", IOC_NAME)
-    file_path = os.path.join(ioc_top_dir, f"{IOC_NAME}App", "src", "Makefile")
-    add_lines(file_path, f"#{IOC_NAME}_LIBS += xxx\n", lines_to_add)
-
+    makefiles = {"src": (f"#{IOC_NAME}_LIBS += xxx\n", lines_to_add)}
     # If set asyn, handle DB_install
     if "asyn" in MODULES_TO_INSTALL:
-        file_path = os.path.join(ioc_top_dir, f"{IOC_NAME}App", "Db", "Makefile")
-        add_lines(
-            file_path, f"#DB += xxx.db\n", ["DB_INSTALLS += $(ASYN)/db/asynRecord.db\n"]
-        )
+        makefiles["Db"] = (f"#DB += xxx.db\n", ["DB_INSTALLS += $(ASYN)/db/asynRecord.db\n"])
+    makefile_lines = []
+    for item in ("src", "Db"):
+        with open(os.path.join(ioc_top_dir, MANIFEST_DIR_NAME, f"{item}.Makefile"), "r") as f:
+            lines = f.readlines()
+        if item in makefiles:
+            new_lines = insert_lines(lines, *makefiles[item])
+            if new_lines is None:
+                print(
+                    f'error: no line matching "{_escape_str(makefiles[item][0])}" in Makefile of "{item}".'
+                )
+                exit(1)
+            lines = new_lines
+        file_path = os.path.join(ioc_top_dir, f"{IOC_NAME}App", item, "Makefile")
+        write_if_changed(file_path, lines)
+        makefile_lines.extend(lines)
+    if "asyn" in MODULES_TO_INSTALL:
         print(f"Handled IOC Makefile for asyn.")
-
+    manifest["makefile"] = text_digest(makefile_lines)
     print(f'Finish handling "Makefile" at {file_path}.')
 
-    # execute make
+    # Objects are rebuilt if modules or their builds changed, as make does not track changes of them.
     os.chdir(ioc_top_dir)
+    for step in ("support", "makefile"):
+        if last_manifest and last_manifest.get(step) != manifest[step]:
+            redone.append(step)
+            print(f"Inputs of {step} changed, execute make clean...")
+            os.system("make clean")
+            break
+    if incremental:
+        print(f'Changed: {", ".join(redone) if redone else "nothing"}.')
+
+    # execute make
     print(f"Move to {ioc_top_dir}\n then execute make...")
     if os.system("make -j$(nproc)"):
         print(f"error: failed to execute make.")
         exit(1)
     else:
+        save_manifest(ioc_top_dir, manifest)
         print(f"Deleting immediate files...")
         file_remove(os.path.join(tool_path, "sncPrograms.dbd"), verbose=False)
         print(f"Successfully Build IOC Project.")
@@ -0,0 +1,412 @@
+#!/usr/bin/python3
+"""
+SUPPORT Module Build Planner
+
+This script installs EPICS support modules from their zip packages in parallel. Dependencies between modules
+are read from "ModulesDependency.txt" and "checkDependency.sh", modules are built level by level in
+topological order and modules of the same level are built concurrently.
+
+Output of each module is cached by the hash of its zip package, the EPICS base it is built against and the
+cache keys of the modules it depends on, so that after one module is bumped only that module and the
+modules depending on it are compiled again.
+
+Usage:
+    python build-planner.py [--modules="module1 module2 ..."] [--cache-dir=DIR] [--plan]
+
+Arguments:
+    --modules="module1 module2 ..."   Specify modules to install as a space-separated list in quotes,
+                                      default: seq asyn autosave caPutLog iocStats StreamDevice modbus s7nodave BACnet
+    --cache-dir=DIR                   Directory to keep built modules, caching disabled if not set
+    --plan                            Only print build levels and cache state of modules
+
+Examples:
+    python build-planner.py --modules="seq asyn StreamDevice" --cache-dir=/opt/EPICS/SUPPORT-cache
+    python build-planner.py --plan
+"""
+
+import os
+import re
+import sys
+import time
+import glob
+import hashlib
+import tarfile
+import tempfile
+import zipfile
+import threading
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+#
+DEFAULT_MODULES = [
+    "seq",
+    "asyn",
+    "autosave",
+    "caPutLog",
+    "iocStats",
+    "StreamDevice",
+    "modbus",
+    "s7nodave",
+    "BACnet",
+]
+# package names used in RELEASE files for modules.
+# Format: {'path name': ['package name', 'alias' ...]}
+PACKAGE_NAMES = {
+    "seq": ["SNCSEQ"],
+    "asyn": ["ASYN"],
+    "StreamDevice": ["STREAM"],
+    "caPutLog": ["CAPUTLOG"],
+    "autosave": ["AUTOSAVE"],
+    "iocStats": ["DEVIOCSTATS", "IOCADMIN"],
+    "modbus": ["MODBUS"],
+    "s7nodave": ["S7NODAVE"],
+    "BACnet": ["BACNET"],
+    "calc": ["CALC"],
+    "sscan": ["SSCAN"],
+    "busy": ["BUSY"],
+}
+# number of archives kept in cache directory for each module.
+CACHE_KEEP = 3
+
+SUPPORT_DIR = os.path.dirname(os.path.abspath(__file__))
+print_lock = threading.Lock()
+
+
+def log(module, message):
+    with print_lock:
+        for line in str(message).rstrip("\n").splitlines():
+            print(f"[{module}] {line}")
+
+
+def parse_dependency_file(file_path):
+    """
+    Parse "ModulesDependency.txt", optional dependencies and EPICS_BASE are left out.
+
+    :return: dict of {module name: list of package names required}.
+    """
+    res = {}
+    module = None
+    with open(file_path, "r") as f:
+        for line in f.readlines():
+            if re.match(r"^\w", line) and not line.startswith("dependency"):
+                module = re.sub(r"\(.*\)", "", line).strip()
+                res.setdefault(module, [])
+            elif module and line.strip().startswith("<-"):
+                dependency = line.strip()[2:].strip()
+                if "optional" in dependency:
+                    continue
+                package = dependency.split()[0]
+                if package != "EPICS_BASE":
+                    res[module].append(package)
+    return res
+
+
+def parse_check_dependency(file_path):
+    # parse 'module_dict["module"]="dep1 dep2 "' of "checkDependency.sh" as dict of {module: [modules]}.
+    with open(file_path, "r") as f:
+        return {
+            module: deps.split()
+            for module, deps in re.findall(
+                r'^module_dict\["([^"]+)"\]="([^"]*)"', f.read(), flags=re.M
+            )
+        }
+
+
+def get_dependencies(modules):
+    """
+    Get modules each module depends on, from required dependencies in "ModulesDependency.txt" of
+    modules with exactly the same name and from "checkDependency.sh".
+
+    :return: dict of {module: set of modules}.
+    """
+    package_to_module = {
+        package.upper(): module
+        for module, packages in PACKAGE_NAMES.items()
+        for package in packages
+    }
+    res = {module: set() for module in modules}
+    txt = parse_dependency_file(os.path.join(SUPPORT_DIR, "ModulesDependency.txt"))
+    txt = {module.lower(): packages for module, packages in txt.items()}
+    for module in modules:
+        for package in txt.get(module.lower(), []):
+            if package.upper() in package_to_module:
+                res[module].add(package_to_module[package.upper()])
+    for module, deps in parse_check_dependency(
+        os.path.join(SUPPORT_DIR, "checkDependency.sh")
+    ).items():
+        if module in res:
+            res[module].update(deps)
+    return res
+
+
+def get_build_levels(dependencies):
+    """
+    Sort modules into levels by Kahn's algorithm, modules of a level depend only on modules of former levels.
+
+    :return: list of lists of modules.
+    """
+    remaining = {module: set(deps) for module, deps in dependencies.items()}
+    levels = []
+    while remaining:
+        level = sorted(module for module, deps in remaining.items() if not deps)
+        if not level:
+            raise ValueError(f'dependency cycle among: {" ".join(sorted(remaining))}')
+        levels.append(level)
+        for module in level:
+            remaining.pop(module)
+        for deps in remaining.values():
+            deps.difference_update(level)
+    return levels
+
+
+def file_hash(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_base_fingerprint():
+    # identify EPICS base the modules are built against by its path and installed libraries.
+    epics_base = os.environ.get("EPICS_BASE", "")
+    arch = os.environ.get("EPICS_HOST_ARCH", "")
+    digest = hashlib.sha256(f"{epics_base}\n{arch}\n".encode())
+    lib_dir = os.path.join(epics_base, "lib", arch)
+    if os.path.isdir(lib_dir):
+        for item in sorted(os.listdir(lib_dir)):
+            digest.update(f"{item}:{os.path.getsize(os.path.join(lib_dir, item))}\n".encode())
+    return digest.hexdigest()
+
+
+def get_module_dir(module):
+    # name of top directory in zip package of module, such as "asyn-R4-44-2".
+    with zipfile.ZipFile(os.path.join(SUPPORT_DIR, f"{module}.zip")) as f:
+        return f.namelist()[0].split("/")[0]
+
+
+def write_release_local(modules, dependencies):
+    # RELEASE.local for building modules of a level, defining EPICS_BASE and modules they depend on.
+    lines = [f'EPICS_BASE={os.environ["EPICS_BASE"]}\n']
+    for dep in sorted(set().union(*(dependencies[item] for item in modules))):
+        lines.append(
+            f"{PACKAGE_NAMES[dep][0]}={os.path.join(SUPPORT_DIR, get_module_dir(dep))}\n"
+        )
+    with open(os.path.join(SUPPORT_DIR, "RELEASE.local"), "w") as f:
+        f.writelines(lines)
+
+
+def restore_from_cache(module, cache_path):
+    """
+    Unpack cached output of module, archive may be removed by pruning of a concurrent build sharing the cache.
+
+    :return: whether module restored.
+    """
+    try:
+        with tarfile.open(cache_path, "r:gz") as f:
+            f.extractall(SUPPORT_DIR)
+    except (OSError, tarfile.TarError) as e:
+        log(module, f'Failed to restore from cache "{os.path.basename(cache_path)}", {e}.')
+        return False
+    log(module, f'Restored from cache "{os.path.basename(cache_path)}".')
+    return True
+
+
+def save_to_cache(module, key, cache_dir):
+    module_dir = get_module_dir(module)
+    cache_path = os.path.join(cache_dir, f"{module}-{key[:16]}.tar.gz")
+    # unique temporary file in cache directory, so that concurrent builds sharing the cache never write
+    # to the same file and the archive appears complete by renaming.
+    fd, temp_path = tempfile.mkstemp(
+        prefix=f".{module}-", suffix=".tmp", dir=cache_dir
+    )
+    try:
+        with os.fdopen(fd, "wb") as temp_file:
+            with tarfile.open(fileobj=temp_file, mode="w:gz") as f:
+                f.add(
+                    os.path.join(SUPPORT_DIR, module_dir),
+                    arcname=module_dir,
+                    # intermediate build directories are not needed by dependent modules and IOC.
+                    filter=lambda x: None if os.path.basename(x.name).startswith("O.") else x,
+                )
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, cache_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    # remove old archives of module, archives may be removed or replaced by a concurrent build meanwhile.
+    archives = []
+    for item in glob.glob(os.path.join(cache_dir, f"{module}-*.tar.gz")):
+        try:
+            archives.append((os.path.getmtime(item), item))
+        except OSError:
+            continue
+    archives.sort(reverse=True)
+    for _, item in archives[CACHE_KEEP:]:
+        if item == cache_path:
+            continue
+        try:
+            os.remove(item)
+        except FileNotFoundError:
+            pass
+
+
+def build_module(module, key, jobs):
+    """
+    Unpack module and run make in its directory, output is printed with prefix "[module]".
+
+    :return: whether make succeeded.
+    """
+    module_dir = os.path.join(SUPPORT_DIR, get_module_dir(module))
+    if os.path.isdir(module_dir):
+        subprocess.run(["rm", "-rf", module_dir], check=True)
+    subprocess.run(
+        ["unzip", "-o", "-q", f"{module}.zip"], cwd=SUPPORT_DIR, check=True
+    )
+    process = subprocess.Popen(
+        ["make", f"-j{jobs}"],
+        cwd=module_dir,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+    )
+    for line in process.stdout:
+        log(module, line)
+    if process.wait() != 0:
+        return False
+    with open(os.path.join(module_dir, ".build-key"), "w") as f:
+        f.write(key)
+    return True
+
+
+def is_installed(module, key):
+    # whether module has been built with the same key in SUPPORT directory.
+    try:
+        with open(os.path.join(SUPPORT_DIR, get_module_dir(module), ".build-key")) as f:
+            return f.read().strip() == key
+    except OSError:
+        return False
+
+
+def parse_arguments():
+    args = {"modules": list(DEFAULT_MODULES), "cache_dir": "", "plan": False}
+    if "-h" in sys.argv or "--help" in sys.argv:
+        print(__doc__)
+        sys.exit(0)
+    for arg in sys.argv[1:]:
+        if arg.startswith("--modules="):
+            args["modules"] = list(dict.fromkeys(arg.split("=", 1)[1].split()))
+        elif arg.startswith("--cache-dir="):
+            args["cache_dir"] = arg.split("=", 1)[1]
+        elif arg == "--plan":
+            args["plan"] = True
+        else:
+            print(f'Error: Unknown option "{arg}".')
+            sys.exit(1)
+    return args
+
+
+def main():
+    args = parse_arguments()
+    modules = args["modules"]
+    for module in modules:
+        if not os.path.isfile(os.path.join(SUPPORT_DIR, f"{module}.zip")):
+            print(f'Error: "{module}.zip" not found.')
+            sys.exit(1)
+    dependencies = get_dependencies(modules)
+    for module, deps in dependencies.items():
+        missing = sorted(deps - set(modules))
+        if missing:
+            print(
+                f'Error: "{module}" depends on {", ".join(missing)}, which is not set to install.'
+            )
+            sys.exit(1)
+    try:
+        levels = get_build_levels(dependencies)
+    except ValueError as e:
+        print(f"Error: {e}.")
+        sys.exit(1)
+
+    # cache keys in topological order.
+    base_fingerprint = get_base_fingerprint()
+    keys = {}
+    for level in levels:
+        for module in level:
+            digest = hashlib.sha256(
+                f"{file_hash(os.path.join(SUPPORT_DIR, f'{module}.zip'))}\n{base_fingerprint}\n".encode()
+            )
+            for dep in sorted(dependencies[module]):
+                digest.update(f"{dep}={keys[dep]}\n".encode())
+            keys[module] = digest.hexdigest()
+
+    cache_dir = args["cache_dir"]
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def cache_path_of(module):
+        if not cache_dir:
+            return ""
+        path = os.path.join(cache_dir, f"{module}-{keys[module][:16]}.tar.gz")
+        return path if os.path.isfile(path) else ""
+
+    print(f"Build plan for modules: {' '.join(modules)}")
+    for i, level in enumerate(levels):
+        print(
+            f"  level {i}: "
+            + " ".join(
+                f'{module}({"installed" if is_installed(module, keys[module]) else "cached" if cache_path_of(module) else "build"})'
+                for module in level
+            )
+        )
+    if args["plan"]:
+        return
+
+    cpus = os.cpu_count() or 1
+    summary = []
+    start_time = time.time()
+    for i, level in enumerate(levels):
+        write_release_local(level, dependencies)
+        to_build = []
+        for module in level:
+            if is_installed(module, keys[module]):
+                summary.append((module, i, "installed", 0.0))
+            elif cache_path_of(module) and restore_from_cache(
+                module, cache_path_of(module)
+            ):
+                summary.append((module, i, "cached", 0.0))
+            else:
+                to_build.append(module)
+        if not to_build:
+            continue
+        jobs = max(1, cpus // len(to_build))
+
+        def build(module):
+            module_start_time = time.time()
+            log(module, f"Building with make -j{jobs}.")
+            ok = build_module(module, keys[module], jobs)
+            if ok and cache_dir:
+                save_to_cache(module, keys[module], cache_dir)
+            return module, ok, time.time() - module_start_time
+
+        with ThreadPoolExecutor(max_workers=len(to_build)) as executor:
+            results = list(executor.map(build, to_build))
+        for module, ok, seconds in results:
+            summary.append((module, i, "built" if ok else "failed", seconds))
+        failed = [module for module, ok, _ in results if not ok]
+        if failed:
+            print(f"Error: Failed to build {', '.join(failed)}, build stopped.")
+            sys.exit(1)
+
+    # RELEASE.local defining all installed modules for IOC.
+    write_release_local(modules, {module: {module} for module in modules})
+    print()
+    for module, level, state, seconds in summary:
+        print(
+            f"{module:<16}level {level}  {state:<10}{f'{seconds:.1f}s' if seconds else ''}"
+        )
+    print(f"All modules installed in {time.time() - start_time:.1f}s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import os
+import struct
+import ctypes
+import ctypes.util
+import hashlib
+
+# inotify event masks, see inotify(7).
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_ATTRIB
+    | IN_CLOSE_WRITE
+    | IN_MOVED_FROM
+    | IN_MOVED_TO
+    | IN_CREATE
+    | IN_DELETE
+    | IN_DELETE_SELF
+    | IN_MOVE_SELF
+    | IN_ONLYDIR
+)
+EVENT_HEADER = struct.Struct("iIII")
+
+# file systems whose files may be changed by other hosts without inotify events on this host.
+NETWORK_FILESYSTEMS = ("nfs", "nfs4", "cifs", "smb3", "ceph", "glusterfs", "fuse.sshfs")
+
+
+def get_filesystem_type(path):
+    # type of the file system a path is on from /proc/self/mounts, "" if unknown.
+    path = os.path.realpath(path)
+    res = ""
+    mount_len = -1
+    try:
+        with open("/proc/self/mounts") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # octal escapes such as "\040" for spaces in mount points.
+                mount_point = fields[1].encode().decode("unicode_escape")
+                if (
+                    path == mount_point
+                    or path.startswith(mount_point.rstrip("/") + "/")
+                ) and len(mount_point) > mount_len:
+                    res = fields[2]
+                    mount_len = len(mount_point)
+    except OSError:
+        pass
+    return res
+
+
+class InotifyWatcher:
+    """
+    Watch directory trees by inotify through ctypes, new sub directories are watched as they are created.
+    Events are read without blocking by read_changes().
+
+    inotify only reports changes made through this host, files on a NFS mount written by other NFS clients
+    are not reported, see get_filesystem_type() and NETWORK_FILESYSTEMS.
+    """
+
+    def __init__(self, roots, exclude_dirs=()):
+        """
+        :param roots: top directories to watch recursively, directories not exist are watched once created.
+        :param exclude_dirs: names of sub directories not to watch.
+        :raise OSError: if inotify is not available.
+        """
+        self.roots = [os.path.normpath(item) for item in roots]
+        self.exclude_dirs = set(exclude_dirs)
+        self._libc = ctypes.CDLL(
+            ctypes.util.find_library("c") or "libc.so.6", use_errno=True
+        )
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f"inotify_init1 failed, {os.strerror(errno)}")
+        self._watches = {}
+        self._watched_roots = set()
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+        self._watches.clear()
+        self._watched_roots.clear()
+
+    def _add_watch(self, path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, f'inotify_add_watch "{path}" failed, {os.strerror(errno)}')
+        self._watches[wd] = path
+
+    def add_tree(self, path):
+        """
+        Watch a directory and all its sub directories, directories removed meanwhile are ignored.
+
+        :raise OSError: if a directory can not be watched, such as errno ENOSPC when the limit
+            "fs.inotify.max_user_watches" is reached.
+        """
+        for dir_path, dir_names, _ in os.walk(path):
+            dir_names[:] = [item for item in dir_names if item not in self.exclude_dirs]
+            try:
+                self._add_watch(dir_path)
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+
+    def _watch_roots(self):
+        # watch roots created since last call, return whether any root was newly watched.
+        added = False
+        for root in self.roots:
+            if root not in self._watched_roots and os.path.isdir(root):
+                self.add_tree(root)
+                self._watched_roots.add(root)
+                added = True
+        return added
+
+    def read_changes(self):
+        """
+        Read pending events.
+
+        :return: set of paths changed, None if all paths should be regarded as changed, as events were lost
+            or a root was newly watched.
+        """
+        res = set()
+        overflow = self._watch_roots()
+        while True:
+            try:
+                data = os.read(self._fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, name_len = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset : offset + name_len].rstrip(b"\0")
+                offset += name_len
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                dir_path = self._watches.get(wd)
+                if dir_path is None:
+                    continue
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    if dir_path in self._watched_roots:
+                        self._watched_roots.discard(dir_path)
+                        overflow = True
+                    continue
+                path = os.path.join(dir_path, os.fsdecode(name)) if name else dir_path
+                res.add(path)
+                if (
+                    mask & IN_ISDIR
+                    and mask & (IN_CREATE | IN_MOVED_TO)
+                    and os.path.basename(path) not in self.exclude_dirs
+                ):
+                    self.add_tree(path)
+                    # files may be created in new directory before it is watched.
+                    for dir_path_new, _, file_names in os.walk(path):
+                        res.update(os.path.join(dir_path_new, item) for item in file_names)
+        return None if overflow else res
+
+
+def tree_signature(paths):
+    """
+    Signature of files and directory trees from their path, size and modification time, without reading
+    content. Paths not exist are part of the signature too.
+
+    :return: hex digest string.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, dir_names, file_names in os.walk(path):
+                dir_names.sort()
+                for item in sorted(file_names):
+                    file_path = os.path.join(dir_path, item)
+                    try:
+                        stat = os.stat(file_path)
+                    except OSError:
+                        continue
+                    digest.update(
+                        f"{file_path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode()
+                    )
+        else:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                digest.update(f"{path}:-\n".encode())
+            else:
+                digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
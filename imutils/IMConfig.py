@@ -78,6 +78,12 @@ SWARM_BACKUP_DIR = "swarm-backup"  # backup directory for swarm
 IOC_CONFIG_FILE = "ioc.ini"
 IOC_STATE_INFO_FILE = ".info.ini"
 IOC_SERVICE_FILE = "compose-swarm.yaml"
+IOC_STACK_DIR = "ioc-stack"  # directory at swarm dir for aggregated stack files of all IOC services
+IOC_STACK_FILE = "compose-swarm-iocs.yaml"
+IOC_PLAN_FILE = "compose-swarm-plan.yaml"  # stack file of IOC services to be changed by "swarm --apply"
+IOC_PAUSE_RECORD_FILE = ".paused-iocs.json"  # replicas of IOC services paused by "swarm --pause-iocs"
+IOC_COLD_START_RECORD_FILE = ".cold-start-iocs.json"  # replicas of IOC services stopped by "swarm --prepare-cold-start"
+IOC_PLACEMENT_FILE = "placement-plan.json"  # node assignment of IOC services made by "swarm --plan-placement"
 
 STATE_NORMAL = "normal"  # IOC state string
 STATE_WARNING = "warning"
@@ -125,6 +131,9 @@ ANSIBLE_CREATE_PASSWORD = ""
 #######################################################################################################################
 
 SOCKET_PATH = "/tmp/IocDock.sock"
+STATE_SNAPSHOT_PATH = "/tmp/IocDock.state"  # state published by IocDockServer, read by CLI without socket request
+STATE_SNAPSHOT_MAX_AGE = 30  # seconds for published state to be valid, server republishes it well within
+METRICS_PORT = 0  # port of http /metrics of IocDockServer for prometheus, 0 to disable
 
 NODE_IP_FILE = "/opt/IocDockHome/.NodeInfo"  # file to store node ip in cluster for services init
 
@@ -168,6 +177,11 @@ REGISTRY_LOGIN_USERNAME = ""
 REGISTRY_LOGIN_PASSWORD = ""
 
 REGISTRY_NFS_MOUNT_SRC = "192.168.1.50:/home/zhu/NFS/registry-data"
+REGISTRY_CACHE_FILE_PATH = os.path.join(TOOLS_PATH, "registry-cache", "RegistryCache.json")
+REGISTRY_CACHE_TTL = 300  # seconds for cached registry responses to be valid
+
+## prometheus ##
+PROMETHEUS_URL = "http://127.0.0.1:9090"  # http api of prometheus used by resources recommender
 
 ## alertManager ##
 ALERT_MANAGER_SHELL_VAR_FILE = "AlertManagerVar"
@@ -199,6 +213,8 @@ ALLOWED_VARS = [
     "DEFAULT_MODULES",
     "RESOURCE_IOC_CPU_LIMIT",
     "RESOURCE_IOC_MEMORY_LIMIT",
+    "PROMETHEUS_URL",
+    "METRICS_PORT",
     "CLUSTER_MANAGER_NODES",
     "CLUSTER_WORKER_NODES",
     "DEFAULT_NODES",
@@ -208,6 +224,7 @@ ALLOWED_VARS = [
     "ANSIBLE_CREATE_PASSWORD",
     "REGISTRY_LOGIN_USERNAME",
     "REGISTRY_LOGIN_PASSWORD",
+    "REGISTRY_CACHE_TTL",
     "ALERT_MANAGER_MASTER_IP",
     "ALERT_MANAGER_SMTP_SMART_HOST",
     "ALERT_MANAGER_SMTP_AUTH_USERNAME",
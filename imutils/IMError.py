@@ -14,3 +14,15 @@ class IMIOCError(Exception):
     def __init__(self, message):
         self.message = message
         super().__init__(self.message)
+
+
+class IMRegistryError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class IMBuildError(Exception):
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
@@ -181,6 +181,33 @@ def format_normalize(raw_str: str):
     return raw_str
 
 
+def cpus_to_nano(cpus):
+    # return NanoCPUs used by docker API of a compose "cpus" value, for example "0.5" will get 500000000.
+    if cpus is None or str(cpus).strip() == "":
+        return 0
+    try:
+        return int(round(float(cpus) * 1e9))
+    except ValueError:
+        return 0
+
+
+def memory_to_bytes(memory):
+    # return bytes used by docker API of a compose memory value in binary units, for example "1G" will get 1073741824.
+    if memory is None or str(memory).strip() == "":
+        return 0
+    memory_str = str(memory).strip().lower().replace(" ", "")
+    memory_str = memory_str.removesuffix("b").removesuffix("i")
+    units = {"k": 1 << 10, "m": 1 << 20, "g": 1 << 30, "t": 1 << 40, "p": 1 << 50}
+    multiplier = 1
+    if memory_str and memory_str[-1] in units:
+        multiplier = units[memory_str[-1]]
+        memory_str = memory_str[:-1]
+    try:
+        return int(float(memory_str) * multiplier)
+    except ValueError:
+        return 0
+
+
 def get_yaml_tool():
     from ruamel.yaml import YAML
     yaml = YAML()
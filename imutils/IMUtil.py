@@ -2,17 +2,42 @@ import os
 from collections.abc import Iterable
 
 import imutils.IMConfig as IMConfig
-from imutils.IMError import IMValueError
+from imutils.IMError import IMValueError, IMRegistryError
 from imutils.IocClass import (
     IOC,
     gen_swarm_files,
+    gen_ioc_stack_files,
     get_all_ioc,
     repository_backup,
     restore_backup,
 )
 from imutils.SwarmClass import SwarmManager, SwarmService
+from imutils.ImageBuilder import build_images, get_service_image_jobs, get_ioc_image_jobs
+from imutils.ImagePrepull import prepull_images
+from imutils.ImageValidator import (
+    validate_ioc_images,
+    get_repository_ioc_images,
+    get_swarm_ioc_images,
+)
+from imutils.PlacementPlanner import plan_placement, show_capacity
+from imutils.RegistryClient import RegistryClient
+from imutils.RegistryAnalyzer import analyze_registry
+from imutils.ResourceRecommender import recommend_ioc_resources
+from imutils.SwarmOrchestrator import drain_node, prepare_cold_start, cold_start_iocs
+from imutils.SwarmPlan import (
+    get_ioc_service_plan,
+    show_ioc_service_plan,
+    apply_ioc_service_plan,
+    update_ioc_services_in_place,
+)
 from imutils.IMFunc import try_makedirs, condition_parse
-from imutils.SocketClient import socket_client, client_check_connection
+from imutils.SocketClient import (
+    socket_client,
+    client_check_connection,
+    socket_query,
+    socket_subscribe,
+    read_info,
+)
 from imutils.AnsibleUtil import (
     gen_inventory_files,
     create_remote_user,
@@ -267,14 +292,19 @@ def get_filtered_ioc(
             index_reserved.append(i)
 
     if show_panel:
-        if not client_check_connection(verbose=verbose):
+        # only fields shown of IOC projects filtered are requested, from state snapshot if published.
+        names = [ioc_list[i].name for i in index_reserved]
+        socket_result_ioc = read_info(
+            "ioc info",
+            names=names,
+            fields=["snapshot_consistency", "deploy_consistency"],
+            verbose=verbose,
+        ).get("data", {})
+        socket_result_service = read_info(
+            "service info", names=names, fields=["status"], verbose=verbose
+        ).get("data", {})
+        if not socket_result_ioc and names and not client_check_connection(verbose=verbose):
             print(f"Failed to connect to IocDockServer.")
-        socket_result_ioc = socket_client(
-            "ioc info", receive_type="json", verbose=verbose
-        )
-        socket_result_service = socket_client(
-            "service info", receive_type="json", verbose=verbose
-        )
 
     # print results.
     ioc_print = []
@@ -348,10 +378,104 @@ def get_filtered_ioc(
             print(" ".join(ioc_print))
 
 
+def watch_panel(names=None, show_services=False, verbose=False):
+    """
+    Show a live panel of IOC projects or services, updated by changes pushed from IocDockServer.
+
+    :param names: names or glob patterns of IOC projects or services, all if not given.
+    :param show_services: show services instead of IOC projects.
+    :param verbose:
+    :return:
+    """
+    import sys
+    from datetime import datetime
+    from tabulate import tabulate
+
+    if not client_check_connection(verbose=verbose):
+        print(f"watch_panel: Failed to connect to IocDockServer.")
+        return
+    kinds = ["service"] if show_services else ["ioc", "service"]
+    data = {kind: {} for kind in kinds}
+    generation = 0
+    try:
+        for message in socket_subscribe(kinds, names=names if names else None, verbose=verbose):
+            if "error" in message:
+                print(f'watch_panel: Failed. {message["error"]}.')
+                return
+            if "heartbeat" in message:
+                continue
+            if "snapshot" in message:
+                data.update(message["snapshot"])
+            for delta in message.get("deltas", []):
+                entries = data.setdefault(delta["kind"], {})
+                if delta.get("removed"):
+                    entries.pop(delta["name"], None)
+                else:
+                    entry = entries.setdefault(delta["name"], {})
+                    for field in delta.get("removed_fields", []):
+                        entry.pop(field, None)
+                    entry.update(delta["changed"])
+            generation = message.get("generation", generation)
+
+            if show_services:
+                raw_print = [["Name", "Replicas", "Status", "UpdateAt"]]
+                for name, item in sorted(data["service"].items()):
+                    raw_print.append(
+                        [
+                            name,
+                            str(item.get("replicas", "")).strip(),
+                            item.get("status", ""),
+                            item.get("update_at", ""),
+                        ]
+                    )
+            else:
+                raw_print = [
+                    [
+                        "IOC",
+                        "Host",
+                        "State",
+                        "Status",
+                        "DeployStatus",
+                        "SnapshotConsistency",
+                        "DeployConsistency",
+                        "UpdateAt",
+                    ]
+                ]
+                for name, item in sorted(data["ioc"].items()):
+                    raw_print.append(
+                        [
+                            name,
+                            item.get("host", ""),
+                            item.get("state", ""),
+                            item.get("status", ""),
+                            data["service"].get(name, {}).get("status", ""),
+                            item.get("snapshot_consistency", ""),
+                            item.get("deploy_consistency", ""),
+                            item.get("update_at", ""),
+                        ]
+                    )
+            # clear screen and redraw.
+            sys.stdout.write("\033[H\033[2J")
+            print(
+                f'IocDock watch ({datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, '
+                f"generation {generation}), press Ctrl+C to exit."
+            )
+            print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+            sys.stdout.flush()
+        print(f"watch_panel: Connection to IocDockServer closed.")
+    except KeyboardInterrupt:
+        print()
+
+
 def execute_ioc(args):
     # operation outside IOC projects.
     if args.gen_swarm_file:
-        gen_swarm_files(iocs=args.name, verbose=args.verbose)
+        gen_swarm_files(
+            iocs=args.name,
+            verbose=args.verbose,
+            stack_file=args.stack_file,
+            shards=args.shards,
+        )
     elif args.gen_backup_file:
         repository_backup(
             backup_mode=args.backup_mode,
@@ -369,6 +493,15 @@ def execute_ioc(args):
         if not args.name:
             print(f"execute_ioc: No IOC project specified.")
         else:
+            if args.deploy and not args.skip_image_check:
+                if not validate_ioc_images(
+                    get_repository_ioc_images(args.name), verbose=args.verbose
+                ):
+                    print(
+                        f"execute_ioc: Failed. Nothing deployed as images above not found in registry, "
+                        f'push them or set "--skip-image-check" to deploy anyway.'
+                    )
+                    return
             for name in args.name:
                 dir_path = os.path.join(IMConfig.REPOSITORY_PATH, name)
                 if os.path.isdir(dir_path):
@@ -411,6 +544,20 @@ def execute_ioc(args):
                         break  # break to avoid repeat print of no exec operation.
                 else:
                     print(f'execute_ioc: Failed. IOC "{name}" not found.')
+            # aggregate stack files once after all specified IOC projects deployed.
+            if args.deploy and args.stack_file:
+                gen_ioc_stack_files(shards=args.shards, verbose=args.verbose)
+            # let IocDockServer recompute IOC projects changed right away.
+            if (
+                isinstance(args.add_src_file, str)
+                or args.generate_and_export
+                or args.gen_startup_file
+                or args.export_for_mount
+                or args.add_snapshot_file
+                or args.restore_snapshot_file
+                or args.deploy
+            ) and client_check_connection():
+                socket_query("ioc info", names=[], refresh=args.name, verbose=False)
 
 
 def execute_swarm(args):
@@ -421,13 +568,35 @@ def execute_swarm(args):
     elif args.deploy_global_services:
         SwarmManager(verbose=args.verbose).deploy_global_services()
     elif args.deploy_all_iocs:
-        SwarmManager(verbose=args.verbose).deploy_all_iocs()
+        if not args.skip_image_check and not validate_ioc_images(
+            get_swarm_ioc_images(verbose=args.verbose), verbose=args.verbose
+        ):
+            print(
+                f"execute_swarm: Failed. Nothing deployed as images above not found in registry, "
+                f'push them or set "--skip-image-check" to deploy anyway.'
+            )
+            return
+        SwarmManager(verbose=args.verbose).deploy_all_iocs(
+            stack_file=args.stack_file, shards=args.shards
+        )
     elif args.remove_global_services:
         SwarmManager(verbose=args.verbose).remove_global_services()
     elif args.remove_all_iocs:
-        SwarmManager(verbose=args.verbose).remove_all_iocs()
+        SwarmManager(verbose=args.verbose).remove_all_iocs(
+            max_workers=args.max_workers
+        )
     elif args.remove_all_services:
-        SwarmManager(verbose=args.verbose).remove_all_services()
+        SwarmManager(verbose=args.verbose).remove_all_services(
+            max_workers=args.max_workers
+        )
+    elif args.pause_iocs is not None:
+        SwarmManager(verbose=args.verbose).pause_iocs(
+            iocs=args.pause_iocs, max_workers=args.max_workers
+        )
+    elif args.resume_iocs is not None:
+        SwarmManager(verbose=args.verbose).resume_iocs(
+            iocs=args.resume_iocs, max_workers=args.max_workers
+        )
     elif args.show_digest:
         SwarmManager(verbose=args.verbose).show_digest(args.service_type)
     elif args.show_services:
@@ -447,6 +616,46 @@ def execute_swarm(args):
         SwarmManager.restore_swarm(args.backup_file)
     elif args.update_deployed_services:
         SwarmManager(verbose=args.verbose).update_deployed_services()
+    elif args.plan:
+        show_ioc_service_plan(
+            get_ioc_service_plan(verbose=args.verbose), verbose=args.verbose
+        )
+    elif args.apply:
+        apply_ioc_service_plan(verbose=args.verbose)
+    elif args.drain_node:
+        drain_node(
+            args.drain_node,
+            batch_size=args.batch_size,
+            timeout=args.timeout,
+            verbose=args.verbose,
+        )
+    elif args.prepare_cold_start:
+        prepare_cold_start(max_workers=args.max_workers)
+    elif args.cold_start:
+        cold_start_iocs(
+            max_workers=args.max_workers, timeout=args.timeout, verbose=args.verbose
+        )
+    elif args.plan_placement:
+        plan_placement(verbose=args.verbose)
+    elif args.capacity:
+        show_capacity(verbose=args.verbose)
+    elif args.recommend_resources:
+        recommend_ioc_resources(
+            window=args.window,
+            prometheus_url=args.prometheus_url,
+            write=args.write,
+            verbose=args.verbose,
+        )
+    elif args.prepull_images:
+        prepull_images(
+            all_nodes=args.all_nodes,
+            max_workers=args.max_workers,
+            verbose=args.verbose,
+        )
+    elif args.update_in_place:
+        update_ioc_services_in_place(
+            max_workers=args.max_workers, verbose=args.verbose
+        )
 
 
 def execute_service(args):
@@ -455,6 +664,24 @@ def execute_service(args):
         print(f"execute_service: No IOC project specified.")
     else:
         services_dict = SwarmManager().services
+        if args.update and args.in_place:
+            # update all specified IOC services in place concurrently.
+            iocs = []
+            for name in args.name:
+                if (
+                    name in services_dict.keys()
+                    and services_dict[name].service_type == "ioc"
+                ):
+                    iocs.append(name)
+                else:
+                    print(
+                        f'execute_service: Skipped "{name}", only IOC services can be updated in place.'
+                    )
+            if iocs:
+                update_ioc_services_in_place(
+                    iocs=iocs, max_workers=args.max_workers, verbose=args.verbose
+                )
+            return
         for name in args.name:
             # set service_type automatically
             if not args.type:
@@ -542,73 +769,84 @@ def execute_cluster(args):
     elif args.set_up_root_cert:
         set_up_root_cert()
     elif args.prepare_service_images:
-        dir_path = os.path.join(IMConfig.SERVICES_PATH, "registry", "scripts")
-        os.system(f"cd {dir_path}; ./prepare-images.sh")
-        dir_path = os.path.join(IMConfig.TOOLS_PATH, "alertAnalytics")
-        os.system(f"cd {dir_path}; ./build-and-push.sh --print-log --push-image")
-        dir_path = os.path.join(IMConfig.TOOLS_PATH, "dbwr")
-        os.system(f"cd {dir_path}; ./build-and-push.sh --print-log --push-image")
-
+        failed = build_images(
+            get_service_image_jobs(),
+            max_workers=args.max_workers,
+            force=args.force_build,
+            no_push=args.no_push,
+            verbose=args.verbose,
+        )
+        if failed:
+            exit(1)
     elif args.prepare_ioc_images:
-        dir_path = os.path.join(IMConfig.TOOLS_PATH, "image-factory")
-        os.system(f"cd {dir_path}; ./build-and-release-default-images.sh --print-log -y")
+        failed = build_images(
+            get_ioc_image_jobs(),
+            max_workers=args.max_workers,
+            force=args.force_build,
+            no_push=args.no_push,
+            verbose=args.verbose,
+        )
+        if failed:
+            exit(1)
+
 
 def execute_registry(args):
-    import json
-    import urllib.request
-    import ssl
-
-    registry_url = f"https://{IMConfig.REGISTRY_COMMON_NAME}:{IMConfig.REGISTRY_PORT}"
-    username = IMConfig.REGISTRY_LOGIN_USERNAME
-    password = IMConfig.REGISTRY_LOGIN_PASSWORD
-
-    ssl_context = ssl.create_default_context()
-    ssl_context.check_hostname = False
-    ssl_context.verify_mode = ssl.CERT_NONE
-
-    def registry_request(path):
-        url = f"{registry_url}/v2/{path}"
-        req = urllib.request.Request(url)
-        if username and password:
-            import base64
-            credentials = base64.b64encode(f"{username}:{password}".encode()).decode()
-            req.add_header("Authorization", f"Basic {credentials}")
-        if args.verbose:
-            print(f"execute_registry: Request {url}")
-        try:
-            with urllib.request.urlopen(req, context=ssl_context) as response:
-                return json.loads(response.read().decode())
-        except urllib.error.HTTPError as e:
-            print(f"execute_registry: Failed. HTTP {e.code} {e.reason}.")
-            return None
-        except urllib.error.URLError as e:
-            print(f"execute_registry: Failed. {e.reason}.")
-            return None
-
-    if args.list is None:
-        print("execute_registry: No operation specified.")
-    elif not args.list:
-        data = registry_request("_catalog")
-        if data is None:
-            return
-        repositories = data.get("repositories", [])
-        if not repositories:
-            print("execute_registry: No images found in registry.")
-            return
-        print(f"Images in registry ({len(repositories)}):")
-        for repo in sorted(repositories):
-            print(f"  {repo}")
-    else:
-        data = registry_request(f"{args.list}/tags/list")
-        if data is None:
-            return
-        tags = data.get("tags", [])
-        if not tags:
-            print(f'execute_registry: No tags found for image "{args.list}".')
-            return
-        print(f'Tags for "{args.list}" ({len(tags)}):')
-        for tag in sorted(tags):
-            print(f"  {tag}")
+    import time
+
+    if args.analyze:
+        analyze_registry(
+            max_workers=args.max_workers,
+            use_cache=not args.refresh,
+            verbose=args.verbose,
+        )
+        return
+
+    registry_client = RegistryClient(
+        max_workers=args.max_workers, use_cache=not args.refresh, verbose=args.verbose
+    )
+    start_time = time.time()
+    try:
+        if args.list_all:
+            tags_dict, errors = registry_client.list_all_tags()
+            if not tags_dict and not errors:
+                print("execute_registry: No images found in registry.")
+                return
+            for repo in sorted(tags_dict.keys()):
+                for tag in sorted(tags_dict[repo]):
+                    print(f"{repo}:{tag}")
+            for repo in sorted(errors.keys()):
+                print(f'execute_registry: Failed to list tags for image "{repo}". {errors[repo]}')
+            if args.verbose:
+                print(
+                    f"execute_registry: {sum(len(item) for item in tags_dict.values())} tags of "
+                    f"{len(tags_dict)} images listed in {time.time() - start_time:.2f}s, "
+                    f"{registry_client.request_count} requests over "
+                    f"{registry_client.connection_count} connections."
+                )
+        elif args.list is None:
+            print("execute_registry: No operation specified.")
+        elif not args.list:
+            repositories = registry_client.list_repositories()
+            registry_client.save_cache()
+            if not repositories:
+                print("execute_registry: No images found in registry.")
+                return
+            print(f"Images in registry ({len(repositories)}):")
+            for repo in sorted(repositories):
+                print(f"  {repo}")
+        else:
+            tags = registry_client.list_tags(args.list)
+            registry_client.save_cache()
+            if not tags:
+                print(f'execute_registry: No tags found for image "{args.list}".')
+                return
+            print(f'Tags for "{args.list}" ({len(tags)}):')
+            for tag in sorted(tags):
+                print(f"  {tag}")
+    except IMRegistryError as e:
+        print(f"execute_registry: Failed. {e.message}")
+    finally:
+        registry_client.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,405 @@
+import os
+import re
+import time
+import hashlib
+import tarfile
+import threading
+import subprocess
+
+import imutils.IMConfig as IMConfig
+from imutils.IMError import IMBuildError, IMRegistryError
+
+# label of images recording hash of their build context, used to skip builds whose context is unchanged.
+CONTEXT_HASH_LABEL = "iocdock.context-hash"
+# files in build context not taken into context hash.
+CONTEXT_HASH_EXCLUDES = ("__pycache__", ".git")
+CONTEXT_HASH_EXCLUDE_PREFIXES = ("BuildLog.",)
+
+EPICS_BASE_DOWNLOAD_URL = "https://epics.anl.gov/download/base"
+
+print_lock = threading.Lock()
+
+
+def log(prefix, message):
+    # print lines of message with prefix, lines of concurrent jobs are not mixed.
+    with print_lock:
+        for line in str(message).rstrip("\n").splitlines():
+            print(f"[{prefix}] {line}")
+
+
+def read_shell_variable(file_path, name):
+    # read default value of a variable assigned in a shell script, such as 'release_version=0.1.1'.
+    with open(file_path, "r") as f:
+        match = re.search(rf'^{name}=("?)([^"\s#]*)\1', f.read(), flags=re.M)
+    return match.group(2) if match else ""
+
+
+def read_shell_array(file_path, name):
+    # read elements of an array assigned in a shell script, such as 'versions=("a;b" "c;d")'.
+    with open(file_path, "r") as f:
+        match = re.search(rf"^{name}=\(([^)]*)\)", f.read(), flags=re.M)
+    return re.findall(r'"([^"]*)"', match.group(1)) if match else []
+
+
+def get_service_image_jobs():
+    """
+    Get jobs for service images: images mirrored from public registries as listed in "prepare-images.sh"
+    of registry service, and images of alertAnalytics and dbwr built from their Dockerfile.
+    """
+    res = []
+    script_path = os.path.join(
+        IMConfig.SERVICES_PATH, "registry", "scripts", "prepare-images.sh"
+    )
+    with open(script_path, "r") as f:
+        for image, source in re.findall(
+            r'^image_dict\["([^"]+)"\]="([^"]+)"', f.read(), flags=re.M
+        ):
+            name, tag = image.rsplit(":", maxsplit=1)
+            res.append(
+                {"name": name, "tag": tag, "kind": "mirror", "source": source, "depends": []}
+            )
+    for tool_dir in ("alertAnalytics", "dbwr"):
+        context = os.path.join(IMConfig.TOOLS_PATH, tool_dir)
+        script_path = os.path.join(context, "build-and-push.sh")
+        res.append(
+            {
+                "name": read_shell_variable(script_path, "image_name"),
+                "tag": read_shell_variable(script_path, "release_version"),
+                "kind": "build",
+                "context": context,
+                "dockerfile": os.path.join(context, "Dockerfile"),
+                "buildargs": {},
+                "depends": [],
+            }
+        )
+    return res
+
+
+def get_ioc_image_jobs():
+    """
+    Get jobs for EPICS base images and ioc-exec images of versions defined in
+    "build-and-release-default-images.sh" of image factory, ioc-exec images depend on their base image.
+    """
+    factory_path = os.path.join(IMConfig.TOOLS_PATH, "image-factory")
+    script_path = os.path.join(factory_path, "build-and-release-default-images.sh")
+    res = []
+    base_context = os.path.join(factory_path, "base")
+    for item in read_shell_array(script_path, "versions_to_build_for_base"):
+        base_version, release_version = item.split(";")[:2]
+        res.append(
+            {
+                "name": "base",
+                "tag": release_version,
+                "kind": "build",
+                "context": base_context,
+                "dockerfile": os.path.join(base_context, "Dockerfile"),
+                "buildargs": {"BASE": f"base-{base_version}"},
+                "depends": [],
+                "prepare": prepare_base_tarball,
+            }
+        )
+    ioc_exec_context = os.path.join(factory_path, "ioc-exec")
+    for item in read_shell_array(script_path, "versions_to_build_for_ioc_exec"):
+        fields = item.split(";")
+        base_release_version, release_version = fields[1], fields[2]
+        modules = fields[3] if len(fields) > 3 else ""
+        res.append(
+            {
+                "name": "ioc-exec",
+                "tag": release_version,
+                "kind": "build",
+                "context": ioc_exec_context,
+                "dockerfile": os.path.join(ioc_exec_context, "Dockerfile"),
+                "buildargs": {
+                    "BASE_RELEASE_VERSION": base_release_version,
+                    "INSTALL_MODULES": modules,
+                },
+                "depends": [f"base:{base_release_version}"],
+            }
+        )
+    return res
+
+
+def prepare_base_tarball(job):
+    # download EPICS base tarball into build context if not exists, and verify it.
+    file_name = f'{job["buildargs"]["BASE"]}.tar.gz'
+    file_path = os.path.join(job["context"], file_name)
+    if not os.path.isfile(file_path):
+        import urllib.request
+
+        url = f"{EPICS_BASE_DOWNLOAD_URL}/{file_name}"
+        log(f'{job["name"]}:{job["tag"]}', f'Downloading "{url}".')
+        urllib.request.urlretrieve(url, f"{file_path}.part")
+        os.replace(f"{file_path}.part", file_path)
+    if not tarfile.is_tarfile(file_path):
+        os.remove(file_path)
+        raise IMBuildError(f'Verification failed for "{file_name}", file removed.')
+
+
+def get_context_hash(job, dependency_hashes=()):
+    """
+    Hash of everything a build depends on: files of build context, Dockerfile, build args and
+    context hashes of images it is built from.
+    """
+    digest = hashlib.sha256()
+    for root, dirs, files in os.walk(job["context"]):
+        dirs[:] = sorted(item for item in dirs if item not in CONTEXT_HASH_EXCLUDES)
+        for file_name in sorted(files):
+            if file_name.startswith(CONTEXT_HASH_EXCLUDE_PREFIXES):
+                continue
+            file_path = os.path.join(root, file_name)
+            digest.update(os.path.relpath(file_path, job["context"]).encode())
+            digest.update(b"\0")
+            with open(file_path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    digest.update(chunk)
+            digest.update(b"\0")
+    with open(job["dockerfile"], "rb") as f:
+        digest.update(f.read())
+    for key, value in sorted(job["buildargs"].items()):
+        digest.update(f"{key}={value}\0".encode())
+    for item in dependency_hashes:
+        digest.update(item.encode())
+    return digest.hexdigest()
+
+
+def needs_buildkit(dockerfile):
+    # heredoc and "--mount" in Dockerfile are only supported by BuildKit, which docker SDK can not drive.
+    with open(dockerfile, "r") as f:
+        content = f.read()
+    return bool(
+        re.search(r"^\s*(RUN|COPY)\s.*<<", content, flags=re.M)
+        or re.search(r"^\s*RUN\s+--mount", content, flags=re.M)
+        or re.search(r"^#\s*syntax=", content, flags=re.M)
+    )
+
+
+def build_image(docker_client, job, context_hash):
+    prefix = f'{job["name"]}:{job["tag"]}'
+    labels = {CONTEXT_HASH_LABEL: context_hash}
+    if needs_buildkit(job["dockerfile"]):
+        # build by docker CLI with BuildKit.
+        command = ["docker", "build", "--progress=plain", "-t", prefix, "-f", job["dockerfile"]]
+        for key, value in job["buildargs"].items():
+            command.extend(["--build-arg", f"{key}={value}"])
+        for key, value in labels.items():
+            command.extend(["--label", f"{key}={value}"])
+        command.append(job["context"])
+        process = subprocess.Popen(
+            command,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            env=dict(os.environ, DOCKER_BUILDKIT="1"),
+        )
+        for line in process.stdout:
+            log(prefix, line)
+        if process.wait() != 0:
+            raise IMBuildError(f"docker build exited with code {process.returncode}.")
+    else:
+        for chunk in docker_client.api.build(
+            path=job["context"],
+            dockerfile=os.path.relpath(job["dockerfile"], job["context"]),
+            tag=prefix,
+            buildargs=job["buildargs"],
+            labels=labels,
+            rm=True,
+            decode=True,
+        ):
+            if "stream" in chunk:
+                log(prefix, chunk["stream"])
+            if "error" in chunk:
+                raise IMBuildError(chunk["error"].strip())
+
+
+def push_image(docker_client, job, verbose=False):
+    # tag local image with registry prefix and push it.
+    prefix = f'{job["name"]}:{job["tag"]}'
+    repository = f'{IMConfig.REGISTRY_COMMON_NAME}/{job["name"]}'
+    docker_client.api.tag(prefix, repository, job["tag"])
+    for chunk in docker_client.api.push(
+        repository, tag=job["tag"], stream=True, decode=True
+    ):
+        if "error" in chunk:
+            raise IMBuildError(chunk["error"].strip())
+        if chunk.get("progressDetail") and not verbose:
+            continue
+        if "status" in chunk:
+            log(prefix, " ".join(str(chunk[key]) for key in ("id", "status") if chunk.get(key)))
+
+
+def ensure_local_image(docker_client, job, context_hash):
+    # pull pushed image from registry with local name if local image is missing or built from another
+    # context, so that dependent builds use the image of given context hash.
+    prefix = f'{job["name"]}:{job["tag"]}'
+    try:
+        local_hash = docker_client.images.get(prefix).labels.get(CONTEXT_HASH_LABEL)
+    except Exception:
+        local_hash = None
+    if local_hash == context_hash:
+        return
+    repository = f'{IMConfig.REGISTRY_COMMON_NAME}/{job["name"]}'
+    log(prefix, f"Pulling from {repository}:{job['tag']} for dependent builds.")
+    docker_client.images.pull(repository, tag=job["tag"])
+    docker_client.api.tag(f"{repository}:{job['tag']}", job["name"], job["tag"])
+
+
+def get_pushed_context_hash(registry_client, job):
+    # context hash label of the pushed tag, None if not pushed or registry not reachable.
+    try:
+        labels = registry_client.get_image_labels(job["name"], job["tag"])
+    except IMRegistryError:
+        return None
+    return labels.get(CONTEXT_HASH_LABEL) if labels is not None else None
+
+
+def run_job(docker_client, registry_client, job, dependency_hashes, options):
+    """
+    Build (or mirror) and push the image of a job, skipping the build if context hash is unchanged.
+
+    :return: dict of {"state", "hash", "build", "push", "message"}.
+    """
+    prefix = f'{job["name"]}:{job["tag"]}'
+    res = {"state": "", "hash": "", "build": 0.0, "push": 0.0, "message": ""}
+
+    if job["kind"] == "mirror":
+        if not options["force"] and not options["no_push"]:
+            try:
+                pushed = registry_client.head_manifest(job["name"], job["tag"])
+            except IMRegistryError:
+                pushed = None
+            if pushed:
+                res["state"] = "up to date"
+                return res
+        start_time = time.time()
+        log(prefix, f'Pulling "{job["source"]}".')
+        docker_client.images.pull(job["source"])
+        docker_client.api.tag(job["source"], job["name"], job["tag"])
+        res["build"] = time.time() - start_time
+        res["state"] = "mirrored"
+    else:
+        if job.get("prepare"):
+            job["prepare"](job)
+        res["hash"] = get_context_hash(job, dependency_hashes)
+        if not options["force"] and not options["no_push"]:
+            if get_pushed_context_hash(registry_client, job) == res["hash"]:
+                res["state"] = "up to date"
+                if job.get("needed_locally"):
+                    ensure_local_image(docker_client, job, res["hash"])
+                return res
+        local_hash = None
+        try:
+            local_hash = docker_client.images.get(prefix).labels.get(CONTEXT_HASH_LABEL)
+        except Exception:
+            pass
+        if not options["force"] and local_hash == res["hash"]:
+            log(prefix, f"Context unchanged since last build, skip building.")
+            res["state"] = "built before"
+        else:
+            log(prefix, f'Building with context "{job["context"]}".')
+            start_time = time.time()
+            build_image(docker_client, job, res["hash"])
+            res["build"] = time.time() - start_time
+            res["state"] = "built"
+
+    if not options["no_push"]:
+        start_time = time.time()
+        push_image(docker_client, job, verbose=options["verbose"])
+        res["push"] = time.time() - start_time
+        res["state"] += ", pushed"
+    return res
+
+
+def build_images(jobs, max_workers=3, force=False, no_push=False, verbose=False):
+    """
+    Build and push images concurrently with at most "max_workers" jobs at the same time, a job starts
+    after all the jobs it depends on succeeded. Logs of each job are printed with prefix "[image:tag]".
+
+    :param jobs: list of job dicts from "get_service_image_jobs" or "get_ioc_image_jobs".
+    :param max_workers: max number of concurrent jobs.
+    :param force: build and push even if context hash is unchanged.
+    :param no_push: build only.
+    :param verbose:
+    :return: list of "image:tag" of failed jobs, empty if all jobs succeeded.
+    """
+    import docker
+    from tabulate import tabulate
+    from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+    from imutils.RegistryClient import RegistryClient
+
+    docker_client = docker.from_env()
+    registry_client = RegistryClient(use_cache=False, verbose=False)
+    options = {"force": force, "no_push": no_push, "verbose": verbose}
+    jobs = {f'{job["name"]}:{job["tag"]}': job for job in jobs}
+    for job in jobs.values():
+        for item in job["depends"]:
+            if item in jobs:
+                jobs[item]["needed_locally"] = True
+    pending = dict(jobs)
+    results = {}
+    futures = {}
+
+    def run(job_id):
+        try:
+            return run_job(
+                docker_client,
+                registry_client,
+                jobs[job_id],
+                [results[item]["hash"] for item in jobs[job_id]["depends"] if item in results],
+                options,
+            )
+        except Exception as e:
+            message = e.message if isinstance(e, (IMBuildError, IMRegistryError)) else str(e)
+            log(job_id, f"Failed. {message}")
+            return {"state": "failed", "hash": "", "build": 0.0, "push": 0.0, "message": message}
+
+    start_time = time.time()
+    print(
+        f"build_images: {len(jobs)} images to prepare, at most {max(1, int(max_workers))} at the same time."
+    )
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        while pending or futures:
+            for job_id, job in list(pending.items()):
+                failed = [
+                    item
+                    for item in job["depends"]
+                    if results.get(item, {}).get("state") == "failed"
+                ]
+                if failed:
+                    results[job_id] = {
+                        "state": "failed",
+                        "hash": "",
+                        "build": 0.0,
+                        "push": 0.0,
+                        "message": f'dependency {" ".join(failed)} failed',
+                    }
+                    pending.pop(job_id)
+                elif all(item in results or item not in jobs for item in job["depends"]):
+                    futures[executor.submit(run, job_id)] = job_id
+                    pending.pop(job_id)
+            if not futures:
+                break
+            done, _ = wait(futures.keys(), return_when=FIRST_COMPLETED)
+            for future in done:
+                results[futures.pop(future)] = future.result()
+    registry_client.close()
+
+    raw_print = [["Image", "Result", "Build", "Push", "Message"]]
+    for job_id in jobs.keys():
+        item = results[job_id]
+        raw_print.append(
+            [
+                job_id,
+                item["state"],
+                f'{item["build"]:.1f}s' if item["build"] else "",
+                f'{item["push"]:.1f}s' if item["push"] else "",
+                item["message"],
+            ]
+        )
+    print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+    failed = [job_id for job_id, item in results.items() if item["state"] == "failed"]
+    print(
+        f"build_images: Finished in {time.time() - start_time:.1f}s, "
+        f"{len(jobs) - len(failed)} succeeded, {len(failed)} failed."
+    )
+    return failed
@@ -0,0 +1,288 @@
+import shlex
+import socket
+import subprocess
+import threading
+import time
+
+import imutils.IMConfig as IMConfig
+from imutils.IocClass import get_ioc_placement
+from imutils.SwarmOrchestrator import get_nodes_info
+from imutils.SwarmPlan import get_ioc_service_plan
+
+# script executed on each node for pulling an image, prints "<image ID before>|<image ID after>|<indexes>",
+# indexes are positions of the layers of the image that were not on the node before pulling.
+PULL_SCRIPT = (
+    'before=$(docker image inspect -f "{{{{.Id}}}}" {image} 2>/dev/null); '
+    "layers=$(docker image ls -aq | sort -u | "
+    "xargs -r docker image inspect -f '{{{{range .RootFS.Layers}}}}{{{{println .}}}}{{{{end}}}}' | sort -u); "
+    "docker pull -q {image} >/dev/null || exit 1; "
+    'after=$(docker image inspect -f "{{{{.Id}}}}" {image}); '
+    'new=""; i=0; '
+    "for layer in $(docker image inspect -f '{{{{range .RootFS.Layers}}}}{{{{println .}}}}{{{{end}}}}' {image}); do "
+    'echo "$layers" | grep -qxF "$layer" || new="$new $i"; i=$((i+1)); done; '
+    'echo "$before|$after|$new"'
+)
+
+
+def get_prepull_schedule(iocs=None, all_nodes=False, verbose=False):
+    """
+    Work out which images should be pulled to which nodes before deploying IOC services whose image changed.
+
+    The target node of an IOC service is the node assigned by placement planner, or the nodes its tasks
+    are running on, or all available worker nodes if neither is known (or "all_nodes" set).
+
+    :return: dict of {hostname: set of images}.
+    """
+    plan = get_ioc_service_plan(iocs=iocs, verbose=verbose)
+    to_pull = [
+        item
+        for item in plan
+        if item["action"] == "create"
+        or (item["action"] == "update" and "image" in item["changes"])
+    ]
+    if not to_pull:
+        return {}
+    nodes_info = get_nodes_info()
+    workers = [
+        hostname
+        for hostname, node in nodes_info.items()
+        if node.get("role") == "worker"
+        and node.get("availability") == "active"
+        and node.get("state") == "ready"
+    ]
+    service_nodes = {}
+    for hostname, node in nodes_info.items():
+        for service_name in node.get("tasks", {}).keys():
+            service_nodes.setdefault(service_name, []).append(hostname)
+    placement = get_ioc_placement()
+
+    schedule = {}
+    for item in to_pull:
+        if all_nodes:
+            targets = workers
+        elif placement.get(item["name"]) in workers:
+            targets = [placement[item["name"]]]
+        elif service_nodes.get(item["service_name"]):
+            targets = service_nodes[item["service_name"]]
+        else:
+            targets = workers
+        for hostname in targets:
+            schedule.setdefault(hostname, set()).add(item["definition"]["image"])
+    return schedule
+
+
+def get_inventory_hosts(hostnames):
+    """
+    Map swarm nodes to hosts of the cluster inventory by node address, as the hostname of a node may differ
+    from its name in inventory. A node is mapped by its hostname if its address matches no host.
+
+    :param hostnames: hostnames of swarm nodes.
+    :return: dict of {hostname: inventory host}, nodes matching no inventory host are left out.
+    """
+    inventory = dict(IMConfig.CLUSTER_MANAGER_NODES or {})
+    inventory.update(IMConfig.CLUSTER_WORKER_NODES or {})
+    host_of_addr = {}
+    for host, addr in inventory.items():
+        host_of_addr[addr] = host
+        try:
+            host_of_addr.setdefault(socket.gethostbyname(addr), host)
+        except OSError:
+            pass
+    nodes_info = get_nodes_info()
+    res = {}
+    for hostname in hostnames:
+        addr = nodes_info.get(hostname, {}).get("ip")
+        if addr in host_of_addr:
+            res[hostname] = host_of_addr[addr]
+        elif hostname in inventory:
+            res[hostname] = hostname
+    return res
+
+
+def get_layer_sizes(registry_client, image):
+    """
+    Get compressed sizes of the layers of an image from the registry of this system, which are the bytes
+    transferred when pulling layers, the first platform is used for multi-platform images.
+
+    :return: list of sizes in order of layers, None if image is not in the registry or registry not reachable.
+    """
+    from imutils.IMError import IMRegistryError
+
+    host, _, reference = image.partition("/")
+    if host not in (
+        IMConfig.REGISTRY_COMMON_NAME,
+        f"{IMConfig.REGISTRY_COMMON_NAME}:{IMConfig.REGISTRY_PORT}",
+    ):
+        return None
+    repository, _, tag = reference.rpartition(":")
+    if not repository or "/" in tag:
+        repository, tag = reference, "latest"
+    try:
+        manifest, _, _ = registry_client.get_manifest(repository, tag)
+        if manifest.get("manifests"):
+            manifest, _, _ = registry_client.get_manifest(
+                repository, manifest["manifests"][0]["digest"]
+            )
+    except IMRegistryError:
+        return None
+    if "layers" not in manifest:
+        return None
+    return [item.get("size", 0) for item in manifest["layers"]]
+
+
+def pull_images_on_node(
+    hostname, images, report=None, inventory_host=None, registry_client=None
+):
+    """
+    Pull images on a node through ansible with the cluster inventory, one image after another.
+
+    Layers not on the node before pulling are counted as pulled, with their compressed sizes from the registry
+    if "registry_client" given and the image is in the registry.
+
+    :param report: function called with (hostname, image, success, pulled layers, pulled bytes, seconds,
+        message) after each image is pulled, pulled bytes is None if unknown.
+    :param inventory_host: name of the node in cluster inventory, hostname if not given.
+    :param registry_client: RegistryClient object.
+    :return: list of (image, success, pulled layers, pulled bytes, seconds, message).
+    """
+    res = []
+    for image in sorted(images):
+        start_time = time.time()
+        command = (
+            f"ansible {shlex.quote(inventory_host or hostname)} -o -m shell "
+            f"-a {shlex.quote(PULL_SCRIPT.format(image=shlex.quote(image)))} "
+            f"-i {IMConfig.CLUSTER_INVENTORY_FILE_PATH}"
+        )
+        result = subprocess.run(
+            command,
+            shell=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+        )
+        output = result.stdout.strip()
+        fields = []
+        if result.returncode == 0 and "(stdout)" in output:
+            fields = output.split("(stdout)", maxsplit=1)[1].strip().split("|")
+        if len(fields) != 3:
+            res.append(
+                (
+                    image,
+                    False,
+                    0,
+                    0,
+                    time.time() - start_time,
+                    output or result.stderr.strip(),
+                )
+            )
+        else:
+            indexes = [int(item) for item in fields[2].split() if item.isdigit()]
+            pulled_bytes = 0
+            if indexes:
+                sizes = (
+                    get_layer_sizes(registry_client, image) if registry_client else None
+                )
+                if sizes is None or max(indexes) >= len(sizes):
+                    pulled_bytes = None
+                else:
+                    pulled_bytes = sum(sizes[i] for i in indexes)
+            res.append(
+                (image, True, len(indexes), pulled_bytes, time.time() - start_time, "")
+            )
+        if report:
+            report(hostname, *res[-1])
+    return res
+
+
+def prepull_images(iocs=None, all_nodes=False, max_workers=8, verbose=False):
+    """
+    Pull images of IOC services to be created or updated to their target nodes concurrently before deploying,
+    so that the deploy only restarts containers.
+
+    :param iocs: names of IOC projects, all IOC projects if not given.
+    :param all_nodes: pull images to all available worker nodes.
+    :param max_workers: max number of nodes pulling at the same time.
+    :param verbose:
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    schedule = get_prepull_schedule(iocs=iocs, all_nodes=all_nodes, verbose=verbose)
+    if not schedule:
+        print(f"prepull_images: No image to pull.")
+        return
+    total = sum(len(item) for item in schedule.values())
+    print(
+        f"prepull_images: Pulling {len(set().union(*schedule.values()))} images to "
+        f"{len(schedule)} nodes, {total} pulls in total."
+    )
+    if verbose:
+        for hostname, images in sorted(schedule.items()):
+            print(f'{hostname}: {" ".join(sorted(images))}')
+
+    inventory_hosts = get_inventory_hosts(schedule.keys())
+    not_found = sorted(set(schedule.keys()) - set(inventory_hosts.keys()))
+    if not_found:
+        print(
+            f"prepull_images: Failed. No host in cluster inventory matches address of nodes: "
+            f'{" ".join(not_found)}, check CLUSTER_MANAGER_NODES and CLUSTER_WORKER_NODES settings '
+            f'and run "IocManager cluster --gen-inventory-files".'
+        )
+
+    from imutils.RegistryClient import RegistryClient
+
+    registry_client = RegistryClient(use_cache=False, verbose=False)
+    lock = threading.Lock()
+    counters = {
+        "count": 0,
+        "failed": 0,
+        "pulled_layers": 0,
+        "pulled_bytes": 0,
+        "unknown": 0,
+    }
+
+    def report(hostname, image, success, layers, size, seconds, message):
+        with lock:
+            counters["count"] += 1
+            prompt = f'[{counters["count"]}/{total}] {hostname} {image}'
+            if success:
+                counters["pulled_layers"] += layers
+                if not layers:
+                    state = "up to date"
+                elif size is None:
+                    counters["unknown"] += 1
+                    state = f"pulled {layers} layers"
+                else:
+                    counters["pulled_bytes"] += size
+                    state = f"pulled {layers} layers, {size / (1 << 20):.1f}M"
+                print(f"{prompt}: {state} in {seconds:.1f}s.")
+            else:
+                counters["failed"] += 1
+                print(f"{prompt}: Failed, {message}")
+
+    start_time = time.time()
+    for hostname in not_found:
+        for image in sorted(schedule[hostname]):
+            report(hostname, image, False, 0, 0, 0.0, "node not found in cluster inventory.")
+    with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+        for hostname, images in schedule.items():
+            if hostname in inventory_hosts:
+                executor.submit(
+                    pull_images_on_node,
+                    hostname,
+                    images,
+                    report,
+                    inventory_hosts[hostname],
+                    registry_client,
+                )
+    registry_client.close()
+    print(
+        f"prepull_images: Finished in {time.time() - start_time:.1f}s, "
+        f'{total - counters["failed"]} succeeded, {counters["failed"]} failed, '
+        f'{counters["pulled_layers"]} layers pulled, '
+        f'{counters["pulled_bytes"] / (1 << 20):.1f}M transferred'
+        + (
+            f' (size unknown for {counters["unknown"]} pulls of images not in registry).'
+            if counters["unknown"]
+            else "."
+        )
+    )
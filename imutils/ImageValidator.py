@@ -0,0 +1,147 @@
+import os
+import time
+
+import imutils.IMConfig as IMConfig
+from imutils.RegistryClient import RegistryClient
+
+
+def parse_image_reference(image):
+    """
+    Split an image reference into registry host, repository and reference.
+
+    :return: (registry host, repository, tag or digest), registry host is "docker.io" for images without one.
+    """
+    name, _, digest = str(image).strip().partition("@")
+    registry = "docker.io"
+    parts = name.split("/", maxsplit=1)
+    if len(parts) == 2 and (
+        "." in parts[0] or ":" in parts[0] or parts[0] == "localhost"
+    ):
+        registry, name = parts
+    tag = "latest"
+    if ":" in name.rsplit("/", maxsplit=1)[-1]:
+        name, tag = name.rsplit(":", maxsplit=1)
+    return registry, name, digest if digest else tag
+
+
+def is_local_registry(registry):
+    # whether the registry host refers to the registry of IocDock.
+    return registry in (
+        IMConfig.REGISTRY_COMMON_NAME,
+        IMConfig.REGISTRY_CERT_DOCKER_DIR,
+        f"{IMConfig.REGISTRY_COMMON_NAME}:{IMConfig.REGISTRY_PORT}",
+    )
+
+
+def validate_images(images, max_workers=8, use_cache=True, verbose=False):
+    """
+    Check existence of images in the registry of IocDock by manifest HEAD requests issued concurrently.
+    Images of other registries are not checked.
+
+    :param images: iterable of image references.
+    :return: dict of {image: (state, message)}, state is one of "found", "unknown", "unchecked" and "error".
+    """
+    res = {}
+    references = {}
+    for image in set(images):
+        registry, repository, reference = parse_image_reference(image)
+        if is_local_registry(registry):
+            references[image] = (repository, reference)
+        else:
+            res[image] = ("unchecked", f'registry "{registry}" is not checked')
+    if not references:
+        return res
+    registry_client = RegistryClient(
+        max_workers=max_workers, use_cache=use_cache, verbose=verbose
+    )
+    try:
+        digests, errors = registry_client.head_manifests(references.values())
+    finally:
+        registry_client.close()
+    for image, item in references.items():
+        if item in errors:
+            res[image] = ("error", errors[item])
+        elif digests.get(item):
+            res[image] = ("found", digests[item])
+        else:
+            res[image] = ("unknown", "manifest not found in registry")
+    return res
+
+
+def get_repository_ioc_images(iocs):
+    """
+    Get images of IOC projects from their config files in repository.
+
+    :return: dict of {IOC name: image}, IOC projects not found or without image are left out.
+    """
+    from imutils.IocClass import IOC
+
+    res = {}
+    for name in iocs:
+        dir_path = os.path.join(IMConfig.REPOSITORY_PATH, name)
+        if not os.path.isdir(dir_path):
+            continue
+        image = IOC(
+            dir_path=dir_path, read_mode=True, no_exec_get_src=True
+        ).get_config("image")
+        if image:
+            res[name] = image
+    return res
+
+
+def get_swarm_ioc_images(iocs=None, verbose=False):
+    """
+    Get images of swarm IOC projects at swarm data dir, the same as those in their generated compose files.
+
+    :return: dict of {IOC name: image}.
+    """
+    from imutils.SwarmPlan import get_desired_ioc_services
+
+    return {
+        name: definition["image"]
+        for name, definition in get_desired_ioc_services(
+            iocs=iocs, verbose=verbose
+        ).items()
+        if definition.get("image")
+    }
+
+
+def validate_ioc_images(ioc_images, max_workers=8, use_cache=True, verbose=False):
+    """
+    Validate distinct images of IOC projects against the registry before deploying, and report IOC projects
+    using images that are not found. Failing to reach the registry is reported as a warning only.
+
+    :param ioc_images: dict of {IOC name: image}.
+    :return: False if any image is not found in the registry, otherwise True.
+    """
+    image_iocs = {}
+    for name, image in ioc_images.items():
+        image_iocs.setdefault(image, []).append(name)
+    start_time = time.time()
+    result = validate_images(
+        image_iocs.keys(), max_workers=max_workers, use_cache=use_cache, verbose=verbose
+    )
+    states = {}
+    for image, (state, _) in result.items():
+        states.setdefault(state, []).append(image)
+    print(
+        f"validate_ioc_images: Checked {len(image_iocs)} distinct images of {len(ioc_images)} IOC projects "
+        f"in {time.time() - start_time:.2f}s, {len(states.get('found', []))} found, "
+        f"{len(states.get('unknown', []))} unknown, {len(states.get('unchecked', []))} not checked."
+    )
+    if verbose:
+        for image in sorted(states.get("found", [])):
+            print(f"found: {image} ({result[image][1]})")
+        for image in sorted(states.get("unchecked", [])):
+            print(f"not checked: {image} ({result[image][1]})")
+    for image in sorted(states.get("error", [])):
+        print(
+            f'validate_ioc_images: Warning. Failed to check image "{image}" used by '
+            f'{" ".join(sorted(image_iocs[image]))}. {result[image][1]}'
+        )
+    for image in sorted(states.get("unknown", [])):
+        print(
+            f'validate_ioc_images: Image "{image}" not found in registry, '
+            f'used by: {" ".join(sorted(image_iocs[image]))}.'
+        )
+    return not states.get("unknown")
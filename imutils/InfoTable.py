@@ -0,0 +1,270 @@
+import sys
+import time
+from array import array
+from datetime import datetime
+
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+class _Missing:
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<missing>"
+
+
+# placeholder of fields not set for an entry.
+MISSING = _Missing()
+
+
+def to_timestamp(value):
+    # "update_at" may be given as float timestamp or as string of TIME_FORMAT.
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value, TIME_FORMAT).timestamp()
+        except ValueError:
+            return 0.0
+    return float(value) if value else 0.0
+
+
+class InfoTable:
+    """
+    Columnar table of entries of information. Entries are indexed by an id of their interned name, each field
+    is kept in a list of values indexed by id, string values are interned as states and statuses repeat among
+    entries. "update_at" is kept as float timestamp in an array and rendered as string only when entries
+    are read, so entries are read as dicts like {field: value, "update_at": "%Y-%m-%d %H:%M:%S"}.
+    """
+
+    def __init__(self):
+        self._ids = {}
+        self._names = []
+        self._free_ids = []
+        self._columns = {}
+        self._update_at = array("d")
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, name):
+        return name in self._ids
+
+    def __iter__(self):
+        return iter(list(self._ids.keys()))
+
+    def keys(self):
+        return list(self._ids.keys())
+
+    def _allocate(self, name):
+        name = sys.intern(name)
+        if self._free_ids:
+            entry_id = self._free_ids.pop()
+            self._names[entry_id] = name
+        else:
+            entry_id = len(self._names)
+            self._names.append(name)
+            self._update_at.append(0.0)
+            for column in self._columns.values():
+                column.append(MISSING)
+        self._ids[name] = entry_id
+        return entry_id
+
+    def set(self, name, info):
+        """
+        Set an entry, fields not in info are removed from the entry.
+
+        :return: (dict of fields changed with "update_at" if given, list of fields removed),
+            None if nothing changed apart from "update_at".
+        """
+        entry_id = self._ids.get(name)
+        if entry_id is None:
+            entry_id = self._allocate(name)
+        changed = {}
+        removed = []
+        modified = False
+        for key, value in info.items():
+            if key == "update_at":
+                continue
+            column = self._columns.get(key)
+            if column is None:
+                column = [MISSING] * len(self._names)
+                self._columns[sys.intern(key)] = column
+            old_value = column[entry_id]
+            if old_value is MISSING or old_value != value:
+                column[entry_id] = sys.intern(value) if type(value) is str else value
+                changed[key] = value
+                modified = True
+        for key, column in self._columns.items():
+            if key not in info and column[entry_id] is not MISSING:
+                column[entry_id] = MISSING
+                removed.append(key)
+                modified = True
+        self._update_at[entry_id] = to_timestamp(info.get("update_at"))
+        if modified and self._update_at[entry_id]:
+            changed["update_at"] = self.render_time(self._update_at[entry_id])
+        return (changed, removed) if modified else None
+
+    def remove(self, name):
+        entry_id = self._ids.pop(name, None)
+        if entry_id is None:
+            return False
+        for column in self._columns.values():
+            column[entry_id] = MISSING
+        self._names[entry_id] = None
+        self._update_at[entry_id] = 0.0
+        self._free_ids.append(entry_id)
+        return True
+
+    @staticmethod
+    def render_time(timestamp):
+        return time.strftime(TIME_FORMAT, time.localtime(timestamp)) if timestamp else ""
+
+    def get(self, name, fields=None):
+        """
+        :param fields: list of fields to read, all fields if None or empty.
+        :return: dict of entry, None if entry not found.
+        """
+        entry_id = self._ids.get(name)
+        if entry_id is None:
+            return None
+        res = {}
+        for key in fields or self._columns.keys():
+            if key == "update_at":
+                continue
+            column = self._columns.get(key)
+            if column is not None and column[entry_id] is not MISSING:
+                res[key] = column[entry_id]
+        if (not fields or "update_at" in fields) and self._update_at[entry_id]:
+            res["update_at"] = self.render_time(self._update_at[entry_id])
+        return res
+
+    def get_timestamp(self, name):
+        entry_id = self._ids.get(name)
+        return None if entry_id is None else self._update_at[entry_id]
+
+    def items(self, fields=None):
+        for name in list(self._ids.keys()):
+            yield name, self.get(name, fields)
+
+    def to_dict(self, fields=None):
+        return dict(self.items(fields))
+
+
+if __name__ == "__main__":
+    # Memory benchmark of TaskServer state for synthetic IOC projects and services, compare the former model
+    # (IOC objects kept for each project, dict of each entry with "update_at" string) with InfoTable.
+    # usage: python3 -m imutils.InfoTable [count]
+    import os
+    import gc
+    import shutil
+    import tempfile
+    import tracemalloc
+    from configparser import ConfigParser
+
+    from imutils.IMConfig import IOC_CONFIG_FILE, IOC_STATE_INFO_FILE
+    from imutils.IocClass import IOC
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    statuses = ["running", "shutdown", "failed", "pending", "complete"]
+
+    def synthetic_infos(i):
+        now = datetime.now().strftime(TIME_FORMAT)
+        # values are built separately as they are when read from files and docker API.
+        ioc_info = {
+            "name": f"ioc-{i:05d}",
+            "host": "".join(["swar", "m"]),
+            "state": "".join(["norm", "al"]),
+            "status": "".join(["gene", "rated"]),
+            "snapshot_consistency": "".join(["tra", "cked"]),
+            "deploy_consistency": "".join(["consis", "tent"]),
+            "update_at": "".join([now]),
+        }
+        service_info = {
+            "status": "".join(list(statuses[i % len(statuses)])),
+            "replicas": "".join(["1/", "1"]),
+            "update_at": "".join([now]),
+        }
+        return ioc_info, service_info
+
+    def make_repository(top):
+        # write config files of one IOC project and copy them to the others with names changed.
+        template = os.path.join(top, "template")
+        os.makedirs(template)
+        IOC(dir_path=template, create=True)
+        conf = ConfigParser()
+        conf.read(os.path.join(template, IOC_CONFIG_FILE))
+        for i in range(count):
+            path = os.path.join(top, "repository", f"ioc-{i:05d}")
+            os.makedirs(os.path.join(path, "src"))
+            conf.set("IOC", "name", f"ioc-{i:05d}")
+            with open(os.path.join(path, IOC_CONFIG_FILE), "w") as f:
+                conf.write(f)
+            shutil.copy(os.path.join(template, IOC_STATE_INFO_FILE), path)
+        return os.path.join(top, "repository")
+
+    def build_former(repository):
+        ioc_list = [
+            IOC(dir_path=os.path.join(repository, f"ioc-{i:05d}"), read_mode=True)
+            for i in range(count)
+        ]
+        ioc_info, service_info = {}, {}
+        for i in range(count):
+            ioc_item, service_item = synthetic_infos(i)
+            ioc_info[ioc_item["name"]] = ioc_item
+            service_info[ioc_item["name"]] = service_item
+        return ioc_list, ioc_info, service_info
+
+    def build_compact(repository):
+        ioc_info, service_info = InfoTable(), InfoTable()
+        for i in range(count):
+            ioc_item, service_item = synthetic_infos(i)
+            ioc_info.set(ioc_item["name"], ioc_item)
+            service_info.set(ioc_item["name"], service_item)
+        return ioc_info, service_info
+
+    def resident_size():
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+    def measure(build, repository, trace):
+        # build in a forked process, so that each model is measured from the same start, resident size is
+        # measured without tracemalloc as it takes memory itself.
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            gc.collect()
+            if trace:
+                tracemalloc.start()
+            else:
+                start = resident_size()
+            state = build(repository)
+            gc.collect()
+            if trace:
+                size = tracemalloc.get_traced_memory()[0]
+            else:
+                size = resident_size() - start
+            os.write(write_fd, str(size).encode())
+            os._exit(0 if state else 1)
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            size = int(f.read())
+        os.waitpid(pid, 0)
+        return size
+
+    top = tempfile.mkdtemp(prefix="iocdock-bench-")
+    try:
+        print(f"Creating {count} synthetic IOC projects in {top}...")
+        repository = make_repository(top)
+        res = {}
+        for label, build in (("former", build_former), ("compact", build_compact)):
+            res[label] = (measure(build, repository, True), measure(build, repository, False))
+            print(
+                f"{label:>8}: {res[label][0] / 2 ** 20:8.2f} MiB allocated, "
+                f"{res[label][1] / 2 ** 20:8.2f} MiB resident size increased."
+            )
+        print(
+            f"Allocated memory reduced by {1 - res['compact'][0] / res['former'][0]:.1%} "
+            f"for {count} IOC projects and services."
+        )
+    finally:
+        shutil.rmtree(top, ignore_errors=True)
@@ -308,6 +308,8 @@ class IOC:
         self.set_config("cpu-reserve", "", section="DEPLOY")
         self.set_config("memory-reserve", "", section="DEPLOY")
         self.set_config("constraints", "", section="DEPLOY")
+        self.set_config("priority", "", section="DEPLOY")
+        self.set_config("start_group", "", section="DEPLOY")
         self.write_config()
 
     # read config or create a new config or set error.
@@ -1400,12 +1402,234 @@ class IOC:
         pass
 
 
-def gen_swarm_files(iocs, verbose):
+def get_ioc_placement(available_only=False):
+    """
+    Return node assignment of IOC services made by placement planner, as dict of {IOC name: node hostname}.
+
+    :param available_only: keep only assignments to nodes that are ready and active now, so that IOC services
+        are not pinned to a node which can not run them. All assignments are dropped if nodes can not be
+        checked, IOC services are then scheduled by swarm freely.
+    """
+    file_path = os.path.join(MOUNT_PATH, SWARM_DIR, IOC_PLACEMENT_FILE)
+    if not os.path.isfile(file_path):
+        return {}
+    import json
+
+    try:
+        with open(file_path, "r") as f:
+            placement = json.load(f).get("placement", {})
+    except Exception as e:
+        print(f'get_ioc_placement: Warning. Failed to read "{file_path}", {e}.')
+        return {}
+    if not available_only or not placement:
+        return placement
+    try:
+        import docker
+
+        available_nodes = {
+            item.attrs["Description"]["Hostname"]
+            for item in docker.from_env().nodes.list()
+            if item.attrs["Spec"]["Availability"] == "active"
+            and item.attrs["Status"]["State"] == "ready"
+        }
+    except Exception as e:
+        print(
+            f"get_ioc_placement: Warning. Failed to check swarm nodes, node assignments are ignored, {e}."
+        )
+        return {}
+    dropped = sorted(name for name, node in placement.items() if node not in available_nodes)
+    if dropped:
+        print(
+            f"get_ioc_placement: Warning. Assigned nodes of {len(dropped)} IOC services are not ready or "
+            f'active, they are scheduled by swarm freely: {" ".join(dropped)}.'
+        )
+    return {name: node for name, node in placement.items() if node in available_nodes}
+
+
+def write_ioc_placement(placement):
+    # write node assignment of IOC services to placement file at swarm data dir.
+    import json
+    from datetime import datetime
+
+    file_path = os.path.join(MOUNT_PATH, SWARM_DIR, IOC_PLACEMENT_FILE)
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(
+            {
+                "created_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "placement": placement,
+            },
+            f,
+            indent=4,
+            sort_keys=True,
+        )
+    os.replace(temp_path, file_path)
+
+
+def get_ioc_service_definition(service_dir, verbose=False, placement=None):
+    """
+    Build swarm service definition for an exported IOC project at swarm data dir.
+
+    :param service_dir: directory name of IOC project at swarm data dir.
+    :param verbose:
+    :param placement: node assignment got by get_ioc_placement(available_only=True),
+        read from placement file if not given.
+    :return: dict of {"srv-<name>": service definition}, None if IOC project is not correctly set.
+    """
+    top_path = os.path.join(MOUNT_PATH, SWARM_DIR)
+    service_path = os.path.join(top_path, service_dir)
+
+    # read ioc.ini and get deployment setting.
+    ioc_settings = {"service_dir": service_dir}
+    ioc_ini_path = os.path.join(service_path, IOC_CONFIG_FILE)
+    if not os.path.exists(ioc_ini_path):
+        if verbose:
+            print(
+                f'gen_swarm_files: Skip directory "{service_dir}" as there is no valid IOC config file.'
+            )
+        return None
+    try:
+        temp_ioc = IOC(
+            dir_path=service_path,
+            read_mode=True,
+            verbose=verbose,
+            state_info_ini_dir=os.path.join(REPOSITORY_PATH, service_dir),
+            no_exec_get_src=True,
+        )
+        if not temp_ioc.check_config(section="IOC", option="host", value="swarm"):
+            print(
+                f'gen_swarm_files: Warning. IOC "{service_dir}" not defined in swarm mode, skipped.'
+            )
+            return None
+        if not temp_ioc.get_config(section="IOC", option="image"):
+            print(
+                f'gen_swarm_files: Warning. Option "image" not defined for IOC "{service_dir}", skipped.'
+            )
+            return None
+        else:
+            ioc_settings["image"] = temp_ioc.get_config(section="IOC", option="image")
+        # get resources settings
+        ioc_settings["cpu-reserve"] = temp_ioc.get_config(
+            section="DEPLOY", option="cpu-reserve"
+        )
+        ioc_settings["memory-reserve"] = temp_ioc.get_config(
+            section="DEPLOY", option="memory-reserve"
+        )
+        ioc_settings["cpu-limit"] = temp_ioc.get_config(
+            section="DEPLOY", option="cpu-limit"
+        )
+        ioc_settings["memory-limit"] = temp_ioc.get_config(
+            section="DEPLOY", option="memory-limit"
+        )
+        # make resources dict
+        reservations_dict = {}
+        limits_dict = {}
+        resources_dict = {}
+        if ioc_settings["cpu-reserve"]:
+            reservations_dict["cpus"] = ioc_settings["cpu-reserve"]
+        if ioc_settings["memory-reserve"]:
+            reservations_dict["memory"] = ioc_settings["memory-reserve"]
+        if ioc_settings["cpu-limit"]:
+            limits_dict["cpus"] = ioc_settings["cpu-limit"]
+        if ioc_settings["memory-limit"]:
+            limits_dict["memory"] = ioc_settings["memory-limit"]
+        if reservations_dict:
+            resources_dict["reservations"] = reservations_dict
+        if limits_dict:
+            resources_dict["limits"] = limits_dict
+        # labels
+        labels_to_add = {}
+        for label_line in multi_line_parse(
+            temp_ioc.get_config(section="DEPLOY", option="labels")
+        ):
+            k, v = condition_parse(label_line)
+            if k:
+                labels_to_add[k] = v
+            else:
+                print(
+                    f"gen_swarm_files: Warning. "
+                    f'Invalid label definition "{label_line}" for IOC "{service_dir}", skipped.'
+                )
+    except IMIOCError as e:
+        print(
+            f'gen_swarm_files: Warning. Exception raised "{e}" while Parsing "{ioc_ini_path}", skipped.'
+        )
+        return None
+
+    # add services according to IOC projects.
+    temp_yaml = {
+        "image": ioc_settings["image"],
+        "entrypoint": [
+            "bash",
+            "-c",
+            f'cd RUN/{ioc_settings["service_dir"]}/startup/iocBoot; ./st.cmd;',
+        ],
+        "environment": {
+            "EPICS_IOCSH_HISTFILE": f"/opt/EPICS/RUN/{ioc_settings['service_dir']}/logs/.iocsh_history",
+        },
+        "tty": True,
+        "stdin_open": True,
+        "networks": ["hostnet"],
+        "volumes": [
+            {
+                "type": "bind",
+                "source": f'../{ioc_settings["service_dir"]}',
+                "target": f'{os.path.join(CONTAINER_IOC_RUN_PATH, ioc_settings["service_dir"])}',
+            },
+            {
+                "type": "bind",
+                "source": f"../{LOG_FILE_DIR}",
+                "target": f"{os.path.join(CONTAINER_IOC_RUN_PATH, LOG_FILE_DIR)}",
+            },
+            {
+                "type": "bind",
+                "source": "/etc/localtime",
+                "target": "/etc/localtime",
+                "read_only": True,
+            },  # set correct timezone for linux kernel
+        ],
+        "labels": {
+            "service-type": "ioc",
+        },
+        "deploy": {
+            "replicas": 1,
+            "placement": {
+                "constraints": [
+                    "node.role==worker",
+                ],
+            },
+            "update_config": {
+                "parallelism": 1,
+                "delay": "10s",
+                "failure_action": "rollback",
+            },
+        },
+    }
+    # node assigned by placement planner, only if the node is available.
+    if placement is None:
+        placement = get_ioc_placement(available_only=True)
+    if placement.get(ioc_settings["service_dir"]):
+        temp_yaml["deploy"]["placement"]["constraints"].append(
+            f'node.hostname=={placement[ioc_settings["service_dir"]]}'
+        )
+    # reservations dict.
+    if resources_dict:
+        temp_yaml["deploy"]["resources"] = resources_dict
+    # labels dict
+    if labels_to_add:
+        temp_yaml["labels"].update(labels_to_add)
+    #
+    return {f'srv-{ioc_settings["service_dir"]}': temp_yaml}
+
+
+def gen_swarm_files(iocs, verbose, stack_file=False, shards=1):
     """
     Generate Docker Compose file for swarm deploying at swarm data dir for specified IOC projects.
 
     :param iocs: IOC projects specified to generate compose file.
     :param verbose:
+    :param stack_file: also generate aggregated stack files of all swarm IOC services.
+    :param shards: number of aggregated stack files to split IOC services into.
     """
     if verbose:
         print(
@@ -1425,152 +1649,21 @@ def gen_swarm_files(iocs, verbose):
             print(f"gen_swarm_files: Working at {top_path}.")
 
     processed_dir = []
+    placement = get_ioc_placement(available_only=True)
     for service_dir in os.listdir(top_path):
         if not (iocs == ["alliocs"] or service_dir in iocs):
             continue
-        service_path = os.path.join(top_path, service_dir)
-
-        # read ioc.ini and get deployment setting.
-        ioc_settings = {"service_dir": service_dir}
-        ioc_ini_path = os.path.join(service_path, IOC_CONFIG_FILE)
-        if not os.path.exists(ioc_ini_path):
-            if verbose:
-                print(
-                    f'gen_swarm_files: Skip directory "{service_dir}" as there is no valid IOC config file.'
-                )
-            continue
-        try:
-            temp_ioc = IOC(
-                dir_path=service_path,
-                read_mode=True,
-                verbose=verbose,
-                state_info_ini_dir=os.path.join(REPOSITORY_PATH, service_dir),
-                no_exec_get_src=True,
-            )
-            if not temp_ioc.check_config(section="IOC", option="host", value="swarm"):
-                print(
-                    f'gen_swarm_files: Warning. IOC "{service_dir}" not defined in swarm mode, skipped.'
-                )
-                continue
-            if not temp_ioc.get_config(section="IOC", option="image"):
-                print(
-                    f'gen_swarm_files: Warning. Option "image" not defined for IOC "{service_dir}", skipped.'
-                )
-                continue
-            else:
-                ioc_settings["image"] = temp_ioc.get_config(
-                    section="IOC", option="image"
-                )
-            # get resources settings
-            ioc_settings["cpu-reserve"] = temp_ioc.get_config(
-                section="DEPLOY", option="cpu-reserve"
-            )
-            ioc_settings["memory-reserve"] = temp_ioc.get_config(
-                section="DEPLOY", option="memory-reserve"
-            )
-            ioc_settings["cpu-limit"] = temp_ioc.get_config(
-                section="DEPLOY", option="cpu-limit"
-            )
-            ioc_settings["memory-limit"] = temp_ioc.get_config(
-                section="DEPLOY", option="memory-limit"
-            )
-            # make resources dict
-            reservations_dict = {}
-            limits_dict = {}
-            resources_dict = {}
-            if ioc_settings["cpu-reserve"]:
-                reservations_dict["cpus"] = ioc_settings["cpu-reserve"]
-            if ioc_settings["memory-reserve"]:
-                reservations_dict["memory"] = ioc_settings["memory-reserve"]
-            if ioc_settings["cpu-limit"]:
-                limits_dict["cpus"] = ioc_settings["cpu-limit"]
-            if ioc_settings["memory-limit"]:
-                limits_dict["memory"] = ioc_settings["memory-limit"]
-            if reservations_dict:
-                resources_dict["reservations"] = reservations_dict
-            if limits_dict:
-                resources_dict["limits"] = limits_dict
-            # labels
-            labels_to_add = {}
-            for label_line in multi_line_parse(
-                temp_ioc.get_config(section="DEPLOY", option="labels")
-            ):
-                k, v = condition_parse(label_line)
-                if k:
-                    labels_to_add[k] = v
-                else:
-                    print(
-                        f"gen_swarm_files: Warning. "
-                        f'Invalid label definition "{label_line}" for IOC "{service_dir}", skipped.'
-                    )
-        except IMIOCError as e:
-            print(
-                f'gen_swarm_files: Warning. Exception raised "{e}" while Parsing "{ioc_ini_path}", skipped.'
-            )
+        service_data = get_ioc_service_definition(
+            service_dir, verbose=verbose, placement=placement
+        )
+        if not service_data:
             continue
 
         # yaml file title, name of Compose Project must match pattern '^[a-z0-9][a-z0-9_-]*$'
         yaml_data = {
-            "services": {},
+            "services": service_data,
             "networks": {},
         }
-        # add services according to IOC projects.
-        temp_yaml = {
-            "image": ioc_settings["image"],
-            "entrypoint": [
-                "bash",
-                "-c",
-                f'cd RUN/{ioc_settings["service_dir"]}/startup/iocBoot; ./st.cmd;',
-            ],
-            "environment": {
-                "EPICS_IOCSH_HISTFILE": f"/opt/EPICS/RUN/{ioc_settings['service_dir']}/logs/.iocsh_history",
-            },
-            "tty": True,
-            "stdin_open": True,
-            "networks": ["hostnet"],
-            "volumes": [
-                {
-                    "type": "bind",
-                    "source": f'../{ioc_settings["service_dir"]}',
-                    "target": f'{os.path.join(CONTAINER_IOC_RUN_PATH, ioc_settings["service_dir"])}',
-                },
-                {
-                    "type": "bind",
-                    "source": f"../{LOG_FILE_DIR}",
-                    "target": f"{os.path.join(CONTAINER_IOC_RUN_PATH, LOG_FILE_DIR)}",
-                },
-                {
-                    "type": "bind",
-                    "source": "/etc/localtime",
-                    "target": "/etc/localtime",
-                    "read_only": True,
-                },  # set correct timezone for linux kernel
-            ],
-            "labels": {
-                "service-type": "ioc",
-            },
-            "deploy": {
-                "replicas": 1,
-                "placement": {
-                    "constraints": [
-                        "node.role==worker",
-                    ],
-                },
-                "update_config": {
-                    "parallelism": 1,
-                    "delay": "10s",
-                    "failure_action": "rollback",
-                },
-            },
-        }
-        # reservations dict.
-        if resources_dict:
-            temp_yaml["deploy"]["resources"] = resources_dict
-        # labels dict
-        if labels_to_add:
-            temp_yaml["labels"].update(labels_to_add)
-        #
-        yaml_data["services"].update({f'srv-{ioc_settings["service_dir"]}': temp_yaml})
         # add network for each stack.
         temp_yaml = {
             "external": True,
@@ -1582,6 +1675,7 @@ def gen_swarm_files(iocs, verbose):
         if os.path.exists(file_path):
             file_remove(file_path, verbose=False)
         import yaml
+
         with open(file_path, "w") as file:
             yaml.dump(yaml_data, file, default_flow_style=False)
         # set readonly permission.
@@ -1602,6 +1696,111 @@ def gen_swarm_files(iocs, verbose):
                         f"may be it is not correctly set."
                     )
 
+    if stack_file:
+        gen_ioc_stack_files(shards=shards, verbose=verbose)
+
+
+def get_ioc_stack_file_paths():
+    """
+    Return paths of aggregated stack files currently existing at swarm data dir, sorted by shard index.
+    """
+    stack_path = os.path.join(MOUNT_PATH, SWARM_DIR, IOC_STACK_DIR)
+    if not os.path.isdir(stack_path):
+        return []
+    stack_prefix = IOC_STACK_FILE.removesuffix(".yaml")
+    return sorted(
+        os.path.join(stack_path, item)
+        for item in os.listdir(stack_path)
+        if item == IOC_STACK_FILE
+        or (item.startswith(f"{stack_prefix}.") and item.endswith(".yaml"))
+    )
+
+
+def gen_ioc_stack_files(shards=1, verbose=False):
+    """
+    Aggregate compose files of all swarm IOC projects into one or a few sharded stack files,
+    so that a full-fleet deploy can be done by a single "docker stack deploy".
+
+    Services are assigned to shards by a stable hash of their names, adding or removing an
+    IOC project does not move other services between shards.
+
+    :param shards: number of stack files to split IOC services into.
+    :param verbose:
+    :return: list of stack file paths created.
+    """
+    import zlib
+    import yaml
+
+    top_path = os.path.join(MOUNT_PATH, SWARM_DIR)
+    stack_path = os.path.join(top_path, IOC_STACK_DIR)
+    if not os.path.isdir(top_path):
+        print(
+            f"gen_ioc_stack_files: Failed. Working directory {top_path} is not exist!"
+        )
+        return []
+    try:
+        shards = int(shards)
+    except (TypeError, ValueError):
+        shards = 0
+    if shards < 1:
+        print(f'gen_ioc_stack_files: Failed. Invalid shards number "{shards}".')
+        return []
+    try_makedirs(stack_path, verbose=verbose)
+
+    # collect services from compose files of IOC projects.
+    services_sharded = [{} for _ in range(shards)]
+    networks = {}
+    for service_dir in sorted(os.listdir(top_path)):
+        file_path = os.path.join(top_path, service_dir, IOC_SERVICE_FILE)
+        if not os.path.isfile(file_path):
+            continue
+        try:
+            with open(file_path, "r") as f:
+                data = yaml.safe_load(f)
+        except Exception as e:
+            print(
+                f'gen_ioc_stack_files: Warning. Failed to read "{file_path}", {e}, skipped.'
+            )
+            continue
+        if not isinstance(data, dict) or not data.get("services"):
+            continue
+        for name, definition in data["services"].items():
+            index = zlib.crc32(name.encode("utf-8")) % shards
+            services_sharded[index][name] = definition
+        networks.update(data.get("networks", {}))
+
+    # remove stale stack files first, as number of shards may change.
+    for file_path in get_ioc_stack_file_paths():
+        file_remove(file_path, verbose=False)
+
+    files_created = []
+    for index, services in enumerate(services_sharded):
+        if not services:
+            continue
+        if shards == 1:
+            file_name = IOC_STACK_FILE
+        else:
+            file_name = f'{IOC_STACK_FILE.removesuffix(".yaml")}.{index}.yaml'
+        file_path = os.path.join(stack_path, file_name)
+        with open(file_path, "w") as f:
+            yaml.dump(
+                {"services": services, "networks": networks},
+                f,
+                default_flow_style=False,
+            )
+        os.chmod(file_path, 0o444)
+        files_created.append(file_path)
+        if verbose:
+            print(
+                f'gen_ioc_stack_files: Create stack file "{file_name}" with {len(services)} services.'
+            )
+    print(
+        f"gen_ioc_stack_files: Finished. "
+        f"{sum(len(item) for item in services_sharded)} IOC services aggregated into "
+        f"{len(files_created)} stack file(s)."
+    )
+    return files_created
+
 
 def get_all_ioc(dir_path=None, from_list=None, read_mode=False, verbose=False):
     """
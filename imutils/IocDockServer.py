@@ -1,4 +1,5 @@
 import os
+import errno
 import pprint
 import sys
 import socket
@@ -6,11 +7,34 @@ import select
 import threading
 import time
 import json
+import struct
 from datetime import datetime
 
-from imutils.IMConfig import SOCKET_PATH
-from imutils.IMUtil import get_all_ioc
+from imutils.IMConfig import (
+    SOCKET_PATH,
+    STATE_SNAPSHOT_PATH,
+    STATE_SNAPSHOT_MAX_AGE,
+    METRICS_PORT,
+    PREFIX_STACK_NAME,
+    REPOSITORY_PATH,
+    SNAPSHOT_PATH,
+    MOUNT_PATH,
+    IOC_CONFIG_FILE,
+    IOC_STATE_INFO_FILE,
+)
+from imutils.IocClass import IOC
+from imutils.FileWatcher import (
+    InotifyWatcher,
+    tree_signature,
+    get_filesystem_type,
+    NETWORK_FILESYSTEMS,
+)
+from imutils.StateSnapshot import write_state_snapshot, read_state_snapshot
+from imutils.InfoTable import InfoTable
+from imutils.TaskScheduler import TaskScheduler
+from imutils.MetricsExporter import MetricsServer, render_metrics
 from imutils.SwarmClass import SwarmManager
+from imutils.SwarmOrchestrator import collect_node_info, collect_service_info
 from imutils.SocketClient import send_message, receive_message
 
 
@@ -30,39 +54,89 @@ def display_message(msg="", with_prompt=False):
         print(msg)
 
 
-class RepeatingTimer:
+class DockerEventWatcher:
+    """
+    Consume docker events stream in a thread and call function on each event. If the stream breaks,
+    it is reconnected from the time of the last event received so that no event is lost.
+    Interface is the same as ScheduledTask, as the blocking stream is consumed by its own thread.
+    """
 
-    def __init__(self, interval, function, *args, **kwargs):
-        self.interval = interval
+    def __init__(
+        self,
+        function,
+        filters=None,
+        on_connect=None,
+        on_disconnect=None,
+        retry_interval=5,
+    ):
+        self.interval = 0
         self.function = function
-        self.args = args
-        self.kwargs = kwargs
+        self.args = ()
+        self.kwargs = {}
+        self.filters = filters
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.retry_interval = retry_interval
+        self.event_count = 0
+        self.errors = 0
+        self.last_error = None
 
+        self._since = None
+        self._stream = None
         self._running = False
         self._stop_event = threading.Event()
         self._thread = None
         self._lock = threading.Lock()
 
+    def _close_stream(self):
+        with self._lock:
+            stream = self._stream
+            self._stream = None
+        if stream is not None:
+            try:
+                stream.close()
+            except Exception:
+                pass
+
     def _run(self):
+        import docker
+
         while not self._stop_event.is_set():
-            with self._lock:
-                run_flag = self._running
-            if run_flag:
-                start_time = time.monotonic()
-                try:
-                    self.function(*self.args, **self.kwargs)
-                except Exception as e:
-                    print(f"Error in RepeatingTimer._run: {e}")
-                elapsed_time = time.monotonic() - start_time
-                sleep_time = self.interval - elapsed_time
-                if sleep_time > 0:
-                    self._stop_event.wait(sleep_time)
-                else:
-                    pass
-                    # self._stop_event.wait(self.interval)
-            else:
+            if not self.is_running:
                 self._stop_event.wait(0.1)
-        # time.sleep(3)
+                continue
+            connected = False
+            try:
+                stream = docker.from_env().events(
+                    decode=True, filters=self.filters, since=self._since
+                )
+                with self._lock:
+                    self._stream = stream
+                connected = True
+                if self.on_connect:
+                    self.on_connect()
+                for event in stream:
+                    self._since = event.get("time", self._since)
+                    self.event_count += 1
+                    try:
+                        self.function(event)
+                    except Exception as e:
+                        print(f"Error in DockerEventWatcher._run: {e}")
+                    if not self.is_running:
+                        break
+            except Exception as e:
+                if self.is_running:
+                    print(f"Error in DockerEventWatcher._run: {e}")
+                    self.errors += 1
+                    self.last_error = (
+                        f'{time.strftime("%Y-%m-%d %H:%M:%S")} {type(e).__name__}: {e}'
+                    )
+            finally:
+                self._close_stream()
+                if connected and self.on_disconnect:
+                    self.on_disconnect()
+            if self.is_running:
+                self._stop_event.wait(self.retry_interval)
 
     def start(self):
         with self._lock:
@@ -79,6 +153,8 @@ class RepeatingTimer:
             if not self._running:
                 return
             self._running = False
+        # break the blocking read of events stream.
+        self._close_stream()
 
     def shutdown(self):
         with self._lock:
@@ -86,71 +162,593 @@ class RepeatingTimer:
                 return
             self._running = False
             self._stop_event.set()
-            if self._thread.is_alive():
-                self._thread.join()
-            self._thread = None
+        self._close_stream()
+        if self._thread.is_alive():
+            self._thread.join()
+        self._thread = None
 
     @property
     def is_running(self):
         with self._lock:
             return self._running
 
+    def get_status(self):
+        with self._lock:
+            return {
+                "status": "running" if self._running else "stopped",
+                "interval": self.interval,
+                "function": self.function.__name__,
+                "args": self.args,
+                "kwargs": self.kwargs,
+                "connected": self._stream is not None,
+                "events": self.event_count,
+                "errors": self.errors,
+                "last_error": self.last_error,
+            }
+
 
 class TaskServer:
-    def __init__(self, pull_interval=10):
+    # seconds after a service event to check the service again, as tasks started on other nodes send no events.
+    FOLLOW_UP_DELAYS = (2, 5, 15)
+    # directories written by running IOCs and not used by consistency checks, not watched.
+    IOC_WATCH_EXCLUDE_DIRS = ("logs", "settings")
+    # kinds of information and attributes keeping them.
+    INFO_KINDS = {"ioc": "ioc_info", "service": "service_info", "node": "node_info"}
+
+    def __init__(self, pull_interval=10, reconcile_interval=60, watch_events=True):
 
         self.pull_interval = pull_interval
+        self.reconcile_interval = reconcile_interval
 
-        self.ioc_list = get_all_ioc()
         self.service_list = SwarmManager().services
 
-        self.ioc_info = {}
-        self.service_info = {}
-        self.node_info = {}
+        # IOC projects are recomputed only if their files changed, changes are found by inotify,
+        # or by comparing signatures of files of all IOC projects if inotify is not available.
+        # IOC objects are not kept, names of IOC projects known are the keys of signatures.
+        self._ioc_signatures = {}
+        self._ioc_watcher = None
+        self._ioc_watch_failed = False
+        self._ioc_lock = threading.Lock()
+        self.ioc_refresh_counters = {
+            "mode": "",
+            "candidates": 0,
+            "recomputed": 0,
+            "removed": 0,
+            "total": 0,
+            "duration": 0.0,
+            "refreshes": 0,
+            "recomputed_total": 0,
+        }
+
+        # entries are kept in columnar tables and rendered as dicts on demand.
+        self.ioc_info = InfoTable()
+        self.service_info = InfoTable()
+        self.node_info = InfoTable()
+        self.lock = threading.RLock()
+
+        # generation is increased on each change of entries, generations of kinds and entries are the
+        # generation of their last change, so that clients can get only entries changed since a generation.
+        self.generation = 0
+        self.kind_generations = {kind: 0 for kind in self.INFO_KINDS}
+        self.entry_generations = {kind: {} for kind in self.INFO_KINDS}
+        self.removed_generations = {kind: {} for kind in self.INFO_KINDS}
+        # functions called with delta of each change, for subscriptions.
+        self.listeners = []
+        # state is published to snapshot file for CLI to read without socket request, and preloaded on start.
+        self.snapshot_path = STATE_SNAPSHOT_PATH
+        self._published_generation = None
+        self._published_at = 0.0
+        self.snapshot_counters = {"publishes": 0, "size": 0, "duration": 0.0, "preloaded": 0}
+        # names of preloaded entries not yet seen by a full refresh, removed if they are not found by it.
+        self._preloaded = {kind: set() for kind in self.INFO_KINDS}
+
+        # entries affected by docker events, applied by task "apply_docker_events".
+        self._dirty_services = set()
+        self._dirty_nodes = False
+        self._follow_ups = []
 
+        # periodic tasks share the threads of a scheduler, polling tasks run more often while they find changes
+        # and less often while idle, within [interval * min_factor, interval * max_factor].
+        self.scheduler = TaskScheduler(max_workers=4)
         self.timer_tasks = {
-            "get_ioc_info": RepeatingTimer(self.pull_interval, self.get_ioc_info),
-            "get_service_info": RepeatingTimer(
-                self.pull_interval, self.get_service_info
+            "get_ioc_info": self.scheduler.task(
+                self.pull_interval, self.get_ioc_info, min_factor=0.5, max_factor=3
             ),
-            "get_node_info": RepeatingTimer(self.pull_interval, self.get_node_info),
+            "get_service_info": self.scheduler.task(
+                self.pull_interval, self.get_service_info, min_factor=0.5, max_factor=3
+            ),
+            "get_node_info": self.scheduler.task(
+                self.pull_interval, self.get_node_info, min_factor=0.5, max_factor=3
+            ),
+        }
+        self.timer_tasks["publish_state_snapshot"] = self.scheduler.task(
+            1, self.publish_state_snapshot
+        )
+        if watch_events:
+            # services and nodes are updated on docker events, full polling is kept as a slow reconciliation
+            # while events stream is connected.
+            self.timer_tasks["watch_docker_events"] = DockerEventWatcher(
+                self.handle_docker_event,
+                filters={"type": ["service", "container", "node"]},
+                on_connect=lambda: self.set_reconcile_mode(True),
+                on_disconnect=lambda: self.set_reconcile_mode(False),
+            )
+            self.timer_tasks["apply_docker_events"] = self.scheduler.task(
+                0.2, self.apply_docker_events
+            )
+
+    def set_reconcile_mode(self, enabled):
+        # poll services and nodes slowly while docker events are received, otherwise poll them as before.
+        interval = self.reconcile_interval if enabled else self.pull_interval
+        for name in ("get_service_info", "get_node_info"):
+            self.timer_tasks[name].interval = interval
+        display_message(
+            f"Docker events stream {'connected' if enabled else 'disconnected'}, "
+            f"poll services and nodes every {interval} seconds."
+        )
+
+    def handle_docker_event(self, event):
+        # mark services and nodes affected by a docker event, tasks of nodes are updated along with services
+        # and all nodes are collected again only for node events.
+        event_type = event.get("Type")
+        attributes = event.get("Actor", {}).get("Attributes", {}) or {}
+        if event_type == "node":
+            with self.lock:
+                self._dirty_nodes = True
+            return
+        if event_type == "service":
+            service_name = attributes.get("name", "")
+        elif attributes.get("com.docker.stack.namespace") == PREFIX_STACK_NAME:
+            service_name = attributes.get("com.docker.swarm.service.name", "")
+        else:
+            return
+        prefix = f"{PREFIX_STACK_NAME}_srv-"
+        if not service_name.startswith(prefix):
+            return
+        name = service_name.removeprefix(prefix)
+        with self.lock:
+            self._dirty_services.add(name)
+            if event_type == "service":
+                now = time.monotonic()
+                self._follow_ups.extend(
+                    (now + delay, name) for delay in self.FOLLOW_UP_DELAYS
+                )
+
+    def apply_docker_events(self):
+        # update entries marked by docker events, events received meanwhile are coalesced.
+        now = time.monotonic()
+        with self.lock:
+            names = self._dirty_services
+            names.update(name for due, name in self._follow_ups if due <= now)
+            self._follow_ups = [item for item in self._follow_ups if item[0] > now]
+            update_nodes = self._dirty_nodes
+            self._dirty_services = set()
+            self._dirty_nodes = False
+        if names:
+            self.update_service_info(names)
+        if update_nodes:
+            self.get_node_info()
+
+    @staticmethod
+    def get_ioc_signature(name, hosts):
+        # signature of files IOC information is computed from.
+        dir_path = os.path.join(REPOSITORY_PATH, name)
+        paths = [
+            os.path.join(dir_path, IOC_CONFIG_FILE),
+            os.path.join(dir_path, IOC_STATE_INFO_FILE),
+            os.path.join(dir_path, "src"),
+            os.path.join(dir_path, "project", "startup"),
+            os.path.join(SNAPSHOT_PATH, name),
+        ]
+        for host in hosts:
+            paths.append(os.path.join(MOUNT_PATH, host, name, IOC_CONFIG_FILE))
+            paths.append(os.path.join(MOUNT_PATH, host, name, "startup"))
+        return tree_signature(paths)
+
+    def get_ioc_name_of_path(self, path):
+        # name of IOC project a changed path belongs to, None if the path may affect all IOC projects.
+        for root, depth in ((REPOSITORY_PATH, 0), (SNAPSHOT_PATH, 0), (MOUNT_PATH, 1)):
+            rel_path = os.path.relpath(path, root)
+            if rel_path == os.curdir or rel_path.startswith(os.pardir):
+                continue
+            parts = rel_path.split(os.sep)
+            return parts[depth] if len(parts) > depth else None
+        return None
+
+    def get_changed_iocs(self, names):
+        """
+        Get names of IOC projects which may have changed since last refresh.
+
+        :param names: names of all IOC projects.
+        :return: set of names.
+        """
+        if self._ioc_watcher is None and not self._ioc_watch_failed:
+            roots = [REPOSITORY_PATH, SNAPSHOT_PATH, MOUNT_PATH]
+            # inotify misses changes made by other NFS clients.
+            network_roots = [
+                item
+                for item in roots
+                if get_filesystem_type(item) in NETWORK_FILESYSTEMS
+            ]
+            if network_roots:
+                self._ioc_watch_failed = True
+                display_message(
+                    f"TaskServer: {' '.join(network_roots)} on network file system, "
+                    f"scan modification time of IOC files instead of inotify."
+                )
+            else:
+                try:
+                    self._ioc_watcher = InotifyWatcher(
+                        roots, exclude_dirs=self.IOC_WATCH_EXCLUDE_DIRS
+                    )
+                except (OSError, AttributeError) as e:
+                    self._ioc_watch_failed = True
+                    display_message(
+                        f"TaskServer: inotify not available ({e}), scan modification time of IOC files instead."
+                    )
+        if self._ioc_watcher is None:
+            self.ioc_refresh_counters["mode"] = "mtime-scan"
+            return set(names)
+        self.ioc_refresh_counters["mode"] = "inotify"
+        try:
+            paths = self._ioc_watcher.read_changes()
+        except OSError as e:
+            if e.errno in (errno.ENOSPC, errno.ENOMEM):
+                # watch limit reached, switch to mtime scan for good instead of retrying every time.
+                self._ioc_watcher.close()
+                self._ioc_watcher = None
+                self._ioc_watch_failed = True
+                self.ioc_refresh_counters["mode"] = "mtime-scan"
+                display_message(
+                    f'TaskServer: Failed to watch IOC files ({e}), raise "fs.inotify.max_user_watches" '
+                    f"to use inotify, scan modification time of IOC files instead."
+                )
+                return set(names)
+            display_message(f"TaskServer: Failed to read inotify events ({e}), check all IOC projects.")
+            paths = None
+        if paths is None:
+            return set(names)
+        res = set()
+        for path in paths:
+            name = self.get_ioc_name_of_path(path)
+            if name is None:
+                return set(names)
+            res.add(name)
+        return res
+
+    def set_info(self, kind, name, info):
+        """
+        Set an entry of information, generation is increased if it changed apart from "update_at".
+
+        :param info: dict of entry, "update_at" may be float timestamp or string.
+        :return: whether the entry changed.
+        """
+        with self.lock:
+            res = getattr(self, self.INFO_KINDS[kind]).set(name, info)
+            if res is None:
+                return False
+            changed, removed_fields = res
+            self.generation += 1
+            self.kind_generations[kind] = self.generation
+            self.entry_generations[kind][name] = self.generation
+            self.removed_generations[kind].pop(name, None)
+            self.notify_listeners(
+                {
+                    "kind": kind,
+                    "name": name,
+                    "generation": self.generation,
+                    "changed": changed,
+                    "removed_fields": removed_fields,
+                }
+            )
+            return True
+
+    def remove_info(self, kind, name):
+        with self.lock:
+            if not getattr(self, self.INFO_KINDS[kind]).remove(name):
+                return False
+            self.generation += 1
+            self.kind_generations[kind] = self.generation
+            self.entry_generations[kind].pop(name, None)
+            self.removed_generations[kind][name] = self.generation
+            self.notify_listeners(
+                {
+                    "kind": kind,
+                    "name": name,
+                    "generation": self.generation,
+                    "removed": True,
+                }
+            )
+            return True
+
+    def load_state_snapshot(self):
+        """
+        Preload entries from snapshot file published by last run, they are answered right away and replaced
+        as tasks refresh them.
+
+        :return: count of entries preloaded.
+        """
+        snapshot = read_state_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return 0
+        count = 0
+        with snapshot, self.lock:
+            self.generation = max(self.generation, snapshot.generation)
+            for kind, (kind_generation, entries) in snapshot.load_all().items():
+                if kind not in self.INFO_KINDS:
+                    continue
+                data = getattr(self, self.INFO_KINDS[kind])
+                self.kind_generations[kind] = max(self.kind_generations[kind], kind_generation)
+                for name, (entry_generation, info) in entries.items():
+                    if name in data:
+                        continue
+                    data.set(name, info)
+                    self._preloaded[kind].add(name)
+                    self.entry_generations[kind][name] = entry_generation
+                    count += 1
+        self.snapshot_counters["preloaded"] = count
+        return count
+
+    def publish_state_snapshot(self, force=False):
+        # write snapshot file if state changed, or periodically to keep it from being regarded as expired.
+        with self.lock:
+            if (
+                not force
+                and self.generation == self._published_generation
+                and time.time() - self._published_at < STATE_SNAPSHOT_MAX_AGE / 3
+            ):
+                return
+            generation = self.generation
+            # entries are rendered as new dicts under lock, and serialized outside lock.
+            kinds = {
+                kind: (
+                    self.kind_generations[kind],
+                    {
+                        name: (self.entry_generations[kind].get(name, 0), info)
+                        for name, info in getattr(self, attr).items()
+                    },
+                )
+                for kind, attr in self.INFO_KINDS.items()
+            }
+        start_time = time.monotonic()
+        try:
+            size = write_state_snapshot(self.snapshot_path, generation, kinds)
+        except OSError as e:
+            display_message(f"TaskServer: Failed to publish state snapshot ({e}).")
+            return
+        self._published_generation = generation
+        self._published_at = time.time()
+        self.snapshot_counters["publishes"] += 1
+        self.snapshot_counters["size"] = size
+        self.snapshot_counters["duration"] = round(time.monotonic() - start_time, 4)
+
+    def drop_preloaded(self, kind, names):
+        # remove preloaded entries of kind which are not in names found by a full refresh.
+        preloaded = self._preloaded[kind]
+        if not preloaded:
+            return
+        for name in preloaded - set(names):
+            self.remove_info(kind, name)
+        preloaded.clear()
+
+    def notify_listeners(self, delta):
+        # listeners are called with lock held, they should only hand delta over.
+        for listener in list(self.listeners):
+            try:
+                listener(delta)
+            except Exception as e:
+                print(f"Error in TaskServer.notify_listeners: {e}")
+
+    def query(self, kind, names=None, fields=None, since_generation=None):
+        """
+        Query entries of information.
+
+        :param kind: "ioc", "service" or "node".
+        :param names: list of names or glob patterns of entries, all entries if not given.
+        :param fields: list of fields of entries to return, all fields if not given.
+        :param since_generation: return only entries changed after this generation, and names of entries
+            removed after it.
+        :return: dict of response, with "generation" of the kind and "data" of {name: entry}.
+        """
+        from fnmatch import fnmatchcase
+
+        def match(name):
+            return names is None or any(fnmatchcase(name, item) for item in names)
+
+        with self.lock:
+            data = getattr(self, self.INFO_KINDS[kind])
+            generation = self.kind_generations[kind]
+            res = {"kind": kind, "generation": generation}
+            selected = [name for name in data.keys() if match(name)]
+            if since_generation is not None:
+                res["partial"] = True
+                res["unchanged"] = since_generation >= generation
+                selected = [
+                    name
+                    for name in selected
+                    if self.entry_generations[kind].get(name, 0) > since_generation
+                ]
+                res["removed"] = sorted(
+                    name
+                    for name, item in self.removed_generations[kind].items()
+                    if item > since_generation and match(name)
+                )
+            res["data"] = {name: data.get(name, fields) for name in sorted(selected)}
+            return res
+
+    def list_mount_hosts(self):
+        return (
+            [
+                item
+                for item in os.listdir(MOUNT_PATH)
+                if os.path.isdir(os.path.join(MOUNT_PATH, item))
+            ]
+            if os.path.isdir(MOUNT_PATH)
+            else []
+        )
+
+    def compute_ioc_info(self, name, hosts):
+        # evaluate information of an IOC project in repository.
+        item = IOC(dir_path=os.path.join(REPOSITORY_PATH, name))
+        info = {
+            "name": item.name,
+            "host": item.get_config("host"),
+            "state": item.state_manager.get_config("state"),
+            "status": item.state_manager.get_config("status"),
+            "snapshot_consistency": item.check_snapshot_consistency()[1],
+            "deploy_consistency": item.check_deploy_consistency()[1],
+            "update_at": time.time(),
         }
+        # signature is taken after evaluation, as files may be repaired by IOC initialization.
+        self._ioc_signatures[name] = self.get_ioc_signature(name, hosts)
+        self.set_info("ioc", item.name, info)
+
+    def drop_ioc_info(self, name):
+        self._ioc_signatures.pop(name, None)
+        return self.remove_info("ioc", name)
 
     def get_ioc_info(self):
-        self.ioc_list = get_all_ioc()
-        for item in self.ioc_list:
-            self.ioc_info[item.name] = {
-                "name": item.name,
-                "host": item.get_config("host"),
-                "state": item.state_manager.get_config("state"),
-                "status": item.state_manager.get_config("status"),
-                "snapshot_consistency": item.check_snapshot_consistency()[1],
-                "deploy_consistency": item.check_deploy_consistency()[1],
-                "update_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        start_time = time.monotonic()
+        with self._ioc_lock:
+            if os.path.isdir(REPOSITORY_PATH):
+                names = {
+                    item
+                    for item in os.listdir(REPOSITORY_PATH)
+                    if os.path.isdir(os.path.join(REPOSITORY_PATH, item))
+                }
+            else:
+                names = set()
+            hosts = self.list_mount_hosts()
+            candidates = self.get_changed_iocs(names | set(self._ioc_signatures.keys()))
+            recomputed = 0
+            removed = 0
+            for name in sorted(candidates):
+                if name not in names:
+                    if name in self._ioc_signatures:
+                        self.drop_ioc_info(name)
+                        removed += 1
+                    continue
+                if self._ioc_signatures.get(name) == self.get_ioc_signature(name, hosts):
+                    continue
+                self.compute_ioc_info(name, hosts)
+                recomputed += 1
+            self.drop_preloaded("ioc", self._ioc_signatures.keys())
+        counters = self.ioc_refresh_counters
+        counters["candidates"] = len(candidates)
+        counters["recomputed"] = recomputed
+        counters["removed"] = removed
+        counters["total"] = len(self._ioc_signatures)
+        counters["duration"] = round(time.monotonic() - start_time, 3)
+        counters["refreshes"] += 1
+        counters["recomputed_total"] += recomputed
+        return recomputed + removed > 0
+
+    def refresh(self, kind, names):
+        """
+        Recompute entries right away, regardless of whether changes were found.
+
+        :param kind: "ioc", "service" or "node", all nodes are refreshed for "node".
+        :param names: list of names or glob patterns.
+        :return: list of names refreshed.
+        """
+        from fnmatch import fnmatchcase
+
+        def expand(known):
+            return sorted(
+                {item for item in known if any(fnmatchcase(item, name) for name in names)}
+                | {name for name in names if not any(c in name for c in "*?[")}
+            )
+
+        if kind == "ioc":
+            with self._ioc_lock:
+                repository_names = (
+                    os.listdir(REPOSITORY_PATH) if os.path.isdir(REPOSITORY_PATH) else []
+                )
+                res = expand(set(repository_names) | set(self._ioc_signatures.keys()))
+                hosts = self.list_mount_hosts()
+                for name in res:
+                    if os.path.isdir(os.path.join(REPOSITORY_PATH, name)):
+                        self.compute_ioc_info(name, hosts)
+                    else:
+                        self.drop_ioc_info(name)
+            return res
+        elif kind == "service":
+            res = expand(set(self.service_list.keys()))
+            self.update_service_info(res)
+            return res
+        else:
+            self.get_node_info()
+            return sorted(self.node_info.keys())
+
+    @staticmethod
+    def make_service_info(service, docker_info):
+        # information of a managed service from what collect_service_info() got, None if not deployed.
+        if docker_info is None:
+            return {
+                "status": f'Undeployed ({"Available" if service.is_available else "Unavailable"})',
+                "replicas": "-/-",
+                "update_at": time.time(),
             }
+        return dict(docker_info, update_at=time.time())
 
     def get_service_info(self):
+        # return whether any service changed.
+        generation = self.generation
         self.service_list = SwarmManager().services
+        docker_infos, _ = collect_service_info()
         for item in self.service_list.values():
-            self.service_info[item.name] = {
-                "status": item.current_state,
-                "replicas": item.replicas,
-                "update_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
+            self.set_info(
+                "service",
+                item.name,
+                self.make_service_info(item, docker_infos.get(item.service_name)),
+            )
+        self.drop_preloaded("service", self.service_list.keys())
+        return self.kind_generations["service"] > generation
+
+    def update_service_info(self, names):
+        # update information of the given services only, and their tasks in information of nodes.
+        if any(name not in self.service_list for name in names):
+            self.service_list = SwarmManager().services
+        items = [self.service_list[name] for name in names if name in self.service_list]
+        if not items:
+            return
+        service_names = [item.service_name for item in items]
+        docker_infos, node_tasks = collect_service_info(service_names)
+        for item in items:
+            self.set_info(
+                "service",
+                item.name,
+                self.make_service_info(item, docker_infos.get(item.service_name)),
+            )
+        self.update_node_tasks(service_names, node_tasks)
+
+    def update_node_tasks(self, service_names, node_tasks):
+        """
+        Update tasks of the given services in information of nodes, without collecting nodes again.
+
+        :param node_tasks: dict of {service name: {node ID: task state}}.
+        """
+        for hostname, info in self.node_info.items():
+            tasks = dict(info.get("tasks", {}))
+            for service_name in service_names:
+                state = node_tasks.get(service_name, {}).get(info.get("id"))
+                if state:
+                    tasks[service_name] = state
+                else:
+                    tasks.pop(service_name, None)
+            if tasks != info.get("tasks", {}):
+                info["tasks"] = tasks
+                info["update_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                self.set_info("node", hostname, info)
 
     def get_node_info(self):
-        import docker
-        docker_client = docker.from_env()
-        nodes = docker_client.nodes.list()
-        for node in nodes:
-            self.node_info[node.attrs["Description"]["Hostname"]] = {
-                "ip": node.attrs["Status"]["Addr"],
-                "state": node.attrs["Status"]["State"],
-                "role": node.attrs["Spec"]["Role"],
-                "availability": node.attrs["Spec"]["Availability"],
-                "labels": node.attrs["Spec"]["Labels"],
-                "update_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
+        # return whether any node changed.
+        generation = self.generation
+        nodes = collect_node_info()
+        for name, info in nodes.items():
+            self.set_info("node", name, info)
+        self.drop_preloaded("node", nodes.keys())
+        return self.kind_generations["node"] > generation
 
     def start_task(self, name):
         if name in self.timer_tasks.keys():
@@ -161,6 +759,7 @@ class TaskServer:
             self.timer_tasks[name].stop()
 
     def start_all_tasks(self):
+        self.scheduler.start()
         for item in self.timer_tasks.values():
             item.start()
 
@@ -171,17 +770,16 @@ class TaskServer:
     def shutdown(self):
         for item in self.timer_tasks.values():
             item.shutdown()
+        self.scheduler.shutdown()
+        if self._ioc_watcher is not None:
+            self._ioc_watcher.close()
+            self._ioc_watcher = None
+        self.publish_state_snapshot(force=True)
 
     def get_tasks_status(self):
         status_info = {}
         for name, task in self.timer_tasks.items():
-            status_info[name] = {
-                "status": "running" if task.is_running else "stopped",
-                "interval": task.interval,
-                "function": task.function.__name__,
-                "args": task.args,
-                "kwargs": task.kwargs,
-            }
+            status_info[name] = task.get_status()
         return status_info
 
 
@@ -250,22 +848,33 @@ class SocketServer:
             self.cleanup_socket()
             display_message("Socket server stopped.")
 
+    def handle_request(self, cmd):
+        # return response for a request.
+        display_message(f'echo request "{cmd}"', with_prompt=self.with_cli)
+        return cmd
+
     def handle_client_request(self, sock):
         try:
             cmd = receive_message(sock)
             if cmd:
                 if self.connection_debug:
-                    display_message(f'Receive request "{cmd}" from {sock}')
-                cmd = cmd.strip()
-                send_message(sock, cmd)
-                display_message(f'echo request "{cmd}"')
+                    display_message(
+                        f'Receive request "{cmd}" from {sock}',
+                        with_prompt=self.with_cli,
+                    )
+                send_message(sock, self.handle_request(cmd.strip()))
             else:
                 if self.connection_debug:
-                    display_message(f"Close connection {sock}")
+                    display_message(
+                        f"Close connection {sock}", with_prompt=self.with_cli
+                    )
                 sock.close()
                 self.listen_sockets.remove(sock)
         except Exception as e:
-            display_message(f"Exception occurred when communicating with {sock}: {e}")
+            display_message(
+                f"Exception occurred when communicating with {sock}: {e}",
+                with_prompt=self.with_cli,
+            )
             self.listen_sockets.remove(sock)
             sock.close()
 
@@ -292,15 +901,289 @@ class SocketServer:
                 sys.exit(1)
 
 
-class IocDockServer(SocketServer):
-    def __init__(self, with_cli=True, connection_debug=True, pull_interval=10):
+class AsyncSocketServer(SocketServer):
+    """
+    Socket server running an asyncio event loop in a thread, each connection is served by its own task so that
+    slow or stalled clients do not block others. Requests are handled in a thread pool and use the same
+    4-byte length-prefixed protocol as SocketServer.
+    """
+
+    def __init__(
+        self,
+        with_cli=True,
+        connection_debug=True,
+        max_connections=64,
+        idle_timeout=60,
+        read_timeout=10,
+        write_timeout=10,
+        shutdown_timeout=5,
+        max_request_size=1 << 20,
+        request_workers=4,
+    ):
+        super().__init__(with_cli=with_cli, connection_debug=connection_debug)
+        self.max_connections = max_connections
+        self.idle_timeout = idle_timeout
+        self.read_timeout = read_timeout
+        self.write_timeout = write_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self.max_request_size = max_request_size
+        self.request_workers = request_workers
+
+        self.loop = None
+        self._stop_future = None
+        self._started = threading.Event()
+        self._start_error = None
+        self._connections = {}
+        self._executor = None
+
+    def start_listen(self):
+        from concurrent.futures import ThreadPoolExecutor
+
+        if self.serving:
+            return
+        display_message("Starting socket server...")
+        self.cleanup_socket()
+        self._started.clear()
+        self._start_error = None
+        self._executor = ThreadPoolExecutor(max_workers=self.request_workers)
+        self.server_thread = threading.Thread(target=self.process_loop, daemon=False)
+        self.server_thread.start()
+        self._started.wait()
+        if self._start_error is not None:
+            self.server_thread.join()
+            self._executor.shutdown(wait=False)
+            self.cleanup_socket()
+            display_message(f"Failed to start socket server: {self._start_error}")
+            if not self.with_cli:
+                sys.exit(1)
+        else:
+            display_message("Socket server started.")
+
+    def stop_listen(self):
+        if self.serving:
+            display_message("Stopping socket server...")
+            self.serving = False
+            self.loop.call_soon_threadsafe(self._stop_future.cancel)
+            self.server_thread.join()
+            self._executor.shutdown(wait=True)
+            self.cleanup_socket()
+            display_message("Socket server stopped.")
+
+    def process_loop(self):
+        import asyncio
+
+        try:
+            asyncio.run(self.serve())
+        except Exception as e:
+            if not self._started.is_set():
+                self._start_error = e
+                self._started.set()
+                return
+            display_message(f"Error encountered while running the process loop: {e}")
+            self.serving = False
+            if not self.with_cli:
+                display_message(f"Socket server exited.")
+                sys.exit(1)
+
+    async def serve(self):
+        import asyncio
+
+        self.loop = asyncio.get_running_loop()
+        self._stop_future = self.loop.create_future()
+        server = await asyncio.start_unix_server(
+            self.handle_connection, path=self.socket_path
+        )
+        os.chmod(self.socket_path, 0o777)
+        self.serving = True
+        self._started.set()
+        try:
+            await self._stop_future
+        except asyncio.CancelledError:
+            pass
+        # stop accepting connections and let requests being processed finish.
+        server.close()
+        tasks = list(self._connections.keys())
+        for task, state in self._connections.items():
+            if not state["busy"]:
+                task.cancel()
+        if tasks:
+            _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
+
+    async def handle_connection(self, reader, writer):
+        import asyncio
+
+        sock = writer.get_extra_info("socket")
+        if not self.serving or len(self._connections) >= self.max_connections:
+            display_message(
+                f"Reject connection {sock}, {len(self._connections)} connections are open.",
+                with_prompt=self.with_cli,
+            )
+            writer.close()
+            return
+        state = {"busy": False}
+        self._connections[asyncio.current_task()] = state
+        self.listen_sockets.append(sock)
+        if self.connection_debug:
+            display_message(f"Connection from {sock}", with_prompt=self.with_cli)
+        try:
+            while self.serving:
+                try:
+                    header = await asyncio.wait_for(
+                        reader.readexactly(4), self.idle_timeout
+                    )
+                    length = struct.unpack("<I", header)[0]
+                    if length > self.max_request_size:
+                        display_message(
+                            f"Request of {length} bytes from {sock} exceeds limit, close connection.",
+                            with_prompt=self.with_cli,
+                        )
+                        break
+                    data = await asyncio.wait_for(
+                        reader.readexactly(length), self.read_timeout
+                    )
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except asyncio.TimeoutError:
+                    if self.connection_debug:
+                        display_message(
+                            f"Connection {sock} timed out.", with_prompt=self.with_cli
+                        )
+                    break
+                cmd = data.decode().strip()
+                if self.connection_debug:
+                    display_message(
+                        f'Receive request "{cmd}" from {sock}', with_prompt=self.with_cli
+                    )
+                # requests served as a stream keep the connection until it ends.
+                if await self.handle_stream_request(cmd, reader, writer):
+                    break
+                # requests being processed are finished before shutdown.
+                state["busy"] = True
+                response = await self.loop.run_in_executor(
+                    self._executor, self.handle_request, cmd
+                )
+                if isinstance(response, str):
+                    response = response.encode("utf-8")
+                writer.write(struct.pack("<I", len(response)) + response)
+                await asyncio.wait_for(writer.drain(), self.write_timeout)
+                state["busy"] = False
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            display_message(
+                f"Exception occurred when communicating with {sock}: {e}",
+                with_prompt=self.with_cli,
+            )
+        finally:
+            self._connections.pop(asyncio.current_task(), None)
+            if sock in self.listen_sockets:
+                self.listen_sockets.remove(sock)
+            if self.connection_debug:
+                display_message(f"Close connection {sock}", with_prompt=self.with_cli)
+            writer.close()
+
+    async def handle_stream_request(self, cmd, reader, writer):
+        # serve a request that keeps the connection open, return False if it is not such a request.
+        return False
+
+
+class Subscription:
+    """
+    Deltas pending to be pushed to a subscriber. Deltas of the same entry are merged while the subscriber
+    is slow, so pending deltas are never more than the entries subscribed.
+    """
+
+    def __init__(self, kinds, names=None, fields=None):
+        import asyncio
+
+        self.kinds = kinds
+        self.names = names
+        self.fields = fields
+        self.pending = {}
+        self.event = asyncio.Event()
+
+    def match(self, delta):
+        from fnmatch import fnmatchcase
+
+        return delta["kind"] in self.kinds and (
+            self.names is None
+            or any(fnmatchcase(delta["name"], item) for item in self.names)
+        )
+
+    def push(self, delta):
+        # called in event loop.
+        if not self.match(delta):
+            return
+        key = (delta["kind"], delta["name"])
+        if not delta.get("removed"):
+            changed = delta["changed"]
+            removed_fields = delta.get("removed_fields", [])
+            if self.fields:
+                changed = {
+                    field: value for field, value in changed.items() if field in self.fields
+                }
+                removed_fields = [item for item in removed_fields if item in self.fields]
+                if not changed and not removed_fields:
+                    return
+            delta = dict(delta, changed=changed, removed_fields=removed_fields)
+            pending = self.pending.get(key)
+            if pending is not None and not pending.get("removed"):
+                delta["changed"] = dict(
+                    {
+                        field: value
+                        for field, value in pending["changed"].items()
+                        if field not in removed_fields
+                    },
+                    **changed,
+                )
+                delta["removed_fields"] = sorted(
+                    (set(pending["removed_fields"]) - set(changed.keys()))
+                    | set(removed_fields)
+                )
+        self.pending[key] = delta
+        self.event.set()
+
+    def take(self):
+        res = sorted(self.pending.values(), key=lambda x: x["generation"])
+        self.pending = {}
+        self.event.clear()
+        return res
+
+
+class IocDockServer(AsyncSocketServer):
+    def __init__(
+        self,
+        with_cli=True,
+        connection_debug=True,
+        pull_interval=10,
+        reconcile_interval=60,
+        watch_events=True,
+        metrics_port=None,
+    ):
         super().__init__(with_cli=with_cli, connection_debug=connection_debug)
-        self.task_server = TaskServer(pull_interval=pull_interval)
+        # port of http listener for prometheus, METRICS_PORT if not given, disabled if 0.
+        self.metrics_port = METRICS_PORT if metrics_port is None else metrics_port
+        self.metrics_server = None
+        # seconds between heartbeat messages to idle subscribers, less than receive timeout of SocketClient.
+        self.heartbeat_interval = 5
+        self.task_server = TaskServer(
+            pull_interval=pull_interval,
+            reconcile_interval=reconcile_interval,
+            watch_events=watch_events,
+        )
 
     def run(self):
+        count = self.task_server.load_state_snapshot()
+        if count:
+            display_message(f"Preloaded {count} entries from state snapshot.")
         display_message("Starting all timer tasks...")
         self.task_server.start_all_tasks()
         self.start_listen()
+        self.start_metrics()
         if self.with_cli:
             self.console_interface()
         else:
@@ -314,6 +1197,24 @@ class IocDockServer(SocketServer):
         display_message("Shutting down all timer tasks...")
         self.task_server.shutdown()
         self.stop_listen()
+        self.stop_metrics()
+
+    def start_metrics(self):
+        if not self.metrics_port or self.metrics_server is not None:
+            return
+        metrics_server = MetricsServer(self.metrics_port, lambda: render_metrics(self.task_server))
+        try:
+            metrics_server.start()
+        except OSError as e:
+            display_message(f"Failed to start metrics listener on port {self.metrics_port}: {e}")
+            return
+        self.metrics_server = metrics_server
+        display_message(f"Metrics listener started on port {self.metrics_port}.")
+
+    def stop_metrics(self):
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
 
     def console_interface(self):
         help_str = (
@@ -340,11 +1241,30 @@ class IocDockServer(SocketServer):
                                 if value["status"] == "running"
                                 else f'"\033[31m{value["status"]}\033[0m", '
                             ),
-                            f'"interval": {value["interval"]}, '
-                            f'"function": "{value["function"]}", '
-                            f'"args": {value["args"]}, '
-                            f'"kwargs": {value["kwargs"]}}}',
+                            ", ".join(
+                                f'"{k}": {json.dumps(v, default=str)}'
+                                for k, v in value.items()
+                                if k != "status"
+                            )
+                            + "}",
                         ),
+                    counters = self.task_server.ioc_refresh_counters
+                    print(
+                        f'IOC refresh ({counters["mode"]}): {counters["recomputed"]} recomputed, '
+                        f'{counters["removed"]} removed, {counters["candidates"]} changed of '
+                        f'{counters["total"]} IOC projects in {counters["duration"]}s, '
+                        f'{counters["recomputed_total"]} recomputed in {counters["refreshes"]} refreshes.'
+                    )
+                    print(
+                        f"Metrics listener on port {self.metrics_port}."
+                        if self.metrics_server is not None
+                        else "Metrics listener disabled."
+                    )
+                    counters = self.task_server.snapshot_counters
+                    print(
+                        f'State snapshot: {counters["publishes"]} published, {counters["size"]} bytes '
+                        f'written in {counters["duration"]}s, {counters["preloaded"]} entries preloaded.'
+                    )
                 elif command == "start listen":
                     if not self.serving:
                         self.start_listen()
@@ -389,11 +1309,11 @@ class IocDockServer(SocketServer):
 
     def handle_server_cmd(self, cmd):
         if cmd == "ioc info":
-            pprint.pprint(self.task_server.ioc_info)
+            pprint.pprint(self.task_server.ioc_info.to_dict())
         elif cmd == "service info":
-            pprint.pprint(self.task_server.service_info)
+            pprint.pprint(self.task_server.service_info.to_dict())
         elif cmd == "node info":
-            pprint.pprint(self.task_server.node_info)
+            pprint.pprint(self.task_server.node_info.to_dict())
         elif cmd == "start all":
             self.task_server.start_all_tasks()
         elif cmd == "stop all":
@@ -405,70 +1325,215 @@ class IocDockServer(SocketServer):
         else:
             print(f"{cmd}: subcommand not found")
 
-    def handle_client_request(self, sock):
+    def handle_json_request(self, cmd):
+        """
+        Handle a request of json envelope:
+            {"query": "ioc info" | "service info" | "node info",
+             "names": [names or glob patterns], "fields": [fields], "refresh": [names or glob patterns],
+             "since_generation": generation}
+        entries named in "refresh" are recomputed before the query. Response is the json of
+        TaskServer.query(), with "refreshed" names, or {"error": message}.
+        """
         try:
-            cmd = receive_message(sock)
-            if cmd:
-                if self.connection_debug:
-                    display_message(
-                        f'Receive request "{cmd}" from {sock}',
-                        with_prompt=self.with_cli,
-                    )
-                cmd = cmd.strip()
-                if cmd == "ioc info":
-                    if self.connection_debug:
-                        display_message(
-                            f'send response for "{cmd}"', with_prompt=self.with_cli
-                        )
-                    json_string = json.dumps(
-                        self.task_server.ioc_info, ensure_ascii=False
-                    )
-                    send_message(sock, json_string)
-                elif cmd == "service info":
-                    if self.connection_debug:
-                        display_message(
-                            f'send response for "{cmd}"', with_prompt=self.with_cli
-                        )
-                    json_string = json.dumps(
-                        self.task_server.service_info, ensure_ascii=False
-                    )
-                    send_message(sock, json_string)
-                elif cmd == "node info":
-                    if self.connection_debug:
-                        display_message(
-                            f'send response for "{cmd}"', with_prompt=self.with_cli
-                        )
-                    json_string = json.dumps(
-                        self.task_server.node_info, ensure_ascii=False
-                    )
-                    send_message(sock, json_string)
+            request = json.loads(cmd)
+            if not isinstance(request, dict):
+                raise ValueError("request is not a json object")
+            kind = str(request.get("query", "")).strip().removesuffix(" info")
+            if kind not in self.task_server.INFO_KINDS:
+                raise ValueError(f'invalid query "{request.get("query")}"')
+            items = self.parse_string_lists(request, ("names", "fields", "refresh"))
+            since_generation = request.get("since_generation")
+            if since_generation is not None:
+                since_generation = int(since_generation)
+        except (ValueError, TypeError) as e:
+            if self.connection_debug:
+                display_message(f"invalid request, {e}", with_prompt=self.with_cli)
+            return json.dumps({"error": f"invalid request, {e}"})
+        refreshed = []
+        if items["refresh"]:
+            refreshed = self.task_server.refresh(kind, items["refresh"])
+            # CLI reads state snapshot right after requesting refresh, publish it without waiting for task.
+            self.task_server.publish_state_snapshot()
+        res = self.task_server.query(
+            kind,
+            names=items["names"],
+            fields=items["fields"],
+            since_generation=since_generation,
+        )
+        if items["refresh"]:
+            res["refreshed"] = refreshed
+        if self.connection_debug:
+            display_message(
+                f'send {len(res["data"])} {kind} entries of generation {res["generation"]}',
+                with_prompt=self.with_cli,
+            )
+        return json.dumps(res, ensure_ascii=False)
+
+    @staticmethod
+    def parse_string_lists(request, keys):
+        """
+        Get values of "keys" in request, a string is taken as a list of one string.
+        ValueError is raised if a value is neither None nor a list of strings.
+        """
+        items = {}
+        for key in keys:
+            value = request.get(key)
+            if isinstance(value, str):
+                value = [value]
+            if value is not None and not (
+                isinstance(value, list) and all(isinstance(i, str) for i in value)
+            ):
+                raise ValueError(f'"{key}" should be a list of strings')
+            items[key] = value
+        return items
+
+    async def handle_stream_request(self, cmd, reader, writer):
+        if not cmd.startswith("{"):
+            return False
+        try:
+            request = json.loads(cmd)
+        except ValueError:
+            return False
+        if not isinstance(request, dict) or "subscribe" not in request:
+            return False
+        await self.serve_subscription(request, reader, writer)
+        return True
+
+    async def serve_subscription(self, request, reader, writer):
+        """
+        Serve a subscription request:
+            {"subscribe": ["ioc", "service", "node"], "names": [names or glob patterns], "fields": [fields]}
+        a message with "snapshot" of entries subscribed is sent first, then messages with "deltas" of changes,
+        each delta is {"kind", "name", "generation", "changed": {field: value}, "removed_fields": [fields]}
+        or {..., "removed": true}.
+        Heartbeat messages are sent when idle. Subscribers too slow to receive are disconnected.
+        """
+        import asyncio
+
+        def send(message):
+            data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+            writer.write(struct.pack("<I", len(data)) + data)
+            return asyncio.wait_for(writer.drain(), self.write_timeout)
+
+        kinds = request.get("subscribe")
+        kinds = [kinds] if isinstance(kinds, str) else kinds
+        try:
+            items = self.parse_string_lists(request, ("names", "fields"))
+        except ValueError as e:
+            if self.connection_debug:
+                display_message(f"invalid request, {e}", with_prompt=self.with_cli)
+            await send({"error": f"invalid request, {e}"})
+            return
+        names = items["names"]
+        fields = items["fields"]
+        if (
+            not isinstance(kinds, list)
+            or not kinds
+            or any(item not in self.task_server.INFO_KINDS for item in kinds)
+        ):
+            await send({"error": f'invalid subscription "{request.get("subscribe")}"'})
+            return
+
+        subscription = Subscription(kinds, names=names, fields=fields)
+        loop = self.loop
+
+        def listener(delta):
+            loop.call_soon_threadsafe(subscription.push, delta)
+
+        # snapshot is taken with listener added under the same lock so that no change is missed.
+        with self.task_server.lock:
+            self.task_server.listeners.append(listener)
+            snapshot = {
+                kind: self.task_server.query(kind, names=names, fields=fields)["data"]
+                for kind in kinds
+            }
+            generation = self.task_server.generation
+        if self.connection_debug:
+            display_message(
+                f"Subscription of {kinds} from {writer.get_extra_info('socket')}.",
+                with_prompt=self.with_cli,
+            )
+        read_task = asyncio.ensure_future(reader.read(1))
+        event_task = None
+        try:
+            await send(
+                {"subscribed": kinds, "generation": generation, "snapshot": snapshot}
+            )
+            while self.serving:
+                if event_task is None or event_task.done():
+                    event_task = asyncio.ensure_future(subscription.event.wait())
+                await asyncio.wait(
+                    {read_task, event_task},
+                    timeout=self.heartbeat_interval,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                if read_task.done():
+                    # subscriber closed the connection, or sent data not expected.
+                    break
+                deltas = subscription.take()
+                if deltas:
+                    await send({"generation": deltas[-1]["generation"], "deltas": deltas})
                 else:
-                    if self.connection_debug:
-                        display_message(
-                            f'invalid request "{cmd}"', with_prompt=self.with_cli
-                        )
-                    send_message(sock, "invalid request")
-            else:
-                if self.connection_debug:
-                    display_message(
-                        f"Close connection {sock}", with_prompt=self.with_cli
+                    await send(
+                        {"heartbeat": True, "generation": self.task_server.generation}
                     )
-                sock.close()
-                self.listen_sockets.remove(sock)
-        except Exception as e:
+        except asyncio.TimeoutError:
             display_message(
-                f"Exception occurred when communicating with {sock}: {e}",
+                f"Subscriber {writer.get_extra_info('socket')} too slow, close connection.",
                 with_prompt=self.with_cli,
             )
-            self.listen_sockets.remove(sock)
-            sock.close()
+        finally:
+            with self.task_server.lock:
+                if listener in self.task_server.listeners:
+                    self.task_server.listeners.remove(listener)
+            for task in (read_task, event_task):
+                if task is not None and not task.done():
+                    task.cancel()
+
+    def handle_request(self, cmd):
+        if cmd.startswith("{"):
+            return self.handle_json_request(cmd)
+        elif cmd == "task status":
+            if self.connection_debug:
+                display_message(f'send response for "{cmd}"', with_prompt=self.with_cli)
+            return json.dumps(self.task_server.get_tasks_status(), default=str)
+        elif cmd in ("ioc info", "service info", "node info"):
+            if self.connection_debug:
+                display_message(f'send response for "{cmd}"', with_prompt=self.with_cli)
+            with self.task_server.lock:
+                return json.dumps(
+                    getattr(self.task_server, cmd.replace(" ", "_")).to_dict(),
+                    ensure_ascii=False,
+                )
+        else:
+            if self.connection_debug:
+                display_message(f'invalid request "{cmd}"', with_prompt=self.with_cli)
+            return "invalid request"
 
 
 if __name__ == "__main__":
     # s = SocketServer()
     # s.run()
+    # "--no-events": poll services and nodes only, for docker daemons not reachable by events stream.
+    watch_events = "--no-events" not in sys.argv
+    # "--metrics-port PORT": serve http /metrics for prometheus on PORT, METRICS_PORT in settings by default.
+    metrics_port = None
+    if "--metrics-port" in sys.argv:
+        try:
+            metrics_port = int(sys.argv[sys.argv.index("--metrics-port") + 1])
+        except (IndexError, ValueError):
+            print("IocDockServer: Failed. Invalid port for option --metrics-port.")
+            sys.exit(1)
     if "--server" in sys.argv:
-        iocds = IocDockServer(with_cli=False, connection_debug=False, pull_interval=5)
+        iocds = IocDockServer(
+            with_cli=False,
+            connection_debug=False,
+            pull_interval=5,
+            watch_events=watch_events,
+            metrics_port=metrics_port,
+        )
     else:
-        iocds = IocDockServer(pull_interval=5)
+        iocds = IocDockServer(
+            pull_interval=5, watch_events=watch_events, metrics_port=metrics_port
+        )
     iocds.run()
@@ -0,0 +1,211 @@
+import threading
+
+# metrics exported, {name: (type, help)}, in order of exposition.
+METRICS = {
+    "iocdock_ioc_info": ("gauge", "IOC project in repository, with host, state and status as labels."),
+    "iocdock_ioc_snapshot_consistent": (
+        "gauge",
+        "Whether IOC project is consistent with its snapshot, with result of check as label.",
+    ),
+    "iocdock_ioc_deploy_consistent": (
+        "gauge",
+        "Whether IOC project is consistent with its deployed files, with result of check as label.",
+    ),
+    "iocdock_ioc_update_timestamp_seconds": (
+        "gauge",
+        "Unix time when information of IOC project was evaluated.",
+    ),
+    "iocdock_service_status": ("gauge", "Swarm service, with current state of its tasks as label."),
+    "iocdock_service_replicas_running": ("gauge", "Running replicas of swarm service."),
+    "iocdock_service_replicas_desired": ("gauge", "Desired replicas of swarm service."),
+    "iocdock_node_info": ("gauge", "Swarm node, with state, availability and role as labels."),
+    "iocdock_task_state": ("gauge", "Task of stack service desired running on node, with task state as label."),
+    "iocdock_state_generation": ("gauge", "Generation of IocDockServer state, increased on each change."),
+    "iocdock_server_task_runs_total": ("counter", "Runs of IocDockServer periodic task."),
+    "iocdock_server_task_duration_seconds_total": ("counter", "Total run time of IocDockServer periodic task."),
+    "iocdock_server_task_last_duration_seconds": ("gauge", "Run time of last run of IocDockServer periodic task."),
+    "iocdock_server_task_max_duration_seconds": ("gauge", "Longest run time of IocDockServer periodic task."),
+    "iocdock_server_task_interval_seconds": ("gauge", "Current interval of IocDockServer periodic task."),
+    "iocdock_server_task_overruns_total": ("counter", "Runs of IocDockServer periodic task longer than its interval."),
+    "iocdock_server_task_errors_total": ("counter", "Runs of IocDockServer periodic task raising exception."),
+    "iocdock_ioc_refresh_recomputed": ("gauge", "IOC projects recomputed by last refresh of IOC information."),
+    "iocdock_ioc_refresh_candidates": ("gauge", "IOC projects found changed by last refresh of IOC information."),
+}
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_sample(name, labels, value):
+    if labels:
+        label_str = ",".join(f'{key}="{escape_label(item)}"' for key, item in labels.items())
+        return f"{name}{{{label_str}}} {value}"
+    return f"{name} {value}"
+
+
+def parse_replicas(replicas):
+    # "running/desired" printed by docker stack services, None if not available.
+    try:
+        running, desired = str(replicas).strip().split()[0].split("/")
+        return int(running), int(desired)
+    except (ValueError, IndexError):
+        return None
+
+
+def render_metrics(task_server):
+    """
+    Render metrics in Prometheus text exposition format from state cached by TaskServer, no information
+    is collected for it.
+
+    :return: str of metrics.
+    """
+    samples = {name: [] for name in METRICS}
+    with task_server.lock:
+        for name, info in task_server.ioc_info.items():
+            samples["iocdock_ioc_info"].append(
+                (
+                    {
+                        "ioc": name,
+                        "host": info.get("host", ""),
+                        "state": info.get("state", ""),
+                        "status": info.get("status", ""),
+                    },
+                    1,
+                )
+            )
+            for key in ("snapshot_consistency", "deploy_consistency"):
+                if key in info:
+                    samples[f"iocdock_ioc_{key.split('_')[0]}_consistent"].append(
+                        (
+                            {"ioc": name, "consistency": info[key]},
+                            1 if info[key] == "consistent" else 0,
+                        )
+                    )
+            timestamp = task_server.ioc_info.get_timestamp(name)
+            if timestamp:
+                samples["iocdock_ioc_update_timestamp_seconds"].append(
+                    ({"ioc": name}, round(timestamp, 3))
+                )
+        for name, info in task_server.service_info.items():
+            status = str(info.get("status", "")).strip().split("\n")[0]
+            samples["iocdock_service_status"].append(
+                (
+                    {
+                        "service": name,
+                        # only the state word is kept, e.g. "running" of "Running 5 minutes ago".
+                        "status": status.split(" ")[0].lower() if status else "unknown",
+                    },
+                    1,
+                )
+            )
+            replicas = parse_replicas(info.get("replicas", ""))
+            if replicas is not None:
+                samples["iocdock_service_replicas_running"].append(({"service": name}, replicas[0]))
+                samples["iocdock_service_replicas_desired"].append(({"service": name}, replicas[1]))
+        for name, info in task_server.node_info.items():
+            samples["iocdock_node_info"].append(
+                (
+                    {
+                        "node": name,
+                        "state": info.get("state", ""),
+                        "availability": info.get("availability", ""),
+                        "role": info.get("role", ""),
+                    },
+                    1,
+                )
+            )
+            for service, state in sorted((info.get("tasks") or {}).items()):
+                samples["iocdock_task_state"].append(
+                    ({"node": name, "service": service, "state": state}, 1)
+                )
+        samples["iocdock_state_generation"].append(({}, task_server.generation))
+    for name, status in task_server.get_tasks_status().items():
+        if "runs" not in status:
+            continue
+        labels = {"task": name}
+        for metric, key in (
+            ("iocdock_server_task_runs_total", "runs"),
+            ("iocdock_server_task_duration_seconds_total", "total_duration"),
+            ("iocdock_server_task_last_duration_seconds", "last_duration"),
+            ("iocdock_server_task_max_duration_seconds", "max_duration"),
+            ("iocdock_server_task_interval_seconds", "current_interval"),
+            ("iocdock_server_task_overruns_total", "overruns"),
+            ("iocdock_server_task_errors_total", "errors"),
+        ):
+            samples[metric].append((labels, status[key]))
+    counters = task_server.ioc_refresh_counters
+    samples["iocdock_ioc_refresh_recomputed"].append(({}, counters["recomputed"]))
+    samples["iocdock_ioc_refresh_candidates"].append(({}, counters["candidates"]))
+
+    lines = []
+    for name, (metric_type, help_str) in METRICS.items():
+        if not samples[name]:
+            continue
+        lines.append(f"# HELP {name} {help_str}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.extend(format_sample(name, labels, value) for labels, value in samples[name])
+    return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """
+    HTTP listener serving GET /metrics for Prometheus in a thread.
+    """
+
+    def __init__(self, port, render, host="0.0.0.0"):
+        """
+        :param port: port to listen on.
+        :param render: function returning str of metrics.
+        """
+        self.host = host
+        self.port = port
+        self.render = render
+        self._httpd = None
+        self._thread = None
+
+    def start(self):
+        """
+        :raise OSError: if port can not be bound.
+        """
+        from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+        render = self.render
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/metrics/"):
+                    self.send_error(404)
+                    return
+                try:
+                    body = render().encode()
+                except Exception as e:
+                    self.send_error(500, explain=str(e))
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                # scrapes are not logged.
+                pass
+
+        self._httpd = ThreadingHTTPServer((self.host, self.port), MetricsHandler)
+        self._httpd.daemon_threads = True
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._httpd is None:
+            return
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        self._thread.join()
+        self._httpd = None
+        self._thread = None
+
+    @property
+    def is_running(self):
+        return self._httpd is not None
@@ -0,0 +1,302 @@
+import os
+import time
+import configparser
+
+from imutils.IMConfig import *
+from imutils.IMFunc import memory_to_bytes
+from imutils.IocClass import gen_swarm_files, get_ioc_placement, write_ioc_placement
+
+
+def read_ioc_resources():
+    """
+    Read resources settings of section "DEPLOY" from config files of all swarm IOC projects at swarm data dir.
+
+    :return: dict of {IOC name: {"cpu-reserve", "memory-reserve", "cpu-limit", "memory-limit"}},
+        cpu in cores and memory in bytes, 0 for options not set.
+    """
+    top_path = os.path.join(MOUNT_PATH, SWARM_DIR)
+    if not os.path.isdir(top_path):
+        print(f"read_ioc_resources: Failed. Working directory {top_path} is not exist!")
+        return {}
+    res = {}
+    for service_dir in sorted(os.listdir(top_path)):
+        conf = configparser.ConfigParser()
+        if not conf.read(os.path.join(top_path, service_dir, IOC_CONFIG_FILE)):
+            continue
+        if conf.get("IOC", "host", fallback="") != "swarm":
+            continue
+        resources = {}
+        for option in ("cpu-reserve", "cpu-limit"):
+            try:
+                resources[option] = float(conf.get("DEPLOY", option, fallback="") or 0)
+            except ValueError:
+                print(
+                    f'read_ioc_resources: Warning. Invalid "{option}" for IOC "{service_dir}", use 0.'
+                )
+                resources[option] = 0.0
+        for option in ("memory-reserve", "memory-limit"):
+            resources[option] = memory_to_bytes(conf.get("DEPLOY", option, fallback=""))
+        res[service_dir] = resources
+    return res
+
+
+def get_ioc_demand(resources):
+    # resources an IOC needs for placement, reservation is used first and then limit, default limit at last.
+    cpu = resources["cpu-reserve"] or resources["cpu-limit"] or float(RESOURCE_IOC_CPU_LIMIT)
+    memory = (
+        resources["memory-reserve"]
+        or resources["memory-limit"]
+        or memory_to_bytes(RESOURCE_IOC_MEMORY_LIMIT)
+    )
+    return cpu, memory
+
+
+def get_worker_nodes(nodes=None):
+    """
+    Return capacities of worker nodes available for scheduling, from docker API if nodes not given.
+
+    :param nodes: list of docker node objects.
+    :return: dict of {hostname: {"id", "cpus", "memory", "available"}}.
+    """
+    if nodes is None:
+        import docker
+
+        nodes = docker.from_env().nodes.list()
+    res = {}
+    for node in nodes:
+        if node.attrs["Spec"]["Role"] != "worker":
+            continue
+        resources = node.attrs["Description"].get("Resources", {})
+        res[node.attrs["Description"]["Hostname"]] = {
+            "id": node.id,
+            "cpus": resources.get("NanoCPUs", 0) / 1e9,
+            "memory": resources.get("MemoryBytes", 0),
+            "available": node.attrs["Spec"]["Availability"] == "active"
+            and node.attrs["Status"]["State"] == "ready",
+        }
+    return res
+
+
+def pack_iocs(demands, capacities, previous=None):
+    """
+    Assign IOC services to nodes by bin packing, the node with the lowest load after assignment is chosen,
+    so that load is balanced between nodes. Larger IOC services are placed first, previous assignments are
+    kept if they still fit to avoid needless moves.
+
+    :param demands: dict of {IOC name: (cpu, memory)}.
+    :param capacities: dict of {hostname: (cpu, memory)}.
+    :param previous: dict of {IOC name: hostname} of previous assignment.
+    :return: (dict of {IOC name: hostname}, list of IOC names not placed, dict of {hostname: [cpu used, memory used]})
+    """
+    previous = previous if previous else {}
+    hostnames = list(capacities.keys())
+    cap_cpu = [capacities[item][0] for item in hostnames]
+    cap_mem = [capacities[item][1] for item in hostnames]
+    used_cpu = [0.0] * len(hostnames)
+    used_mem = [0] * len(hostnames)
+    total_cpu = sum(cap_cpu) or 1
+    total_mem = sum(cap_mem) or 1
+    order = sorted(
+        demands.keys(),
+        key=lambda x: (-max(demands[x][0] / total_cpu, demands[x][1] / total_mem), x),
+    )
+    index_of = {hostname: i for i, hostname in enumerate(hostnames)}
+
+    assignment = {}
+    # keep previous assignments that still fit.
+    for name in order:
+        i = index_of.get(previous.get(name))
+        if i is None:
+            continue
+        cpu, mem = demands[name]
+        if used_cpu[i] + cpu <= cap_cpu[i] and used_mem[i] + mem <= cap_mem[i]:
+            used_cpu[i] += cpu
+            used_mem[i] += mem
+            assignment[name] = hostnames[i]
+
+    unplaced = []
+    node_range = range(len(hostnames))
+    for name in order:
+        if name in assignment:
+            continue
+        cpu, mem = demands[name]
+        best_index = None
+        best_load = None
+        for i in node_range:
+            new_cpu = used_cpu[i] + cpu
+            new_mem = used_mem[i] + mem
+            if new_cpu > cap_cpu[i] or new_mem > cap_mem[i]:
+                continue
+            load = max(new_cpu / cap_cpu[i], new_mem / cap_mem[i])
+            if best_load is None or load < best_load:
+                best_index = i
+                best_load = load
+        if best_index is None:
+            unplaced.append(name)
+            continue
+        used_cpu[best_index] += cpu
+        used_mem[best_index] += mem
+        assignment[name] = hostnames[best_index]
+    usage = {
+        hostname: [used_cpu[i], used_mem[i]] for i, hostname in enumerate(hostnames)
+    }
+    return assignment, unplaced, usage
+
+
+def plan_placement(verbose=False):
+    """
+    Plan placement of all swarm IOC services on available worker nodes according to their resources settings,
+    write the assignment to placement file at swarm data dir and regenerate compose files of IOC projects
+    with "node.hostname" placement constraints.
+    """
+    from tabulate import tabulate
+
+    start_time = time.time()
+    demands = {
+        name: get_ioc_demand(resources)
+        for name, resources in read_ioc_resources().items()
+    }
+    if not demands:
+        print(f"plan_placement: Failed. No swarm IOC project found.")
+        return
+    nodes = get_worker_nodes()
+    capacities = {
+        hostname: (item["cpus"], item["memory"])
+        for hostname, item in nodes.items()
+        if item["available"] and item["cpus"] and item["memory"]
+    }
+    if not capacities:
+        print(f"plan_placement: Failed. No available worker node found.")
+        return
+    assignment, unplaced, usage = pack_iocs(
+        demands, capacities, previous=get_ioc_placement()
+    )
+    plan_time = time.time() - start_time
+
+    raw_print = [["Node", "IOCs", "CPU", "Memory"]]
+    for hostname, (cpu, mem) in usage.items():
+        raw_print.append(
+            [
+                hostname,
+                sum(1 for item in assignment.values() if item == hostname),
+                f"{cpu:.2f}/{capacities[hostname][0]:.2f} ({cpu / capacities[hostname][0]:.0%})",
+                f"{mem / (1 << 30):.2f}G/{capacities[hostname][1] / (1 << 30):.2f}G "
+                f"({mem / capacities[hostname][1]:.0%})",
+            ]
+        )
+    print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+    if verbose:
+        for name in sorted(assignment.keys()):
+            print(f"{name}: {assignment[name]}")
+    if unplaced:
+        print(
+            f"plan_placement: Warning. {len(unplaced)} IOC services can not be placed within node capacities "
+            f'and will be scheduled by swarm freely: {" ".join(sorted(unplaced))}.'
+        )
+
+    write_ioc_placement(assignment)
+    print(
+        f"plan_placement: Placed {len(assignment)}/{len(demands)} IOC services on "
+        f"{len(capacities)} nodes in {plan_time:.3f}s."
+    )
+    gen_swarm_files(iocs=["alliocs"], verbose=verbose)
+
+
+def show_capacity(verbose=False):
+    """
+    Show reservations and limits of IOC services aggregated per node by live task placement with headroom,
+    and simulate the loss of each single worker node to check whether its IOC services fit on the others.
+
+    All data comes from one snapshot, node and task information is got from IocDockServer if it is running.
+    """
+    from tabulate import tabulate
+    from imutils.SwarmOrchestrator import get_nodes_info
+
+    nodes_info = get_nodes_info()
+    resources = read_ioc_resources()
+    prefix = f"{PREFIX_STACK_NAME}_srv-"
+
+    # aggregate per node.
+    node_iocs = {}
+    raw_print = [
+        [
+            "Node",
+            "Role",
+            "Availability",
+            "IOCs",
+            "CPU(reserve/limit/capacity)",
+            "Memory(reserve/limit/capacity)",
+            "Headroom(CPU/Memory)",
+        ]
+    ]
+    headroom = {}
+    for hostname, node in sorted(nodes_info.items()):
+        iocs = [
+            item.removeprefix(prefix)
+            for item in node.get("tasks", {}).keys()
+            if item.removeprefix(prefix) in resources
+        ]
+        node_iocs[hostname] = iocs
+        cpu_reserve = sum(resources[item]["cpu-reserve"] for item in iocs)
+        cpu_limit = sum(resources[item]["cpu-limit"] for item in iocs)
+        mem_reserve = sum(resources[item]["memory-reserve"] for item in iocs)
+        mem_limit = sum(resources[item]["memory-limit"] for item in iocs)
+        cpu_demand = sum(get_ioc_demand(resources[item])[0] for item in iocs)
+        mem_demand = sum(get_ioc_demand(resources[item])[1] for item in iocs)
+        cpus = node.get("cpus", 0)
+        memory = node.get("memory", 0)
+        headroom[hostname] = (cpus - cpu_demand, memory - mem_demand)
+        raw_print.append(
+            [
+                hostname,
+                node.get("role", ""),
+                node.get("availability", ""),
+                len(iocs),
+                f"{cpu_reserve:.2f}/{cpu_limit:.2f}/{cpus:.2f}",
+                f"{mem_reserve / (1 << 30):.2f}G/{mem_limit / (1 << 30):.2f}G/{memory / (1 << 30):.2f}G",
+                f"{headroom[hostname][0]:.2f}/{headroom[hostname][1] / (1 << 30):.2f}G",
+            ]
+        )
+    print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+    print()
+
+    # N-1 simulation over worker nodes available for scheduling.
+    workers = [
+        hostname
+        for hostname, node in nodes_info.items()
+        if node.get("role") == "worker"
+        and node.get("availability") == "active"
+        and node.get("state") == "ready"
+    ]
+    # IOC services pinned to the lost node by placement planner can not be rescheduled until placement is
+    # planned again and applied.
+    placement = get_ioc_placement()
+    raw_print = [["LostNode", "IOCs", "Fits", "Unscheduled", "Pinned"]]
+    for lost in sorted(workers):
+        pinned = sorted(item for item in node_iocs[lost] if placement.get(item) == lost)
+        demands = {
+            item: get_ioc_demand(resources[item])
+            for item in node_iocs[lost]
+            if item not in pinned
+        }
+        capacities = {
+            hostname: (max(headroom[hostname][0], 0), max(headroom[hostname][1], 0))
+            for hostname in workers
+            if hostname != lost
+        }
+        assignment, unplaced, _ = pack_iocs(demands, capacities)
+        raw_print.append(
+            [
+                lost,
+                len(node_iocs[lost]),
+                "yes" if not unplaced and not pinned else "no",
+                " ".join(sorted(unplaced)) if verbose else len(unplaced),
+                " ".join(pinned) if verbose else len(pinned),
+            ]
+        )
+    print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+    if any(row[4] for row in raw_print[1:]):
+        print(
+            "show_capacity: Pinned IOC services stay down when their node is lost until "
+            '"swarm --plan-placement" and "swarm --apply" are run again.'
+        )
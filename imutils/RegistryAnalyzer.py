@@ -0,0 +1,272 @@
+import os
+import time
+
+import imutils.IMConfig as IMConfig
+from imutils.IMError import IMRegistryError
+from imutils.RegistryClient import RegistryClient
+from imutils.ImageValidator import (
+    parse_image_reference,
+    is_local_registry,
+    get_repository_ioc_images,
+    get_swarm_ioc_images,
+)
+
+INDEX_MEDIA_TYPES = (
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+)
+
+
+def format_size(size):
+    for unit in ("B", "K", "M", "G"):
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{size}B"
+        size /= 1024
+    return f"{size:.1f}T"
+
+
+def run_concurrently(func, items, max_workers=8):
+    """
+    Call func on each item concurrently.
+
+    :return: (dict of {item: result}, dict of {item: error message})
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    res = {}
+    errors = {}
+
+    def call(item):
+        try:
+            res[item] = func(*item)
+        except IMRegistryError as e:
+            errors[item] = e.message
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for item in items:
+            executor.submit(call, item)
+    return res, errors
+
+
+def get_referenced_images(verbose=False):
+    """
+    Collect images of the registry referenced by IOC projects in repository and swarm data dir,
+    and by services defined in GlobalServicesList and LocalServicesList.
+
+    :return: dict of {(repository, tag or digest): set of referrers}
+    """
+    from imutils.IMServiceDefinition import GlobalServicesList, LocalServicesList
+
+    res = {}
+
+    def add(image, referrer):
+        registry, repository, reference = parse_image_reference(image)
+        if is_local_registry(registry):
+            res.setdefault((repository, reference), set()).add(referrer)
+
+    if os.path.isdir(IMConfig.REPOSITORY_PATH):
+        for name, image in get_repository_ioc_images(
+            sorted(os.listdir(IMConfig.REPOSITORY_PATH))
+        ).items():
+            add(image, name)
+    if os.path.isdir(os.path.join(IMConfig.MOUNT_PATH, IMConfig.SWARM_DIR)):
+        for name, image in get_swarm_ioc_images(verbose=verbose).items():
+            add(image, name)
+    for item in GlobalServicesList + LocalServicesList:
+        if len(item) > 1 and item[1]:
+            add(f"{IMConfig.REGISTRY_COMMON_NAME}/{item[1]}", f"srv-{item[0]}")
+    return res
+
+
+def walk_registry(registry_client):
+    """
+    Walk all tags of the registry and the manifests they point to, multi-platform indexes are expanded
+    to their platform manifests. Blob sizes are taken from manifest descriptors.
+
+    :return: (dict of {(repository, manifest digest): {"tags", "blobs"}}, list of error messages),
+        "blobs" is a dict of {blob digest: size} including config, layers and manifests of platforms.
+    """
+    max_workers = registry_client.max_workers
+    errors = []
+    tags_dict, tag_errors = registry_client.list_all_tags()
+    errors.extend(f"{repo}: {message}" for repo, message in tag_errors.items())
+
+    # resolve tags to manifests.
+    tag_manifests, manifest_errors = run_concurrently(
+        registry_client.get_manifest,
+        [(repo, tag) for repo, tags in tags_dict.items() for tag in tags],
+        max_workers=max_workers,
+    )
+    errors.extend(f"{repo}:{tag}: {message}" for (repo, tag), message in manifest_errors.items())
+    res = {}
+    for (repo, tag), (manifest, digest, _) in tag_manifests.items():
+        item = res.setdefault(
+            (repo, digest), {"tags": [], "blobs": {}, "manifest": manifest}
+        )
+        item["tags"].append(tag)
+
+    # fetch platform manifests of indexes.
+    children = set()
+    for (repo, _), item in res.items():
+        if item["manifest"].get("mediaType") in INDEX_MEDIA_TYPES:
+            for descriptor in item["manifest"].get("manifests", []):
+                item["blobs"][descriptor["digest"]] = descriptor.get("size", 0)
+                children.add((repo, descriptor["digest"]))
+    child_manifests, manifest_errors = run_concurrently(
+        registry_client.get_manifest, children, max_workers=max_workers
+    )
+    errors.extend(f"{repo}@{digest}: {message}" for (repo, digest), message in manifest_errors.items())
+    registry_client.save_cache()
+
+    for (repo, _), item in res.items():
+        manifest = item.pop("manifest")
+        if manifest.get("mediaType") in INDEX_MEDIA_TYPES:
+            manifests = [
+                child_manifests[(repo, descriptor["digest"])][0]
+                for descriptor in manifest.get("manifests", [])
+                if (repo, descriptor["digest"]) in child_manifests
+            ]
+        else:
+            manifests = [manifest]
+        for manifest in manifests:
+            for descriptor in [manifest.get("config", {})] + manifest.get("layers", []):
+                if descriptor.get("digest"):
+                    item["blobs"][descriptor["digest"]] = descriptor.get("size", 0)
+    return res, errors
+
+
+def analyze_registry(max_workers=8, use_cache=True, verbose=False):
+    """
+    Analyze disk usage of the registry: bytes of blobs used by each repository and tag, divided into bytes
+    unique to it and bytes shared with others (blobs are stored once for the whole registry), and list
+    manifests not referenced by any IOC project or built-in service as candidates for garbage collection,
+    sorted by bytes reclaimable by deleting each of them.
+    """
+    from tabulate import tabulate
+
+    start_time = time.time()
+    registry_client = RegistryClient(
+        max_workers=max_workers, use_cache=use_cache, verbose=verbose
+    )
+    try:
+        manifests, errors = walk_registry(registry_client)
+    except IMRegistryError as e:
+        print(f"analyze_registry: Failed. {e.message}")
+        return
+    finally:
+        registry_client.close()
+    walk_time = time.time() - start_time
+    for message in errors:
+        print(f"analyze_registry: Warning. {message}")
+    if not manifests:
+        print(f"analyze_registry: No images found in registry.")
+        return
+
+    # reference count of blobs across the whole registry.
+    blob_refs = {}
+    blob_sizes = {}
+    for key, item in manifests.items():
+        for digest, size in item["blobs"].items():
+            blob_refs.setdefault(digest, set()).add(key)
+            blob_sizes[digest] = size
+    for key, item in manifests.items():
+        item["unique"] = sum(
+            size for digest, size in item["blobs"].items() if len(blob_refs[digest]) == 1
+        )
+        item["shared"] = sum(item["blobs"].values()) - item["unique"]
+
+    # manifests referenced by IOC projects and services.
+    referenced = get_referenced_images(verbose=verbose)
+    for key, item in manifests.items():
+        repo, digest = key
+        item["used_by"] = set(referenced.get(key, set()))
+        for tag in item["tags"]:
+            item["used_by"] |= referenced.get((repo, tag), set())
+    found = {(repo, tag) for (repo, _), item in manifests.items() for tag in item["tags"]}
+    found |= set(manifests.keys())
+    missing = sorted(set(referenced.keys()) - found)
+
+    # per repository.
+    repositories = {}
+    for (repo, digest), item in manifests.items():
+        repositories.setdefault(repo, []).append(item)
+    raw_print = [["Repository", "Tags", "Manifests", "Size", "Unique", "Shared"]]
+    for repo in sorted(repositories.keys()):
+        items = repositories[repo]
+        blobs = {}
+        for item in items:
+            blobs.update(item["blobs"])
+        unique = sum(
+            size
+            for digest, size in blobs.items()
+            if all(key[0] == repo for key in blob_refs[digest])
+        )
+        raw_print.append(
+            [
+                repo,
+                sum(len(item["tags"]) for item in items),
+                len(items),
+                format_size(sum(blobs.values())),
+                format_size(unique),
+                format_size(sum(blobs.values()) - unique),
+            ]
+        )
+    print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+    print()
+
+    if verbose:
+        raw_print = [["Image", "Digest", "Size", "Unique", "Shared", "UsedBy"]]
+        for (repo, digest), item in sorted(manifests.items()):
+            raw_print.append(
+                [
+                    f'{repo}:{",".join(sorted(item["tags"]))}',
+                    digest[:19],
+                    format_size(sum(item["blobs"].values())),
+                    format_size(item["unique"]),
+                    format_size(item["shared"]),
+                    " ".join(sorted(item["used_by"])),
+                ]
+            )
+        print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+        print()
+
+    # garbage collection candidates.
+    candidates = sorted(
+        ((key, item) for key, item in manifests.items() if not item["used_by"]),
+        key=lambda x: (-x[1]["unique"], x[0]),
+    )
+    candidate_keys = {key for key, _ in candidates}
+    reclaimable = sum(
+        blob_sizes[digest]
+        for digest, refs in blob_refs.items()
+        if refs <= candidate_keys
+    )
+    if candidates:
+        raw_print = [["Candidate", "Digest", "Reclaimable", "Shared"]]
+        for (repo, digest), item in candidates:
+            raw_print.append(
+                [
+                    f'{repo}:{",".join(sorted(item["tags"]))}',
+                    digest[:19],
+                    format_size(item["unique"]),
+                    format_size(item["shared"]),
+                ]
+            )
+        print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+        print()
+    for repo, reference in missing:
+        print(
+            f'analyze_registry: Warning. Image "{repo}:{reference}" used by '
+            f'{" ".join(sorted(referenced[(repo, reference)]))} not found in registry.'
+        )
+    print(
+        f"analyze_registry: Finished in {time.time() - start_time:.2f}s (walk {walk_time:.2f}s). "
+        f"{len(manifests)} manifests in {len(repositories)} repositories, "
+        f"{format_size(sum(blob_sizes.values()))} in total, {len(candidates)} not referenced, "
+        f"deleting all of them reclaims {format_size(reclaimable)}."
+    )
+    if candidates:
+        print(
+            f"analyze_registry: Space is reclaimed after candidate manifests are deleted by registry API "
+            f'and "registry garbage-collect" is run in registry service.'
+        )
@@ -0,0 +1,388 @@
+import os
+import re
+import ssl
+import json
+import time
+import base64
+import threading
+import http.client
+import urllib.parse
+
+import imutils.IMConfig as IMConfig
+from imutils.IMError import IMRegistryError
+
+# number of entries requested for each page of paginated registry API.
+PAGE_SIZE = 1000
+LINK_NEXT_PATTERN = re.compile(r'<([^>]+)>\s*;\s*rel="?next"?')
+# manifest media types accepted, multi-arch indexes are preferred so that no platform manifest is picked.
+MANIFEST_ACCEPT = ", ".join(
+    [
+        "application/vnd.oci.image.index.v1+json",
+        "application/vnd.docker.distribution.manifest.list.v2+json",
+        "application/vnd.oci.image.manifest.v1+json",
+        "application/vnd.docker.distribution.manifest.v2+json",
+    ]
+)
+
+
+class RegistryClient:
+    """
+    Client for docker registry HTTP API v2.
+
+    HTTPS connections are kept alive and reused by each thread, paginated APIs are followed by "Link" header,
+    and responses are cached in a local file for "cache_ttl" seconds.
+    """
+
+    def __init__(
+        self,
+        host=None,
+        port=None,
+        username=None,
+        password=None,
+        cache_ttl=None,
+        use_cache=True,
+        max_workers=8,
+        timeout=30,
+        verbose=False,
+    ):
+        self.host = host if host else IMConfig.REGISTRY_COMMON_NAME
+        self.port = int(port) if port else int(IMConfig.REGISTRY_PORT)
+        username = username if username is not None else IMConfig.REGISTRY_LOGIN_USERNAME
+        password = password if password is not None else IMConfig.REGISTRY_LOGIN_PASSWORD
+        self.auth_header = (
+            f'Basic {base64.b64encode(f"{username}:{password}".encode()).decode()}'
+            if username and password
+            else ""
+        )
+        self.cache_ttl = (
+            float(cache_ttl) if cache_ttl is not None else float(IMConfig.REGISTRY_CACHE_TTL)
+        )
+        self.use_cache = use_cache
+        self.max_workers = max(1, int(max_workers))
+        self.timeout = timeout
+        self.verbose = verbose
+
+        self.ssl_context = ssl.create_default_context()
+        self.ssl_context.check_hostname = False
+        self.ssl_context.verify_mode = ssl.CERT_NONE
+
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._cache = None
+        self._cache_changed = False
+        self.request_count = 0
+        self.connection_count = 0
+
+    #
+    # connection
+    #
+    def _get_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.timeout, context=self.ssl_context
+            )
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+                self.connection_count += 1
+        return conn
+
+    def _close_connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+
+    def close(self):
+        # close connections of all threads.
+        with self._lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def request(self, method, path, headers=None):
+        """
+        Send a request on the keep-alive connection of current thread, reconnect once if the connection
+        was closed by server.
+
+        :param method: HTTP method.
+        :param path: path of request, with query string.
+        :param headers: extra headers.
+        :return: (status, response headers, response body)
+        """
+        headers = dict(headers) if headers else {}
+        if self.auth_header:
+            headers["Authorization"] = self.auth_header
+        for retry in (True, False):
+            conn = self._get_connection()
+            try:
+                conn.request(method, path, headers=headers)
+                response = conn.getresponse()
+                # body must be read completely for the connection to be reused.
+                body = response.read()
+            except (http.client.HTTPException, ConnectionError, OSError) as e:
+                self._close_connection()
+                if retry:
+                    continue
+                raise IMRegistryError(
+                    f"{method} https://{self.host}:{self.port}{path} failed, {e}"
+                )
+            with self._lock:
+                self.request_count += 1
+            if self.verbose:
+                print(f"RegistryClient: {method} {path} {response.status}.")
+            if response.will_close:
+                self._close_connection()
+            return response.status, response.headers, body
+
+    def get_json(self, path, headers=None):
+        # GET a json document, return (document, response headers).
+        status, response_headers, body = self.request("GET", path, headers=headers)
+        if status != 200:
+            raise IMRegistryError(
+                f"GET https://{self.host}:{self.port}{path} failed, HTTP {status}."
+            )
+        try:
+            return json.loads(body.decode()), response_headers
+        except ValueError as e:
+            raise IMRegistryError(
+                f"GET https://{self.host}:{self.port}{path} returned invalid json, {e}."
+            )
+
+    def get_paginated(self, path, key):
+        """
+        Get all entries of a paginated API by following "Link" header of each page.
+
+        :param path: path of the first page.
+        :param key: key of list in each page.
+        :return: list of all entries.
+        """
+        res = []
+        while path:
+            data, headers = self.get_json(path)
+            res.extend(data.get(key) or [])
+            match = LINK_NEXT_PATTERN.search(headers.get("Link", ""))
+            if match:
+                # "Link" may be an absolute URL or a path.
+                url = urllib.parse.urlsplit(match.group(1))
+                path = f"{url.path}?{url.query}" if url.query else url.path
+            else:
+                path = None
+        return res
+
+    #
+    # cache
+    #
+    def _load_cache(self):
+        if self._cache is not None:
+            return
+        self._cache = {}
+        if not self.use_cache:
+            return
+        try:
+            with open(IMConfig.REGISTRY_CACHE_FILE_PATH, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get("registry") == f"{self.host}:{self.port}":
+            self._cache = data.get("entries", {})
+
+    def cache_get(self, key):
+        # return cached value of key, None if not cached or expired.
+        if not self.use_cache:
+            return None
+        with self._lock:
+            self._load_cache()
+            entry = self._cache.get(key)
+        if entry and time.time() - entry[0] < self.cache_ttl:
+            return entry[1]
+        return None
+
+    def cache_set(self, key, value):
+        with self._lock:
+            self._load_cache()
+            self._cache[key] = [time.time(), value]
+            self._cache_changed = True
+
+    def save_cache(self):
+        # write unexpired cache entries to cache file.
+        with self._lock:
+            if not self.use_cache or not self._cache_changed:
+                return
+            now = time.time()
+            entries = {
+                key: entry
+                for key, entry in self._cache.items()
+                if now - entry[0] < self.cache_ttl
+            }
+            file_path = IMConfig.REGISTRY_CACHE_FILE_PATH
+            temp_path = f"{file_path}.{os.getpid()}.tmp"
+            try:
+                os.makedirs(os.path.dirname(file_path), exist_ok=True)
+                with open(temp_path, "w") as f:
+                    json.dump(
+                        {"registry": f"{self.host}:{self.port}", "entries": entries}, f
+                    )
+                os.replace(temp_path, file_path)
+            except OSError as e:
+                print(f"RegistryClient: Warning. Failed to write cache file, {e}.")
+                return
+            self._cache_changed = False
+
+    #
+    # registry API
+    #
+    def list_repositories(self):
+        # list names of all repositories in registry.
+        res = self.cache_get("catalog")
+        if res is None:
+            res = self.get_paginated(f"/v2/_catalog?n={PAGE_SIZE}", "repositories")
+            self.cache_set("catalog", res)
+        return res
+
+    def list_tags(self, repository):
+        # list all tags of a repository.
+        res = self.cache_get(f"tags:{repository}")
+        if res is None:
+            res = self.get_paginated(
+                f"/v2/{repository}/tags/list?n={PAGE_SIZE}", "tags"
+            )
+            self.cache_set(f"tags:{repository}", res)
+        return res
+
+    def list_all_tags(self, repositories=None):
+        """
+        List tags of repositories concurrently.
+
+        :param repositories: names of repositories, all repositories in registry if not given.
+        :return: (dict of {repository: list of tags}, dict of {repository: error message})
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        if repositories is None:
+            repositories = self.list_repositories()
+        res = {}
+        errors = {}
+
+        def list_tags(repository):
+            try:
+                res[repository] = self.list_tags(repository)
+            except IMRegistryError as e:
+                errors[repository] = e.message
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for repository in repositories:
+                executor.submit(list_tags, repository)
+        self.save_cache()
+        return res, errors
+
+    def head_manifest(self, repository, reference):
+        """
+        Check whether a manifest exists by HEAD request, only existing manifests are cached so that
+        images pushed afterwards are found at once.
+
+        :param repository: name of repository.
+        :param reference: tag or digest.
+        :return: digest of manifest, None if manifest not found.
+        """
+        key = f"manifest:{repository}:{reference}"
+        res = self.cache_get(key)
+        if res is not None:
+            return res
+        status, headers, _ = self.request(
+            "HEAD",
+            f"/v2/{repository}/manifests/{reference}",
+            headers={"Accept": MANIFEST_ACCEPT},
+        )
+        if status == 404:
+            return None
+        if status != 200:
+            raise IMRegistryError(
+                f"HEAD https://{self.host}:{self.port}/v2/{repository}/manifests/{reference} "
+                f"failed, HTTP {status}."
+            )
+        res = headers.get("Docker-Content-Digest", "") or reference
+        self.cache_set(key, res)
+        return res
+
+    def head_manifests(self, references):
+        """
+        Check manifests concurrently.
+
+        :param references: list of (repository, reference).
+        :return: (dict of {(repository, reference): digest or None}, dict of {(repository, reference): error message})
+        """
+        from concurrent.futures import ThreadPoolExecutor
+
+        res = {}
+        errors = {}
+
+        def head_manifest(item):
+            try:
+                res[item] = self.head_manifest(*item)
+            except IMRegistryError as e:
+                errors[item] = e.message
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for item in set(references):
+                executor.submit(head_manifest, item)
+        self.save_cache()
+        return res, errors
+
+    def get_manifest(self, repository, reference):
+        """
+        Get a manifest document, manifests got by digest are cached as they never change.
+
+        :return: (manifest, digest of manifest, size of manifest in bytes)
+        """
+        key = f"manifest-doc:{repository}:{reference}"
+        res = self.cache_get(key)
+        if res is not None:
+            return tuple(res)
+        status, headers, body = self.request(
+            "GET",
+            f"/v2/{repository}/manifests/{reference}",
+            headers={"Accept": MANIFEST_ACCEPT},
+        )
+        if status != 200:
+            raise IMRegistryError(
+                f"GET https://{self.host}:{self.port}/v2/{repository}/manifests/{reference} "
+                f"failed, HTTP {status}."
+            )
+        try:
+            manifest = json.loads(body.decode())
+        except ValueError as e:
+            raise IMRegistryError(
+                f"GET https://{self.host}:{self.port}/v2/{repository}/manifests/{reference} "
+                f"returned invalid json, {e}."
+            )
+        res = (manifest, headers.get("Docker-Content-Digest", "") or reference, len(body))
+        if reference.startswith("sha256:"):
+            self.cache_set(key, res)
+        return res
+
+    def get_image_labels(self, repository, reference):
+        """
+        Get labels of an image from its config blob, the first platform is used for multi-platform images.
+
+        :return: dict of labels, None if image not found.
+        """
+        digest = self.head_manifest(repository, reference)
+        if digest is None:
+            return None
+        manifest, _, _ = self.get_manifest(repository, digest)
+        if manifest.get("manifests"):
+            manifest, _, _ = self.get_manifest(
+                repository, manifest["manifests"][0]["digest"]
+            )
+        config_digest = manifest.get("config", {}).get("digest")
+        if not config_digest:
+            return {}
+        config, _ = self.get_json(f"/v2/{repository}/blobs/{config_digest}")
+        return config.get("config", {}).get("Labels") or {}
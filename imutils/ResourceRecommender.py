@@ -0,0 +1,197 @@
+import os
+import re
+import json
+import math
+import time
+import urllib.parse
+import urllib.request
+
+import imutils.IMConfig as IMConfig
+from imutils.PlacementPlanner import read_ioc_resources
+
+# margin over observed usage for recommended limits.
+LIMIT_HEADROOM = 1.5
+MIN_CPU = 0.05
+MIN_MEMORY = 64 << 20
+
+
+def parse_window(window):
+    # return seconds of a prometheus duration such as "7d", "12h" or "1h30m".
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+    res = 0
+    for value, unit in re.findall(r"(\d+)([smhdw])", str(window)):
+        res += int(value) * units[unit]
+    return res
+
+
+def percentile(values, q):
+    # nearest-rank percentile of a list of numbers.
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = max(0, math.ceil(q / 100 * len(values)) - 1)
+    return values[index]
+
+
+def query_range(query, start, end, step, prometheus_url=None, timeout=60):
+    """
+    Execute a range query with prometheus HTTP API.
+
+    :return: dict of {value of label "service": list of float values}, None if request failed.
+    """
+    url = f"{(prometheus_url or IMConfig.PROMETHEUS_URL).rstrip('/')}/api/v1/query_range"
+    data = urllib.parse.urlencode(
+        {"query": query, "start": start, "end": end, "step": step}
+    ).encode()
+    try:
+        with urllib.request.urlopen(url, data=data, timeout=timeout) as response:
+            result = json.loads(response.read().decode())
+    except Exception as e:
+        print(f'query_range: Failed to query "{url}", {e}.')
+        return None
+    if result.get("status") != "success":
+        print(f'query_range: Failed. {result.get("error", "unknown error")}.')
+        return None
+    res = {}
+    for series in result.get("data", {}).get("result", []):
+        service = series.get("metric", {}).get("service")
+        if not service:
+            continue
+        res.setdefault(service, []).extend(
+            float(item[1]) for item in series.get("values", []) if item[1] != "NaN"
+        )
+    return res
+
+
+def get_ioc_usage(window="7d", prometheus_url=None, verbose=False):
+    """
+    Get CPU and memory usage of all IOC services over given window from cAdvisor metrics in prometheus,
+    with one range query for CPU and one for memory across all IOC services.
+
+    :return: dict of {IOC name: {"cpu-p95", "cpu-p99", "memory-peak"}}, None if query failed.
+    """
+    window_seconds = parse_window(window)
+    if window_seconds <= 0:
+        print(f'get_ioc_usage: Failed. Invalid window "{window}".')
+        return None
+    end = time.time()
+    start = end - window_seconds
+    # prometheus refuses range queries of more than 11000 points per series.
+    step = max(60, math.ceil(window_seconds / 10000))
+    selector = f'stack="{IMConfig.PREFIX_STACK_NAME}",service_type="ioc"'
+    queries = {
+        "cpu": f"sum by (service) (rate(container_cpu_usage_seconds_total{{{selector}}}[5m]))",
+        "memory": f"sum by (service) (container_memory_working_set_bytes{{{selector}}})",
+    }
+    results = {}
+    for key, query in queries.items():
+        if verbose:
+            print(f"get_ioc_usage: Query {query} with step {step}s.")
+        results[key] = query_range(query, start, end, step, prometheus_url=prometheus_url)
+        if results[key] is None:
+            return None
+    prefix = f"{IMConfig.PREFIX_STACK_NAME}_srv-"
+    res = {}
+    for service in set(results["cpu"].keys()) | set(results["memory"].keys()):
+        cpu_values = results["cpu"].get(service, [])
+        memory_values = results["memory"].get(service, [])
+        res[service.removeprefix(prefix)] = {
+            "cpu-p95": percentile(cpu_values, 95),
+            "cpu-p99": percentile(cpu_values, 99),
+            "memory-peak": max(memory_values) if memory_values else 0,
+        }
+    return res
+
+
+def format_cpu(cpu):
+    # round up to 0.05 core, ignoring float error such as 0.2 * 1.5 = 0.30000000000000004.
+    return f"{max(math.ceil(round(cpu * 20, 6)) / 20, MIN_CPU):g}"
+
+
+def format_memory(memory):
+    # round up to 16M.
+    return f"{max(math.ceil(memory / (16 << 20)) * 16, 16)}M"
+
+
+def recommend_resources(usage):
+    """
+    Recommend [DEPLOY] resources settings from observed usage: reservations cover p95 CPU and peak memory,
+    limits add headroom over p99 CPU and peak memory.
+    """
+    return {
+        "cpu-reserve": format_cpu(usage["cpu-p95"]),
+        "cpu-limit": format_cpu(usage["cpu-p99"] * LIMIT_HEADROOM),
+        "memory-reserve": format_memory(usage["memory-peak"]),
+        "memory-limit": format_memory(
+            max(usage["memory-peak"] * LIMIT_HEADROOM, MIN_MEMORY)
+        ),
+    }
+
+
+def recommend_ioc_resources(
+    window="7d", prometheus_url=None, write=False, verbose=False
+):
+    """
+    Show recommended [DEPLOY] resources settings of IOC projects from their usage history in prometheus,
+    and write them into config files of IOC projects in repository if "write" set.
+    """
+    from tabulate import tabulate
+    from imutils.IocClass import IOC
+
+    usage_dict = get_ioc_usage(
+        window=window, prometheus_url=prometheus_url, verbose=verbose
+    )
+    if usage_dict is None:
+        return
+    current_dict = read_ioc_resources()
+    recommendations = {}
+    raw_print = [
+        [
+            "Name",
+            "CPU(p95/p99)",
+            "MemoryPeak",
+            "Current(cpu reserve/limit, memory reserve/limit)",
+            "Recommended",
+        ]
+    ]
+    for name in sorted(usage_dict.keys()):
+        if name not in current_dict:
+            continue
+        usage = usage_dict[name]
+        current = current_dict[name]
+        recommendations[name] = recommend_resources(usage)
+        raw_print.append(
+            [
+                name,
+                f'{usage["cpu-p95"]:.3f}/{usage["cpu-p99"]:.3f}',
+                f'{usage["memory-peak"] / (1 << 20):.0f}M',
+                f'{current["cpu-reserve"]:g}/{current["cpu-limit"]:g}, '
+                f'{current["memory-reserve"] / (1 << 20):.0f}M/{current["memory-limit"] / (1 << 20):.0f}M',
+                ", ".join(f"{k}={v}" for k, v in recommendations[name].items()),
+            ]
+        )
+    print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+    no_data = sorted(set(current_dict.keys()) - set(usage_dict.keys()))
+    if no_data:
+        print(
+            f"recommend_ioc_resources: No usage data in window {window} for: {' '.join(no_data)}."
+        )
+    if not write:
+        return
+
+    for name, recommendation in recommendations.items():
+        dir_path = os.path.join(IMConfig.REPOSITORY_PATH, name)
+        if not os.path.isdir(dir_path):
+            print(
+                f'recommend_ioc_resources: Skipped "{name}", IOC project not found in repository.'
+            )
+            continue
+        ioc_temp = IOC(dir_path=dir_path, verbose=verbose)
+        for option, value in recommendation.items():
+            ioc_temp.set_config(option, value, section="DEPLOY")
+        ioc_temp.write_config()
+        print(f'recommend_ioc_resources: Write resources settings for IOC "{name}".')
+    print(
+        f"recommend_ioc_resources: Finished. "
+        f'Run "IocManager exec <IOC> --deploy" for updated IOC projects to apply the settings.'
+    )
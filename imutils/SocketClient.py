@@ -1,7 +1,7 @@
 import socket
 import struct
 import json
-from imutils.IMConfig import SOCKET_PATH
+from imutils.IMConfig import SOCKET_PATH, STATE_SNAPSHOT_PATH, STATE_SNAPSHOT_MAX_AGE
 
 
 def send_message(sock, message):
@@ -77,3 +77,89 @@ def socket_client(req_to_send, receive_type="str", verbose=True):
     finally:
         sock.close()
     return response
+
+
+def socket_query(
+    query,
+    names=None,
+    fields=None,
+    refresh=None,
+    since_generation=None,
+    verbose=True,
+):
+    """
+    Query IocDockServer by json request envelope.
+
+    :param query: "ioc info", "service info" or "node info".
+    :param names: list of names or glob patterns of entries, all entries if None.
+    :param fields: list of fields of entries, all fields if None.
+    :param refresh: list of names or glob patterns of entries to recompute before query.
+    :param since_generation: get only entries changed after this generation.
+    :return: dict of response with "generation" and "data", {} if failed.
+    """
+    request = {"query": query}
+    for key, value in (
+        ("names", names),
+        ("fields", fields),
+        ("refresh", refresh),
+        ("since_generation", since_generation),
+    ):
+        if value is not None:
+            request[key] = value
+    response = socket_client(json.dumps(request), receive_type="json", verbose=verbose)
+    if not isinstance(response, dict) or "error" in response:
+        if verbose and isinstance(response, dict):
+            print(f'socket_query: Failed. {response["error"]}.')
+        return {}
+    return response
+
+
+def read_info(query, names=None, fields=None, verbose=True):
+    """
+    Get information published by IocDockServer from state snapshot file without socket request,
+    query IocDockServer by socket if snapshot file is not available or expired.
+
+    :param query: "ioc info", "service info" or "node info".
+    :param names: list of names or glob patterns of entries, all entries if None.
+    :param fields: list of fields of entries, all fields if None.
+    :return: dict of response with "generation" and "data", {} if failed.
+    """
+    from imutils.StateSnapshot import read_state_snapshot
+
+    snapshot = read_state_snapshot(STATE_SNAPSHOT_PATH, max_age=STATE_SNAPSHOT_MAX_AGE)
+    if snapshot is not None:
+        with snapshot:
+            res = snapshot.query(query.split()[0], names=names, fields=fields)
+        if res is not None:
+            return res
+    return socket_query(query, names=names, fields=fields, verbose=verbose)
+
+
+def socket_subscribe(kinds, names=None, fields=None, verbose=True):
+    """
+    Subscribe changes from IocDockServer, the connection is kept open while iterating.
+
+    :param kinds: list of "ioc", "service" and "node".
+    :param names: list of names or glob patterns of entries, all entries if None.
+    :param fields: list of fields of entries, all fields if None.
+    :return: generator of messages, the first one has "snapshot" of entries, then ones with "deltas".
+    """
+    request = {"subscribe": kinds}
+    if names is not None:
+        request["names"] = names
+    if fields is not None:
+        request["fields"] = fields
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SOCKET_PATH)
+        send_message(sock, json.dumps(request))
+        while True:
+            message = receive_message(sock)
+            if not message:
+                break
+            yield json.loads(message)
+    except Exception as e:
+        if verbose:
+            print(f"Exception occurred while running socket subscription: {e}")
+    finally:
+        sock.close()
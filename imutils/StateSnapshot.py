@@ -0,0 +1,202 @@
+import os
+import mmap
+import json
+import time
+import struct
+
+# layout of snapshot file, all integers are little-endian:
+#   header: magic, version, count of kinds, generation, publish time, size of index, size of data.
+#   index: for each kind, KIND_RECORD and kind name, then for each entry ENTRY_RECORD and entry name,
+#       entries are sorted by name.
+#   data: json of each entry, at the offset (from start of data) given by its ENTRY_RECORD.
+MAGIC = b"IMSS"
+VERSION = 1
+HEADER = struct.Struct("<4sHHQdII")
+KIND_RECORD = struct.Struct("<HQI")
+ENTRY_RECORD = struct.Struct("<HQII")
+
+
+def write_state_snapshot(path, generation, kinds):
+    """
+    Publish state to snapshot file atomically, readers see either the old file or the new one.
+
+    :param path: path of snapshot file.
+    :param generation: generation of the whole state.
+    :param kinds: {kind: (kind generation, {name: (entry generation, info)})}.
+    :return: size of snapshot file.
+    """
+    index = bytearray()
+    data = bytearray()
+    for kind, (kind_generation, entries) in kinds.items():
+        kind_bytes = kind.encode()
+        index += KIND_RECORD.pack(len(kind_bytes), kind_generation, len(entries))
+        index += kind_bytes
+        for name in sorted(entries.keys()):
+            entry_generation, info = entries[name]
+            name_bytes = name.encode()
+            info_bytes = json.dumps(info, separators=(",", ":")).encode()
+            index += ENTRY_RECORD.pack(
+                len(name_bytes), entry_generation, len(data), len(info_bytes)
+            )
+            index += name_bytes
+            data += info_bytes
+    header = HEADER.pack(
+        MAGIC, VERSION, len(kinds), generation, time.time(), len(index), len(data)
+    )
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, "wb") as f:
+            f.write(header)
+            f.write(index)
+            f.write(data)
+        os.chmod(temp_path, 0o644)
+        os.replace(temp_path, path)
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    return HEADER.size + len(index) + len(data)
+
+
+class StateSnapshot:
+    """
+    Read-only view of a snapshot file by mmap, only the index is parsed on open, entries are decoded
+    when they are requested.
+    """
+
+    def __init__(self, path):
+        """
+        :raise OSError: if file can not be opened.
+        :raise ValueError: if file is not a valid snapshot.
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f'invalid snapshot file "{path}"')
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._parse_index(size)
+        except (ValueError, struct.error, UnicodeDecodeError) as e:
+            self.close()
+            raise ValueError(f'invalid snapshot file "{path}", {e}')
+
+    def _parse_index(self, size):
+        magic, version, kind_count, generation, published_at, index_size, data_size = (
+            HEADER.unpack_from(self._mm, 0)
+        )
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("unknown magic or version")
+        if HEADER.size + index_size + data_size != size:
+            raise ValueError("truncated file")
+        self.generation = generation
+        self.published_at = published_at
+        self._data_offset = HEADER.size + index_size
+        # {kind: (kind generation, {name: (entry generation, offset, length)})}
+        self._index = {}
+        offset = HEADER.size
+        for _ in range(kind_count):
+            kind_len, kind_generation, entry_count = KIND_RECORD.unpack_from(self._mm, offset)
+            offset += KIND_RECORD.size
+            kind = self._mm[offset : offset + kind_len].decode()
+            offset += kind_len
+            entries = {}
+            for _ in range(entry_count):
+                name_len, entry_generation, data_offset, data_len = ENTRY_RECORD.unpack_from(
+                    self._mm, offset
+                )
+                offset += ENTRY_RECORD.size
+                name = self._mm[offset : offset + name_len].decode()
+                offset += name_len
+                if data_offset + data_len > data_size:
+                    raise ValueError(f'entry "{name}" out of range')
+                entries[name] = (entry_generation, data_offset, data_len)
+            self._index[kind] = (kind_generation, entries)
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def age(self):
+        return time.time() - self.published_at
+
+    @property
+    def kinds(self):
+        return list(self._index.keys())
+
+    def names(self, kind):
+        return list(self._index.get(kind, (0, {}))[1].keys())
+
+    def get(self, kind, name, fields=None):
+        """
+        :return: dict of entry, only the given fields if fields is not None, None if entry not found.
+        """
+        item = self._index.get(kind, (0, {}))[1].get(name)
+        if item is None:
+            return None
+        start = self._data_offset + item[1]
+        info = json.loads(self._mm[start : start + item[2]])
+        if fields is not None:
+            info = {key: info[key] for key in fields if key in info}
+        return info
+
+    def query(self, kind, names=None, fields=None):
+        """
+        Query entries like TaskServer.query(), names may be glob patterns.
+
+        :return: dict of response, with "generation" of the kind and "data" of {name: entry},
+            None if kind not in snapshot.
+        """
+        from fnmatch import fnmatchcase
+
+        if kind not in self._index:
+            return None
+        kind_generation, entries = self._index[kind]
+        selected = [
+            name
+            for name in entries.keys()
+            if names is None or any(fnmatchcase(name, item) for item in names)
+        ]
+        return {
+            "kind": kind,
+            "generation": kind_generation,
+            "data": {name: self.get(kind, name, fields) for name in selected},
+        }
+
+    def load_all(self):
+        """
+        :return: {kind: (kind generation, {name: (entry generation, info)})}, as written by write_state_snapshot().
+        """
+        res = {}
+        for kind, (kind_generation, entries) in self._index.items():
+            res[kind] = (
+                kind_generation,
+                {name: (item[0], self.get(kind, name)) for name, item in entries.items()},
+            )
+        return res
+
+
+def read_state_snapshot(path, max_age=None):
+    """
+    Open snapshot file if it exists, is valid and was published within max_age seconds.
+
+    :return: StateSnapshot object, None otherwise.
+    """
+    try:
+        snapshot = StateSnapshot(path)
+    except (OSError, ValueError):
+        return None
+    if max_age is not None and snapshot.age > max_age:
+        snapshot.close()
+        return None
+    return snapshot
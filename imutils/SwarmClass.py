@@ -16,7 +16,8 @@ from imutils.IMServiceDefinition import (
     LocalServicesList,
     CustomServicesList,
 )
-from imutils.SocketClient import socket_client, client_check_connection
+from imutils.IocClass import gen_ioc_stack_files
+from imutils.SocketClient import read_info
 
 
 class SwarmManager:
@@ -99,13 +100,10 @@ class SwarmManager:
             print()
 
     def show_digest(self, service_type=["all"]):
-        if not client_check_connection():
+        socket_result = read_info("service info", verbose=False)
+        if not socket_result:
             print(f"Failed to connect to IocDockServer.")
-            socket_result_service = {}
-        else:
-            socket_result_service = socket_client(
-                "service info", receive_type="json", verbose=False
-            )
+        socket_result_service = socket_result.get("data", {})
         raw_print = [
             ["Name", "ServiceName", "Type", "Replicas", "Status"],
         ]
@@ -194,7 +192,10 @@ class SwarmManager:
                         f'SwarmManager: Failed to deploy "{item.service_name}", as it\'s not available.'
                     )
 
-    def deploy_all_iocs(self):
+    def deploy_all_iocs(self, stack_file=False, shards=1):
+        if stack_file:
+            self.deploy_ioc_stack(shards=shards)
+            return
         for item in self.services.values():
             if item.service_type == "ioc":
                 if item.is_available:
@@ -214,6 +215,32 @@ class SwarmManager:
                         f'SwarmManager: Failed to deploy "{item.service_name}", as it\'s not available.'
                     )
 
+    @staticmethod
+    def deploy_ioc_stack(shards=1):
+        """
+        Deploy all swarm IOC services by a single "docker stack deploy" with aggregated stack files,
+        services whose specification is not changed are left untouched by swarm.
+
+        :param shards: number of aggregated stack files to split IOC services into.
+        """
+        stack_files = gen_ioc_stack_files(shards=shards)
+        if not stack_files:
+            print(f"SwarmManager: Failed to deploy IOC stack, no stack file available.")
+            return
+        print(
+            f"SwarmManager: Start to deploy IOC stack with {len(stack_files)} stack file(s)."
+        )
+        print(f"=================================================================")
+        compose_options = " ".join(
+            f"--compose-file {os.path.basename(item)}" for item in stack_files
+        )
+        command = (
+            f"cd {os.path.dirname(stack_files[0])}; "
+            f"docker stack deploy {compose_options} {PREFIX_STACK_NAME} "
+            f"--detach --with-registry-auth"
+        )
+        os.system(command)
+
     def remove_global_services(self):
         while True:
             ans = input(f"SwarmManager: Remove all deployed global services?!![y|n]:")
@@ -230,7 +257,7 @@ class SwarmManager:
                     if item.is_deployed:
                         item.remove()
 
-    def remove_all_iocs(self):
+    def remove_all_iocs(self, max_workers=8):
         while True:
             ans = input(f"SwarmManager: Remove all deployed IOC projects?!![y|n]:")
             if ans.lower() == "y" or ans.lower() == "yes":
@@ -240,13 +267,16 @@ class SwarmManager:
                 return
             else:
                 print(f"SwarmManager: Invalid input, please try again.")
-        for item in self.services.values():
-            if item.service_type == "ioc":
-                if item.is_available:
-                    if item.is_deployed:
-                        item.remove()
+        self.remove_services(
+            [
+                item.service_name
+                for item in self.services.values()
+                if item.service_type == "ioc" and item.is_available
+            ],
+            max_workers=max_workers,
+        )
 
-    def remove_all_services(self):
+    def remove_all_services(self, max_workers=8):
         while True:
             ans = input(f"SwarmManager: Remove all deployed services in Swarm?!![y|n]:")
             if ans.lower() == "y" or ans.lower() == "yes":
@@ -256,9 +286,200 @@ class SwarmManager:
                 return
             else:
                 print(f"SwarmManager: Invalid input, please try again.")
+        self.remove_services(
+            [item.service_name for item in self.services.values()],
+            max_workers=max_workers,
+        )
+
+    def remove_services(self, service_names, max_workers=8):
+        """
+        Remove deployed services concurrently by docker API, services not deployed are ignored.
+
+        :param service_names: names of services to remove.
+        :param max_workers: max number of services removed concurrently.
+        """
+        import time
+        import docker
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        deployed_services = {item.name: item for item in self.get_services_from_docker()}
+        to_remove = [
+            deployed_services[item]
+            for item in service_names
+            if item in deployed_services
+        ]
+        if not to_remove:
+            print(f"SwarmManager: No deployed service to remove.")
+            return
+
+        def remove_service(service):
+            try:
+                service.remove()
+            except docker.errors.APIError as e:
+                return service.name, f"{e}"
+            return service.name, ""
+
+        start_time = time.time()
+        failed = []
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+            futures = [executor.submit(remove_service, item) for item in to_remove]
+            for i, future in enumerate(as_completed(futures), start=1):
+                name, error = future.result()
+                if error:
+                    failed.append(name)
+                    print(f"[{i}/{len(to_remove)}] {name}: Failed to remove, {error}.")
+                else:
+                    print(f"[{i}/{len(to_remove)}] {name}: Removed.")
+        print(
+            f"SwarmManager: Finished removing in {time.time() - start_time:.1f}s, "
+            f"{len(to_remove) - len(failed)} removed, {len(failed)} failed."
+        )
+
+    def get_ioc_services_matched(self, iocs):
+        # return deployed IOC services whose names match given names or shell-style patterns, all if not given.
+        from fnmatch import fnmatch
+
+        deployed_services = {item.name: item for item in self.get_services_from_docker()}
+        res = []
         for item in self.services.values():
-            if item.is_deployed:
-                item.remove()
+            if item.service_type != "ioc" or item.service_name not in deployed_services:
+                continue
+            if iocs and not any(fnmatch(item.name, pattern) for pattern in iocs):
+                continue
+            res.append(deployed_services[item.service_name])
+        return res
+
+    @staticmethod
+    def read_pause_record(file_name=IOC_PAUSE_RECORD_FILE):
+        file_path = os.path.join(MOUNT_PATH, SWARM_DIR, file_name)
+        if not os.path.isfile(file_path):
+            return {}
+        import json
+
+        try:
+            with open(file_path, "r") as f:
+                return json.load(f)
+        except Exception as e:
+            print(f'SwarmManager: Failed to read pause record "{file_path}", {e}.')
+            return {}
+
+    @staticmethod
+    def write_pause_record(record, file_name=IOC_PAUSE_RECORD_FILE):
+        import json
+
+        file_path = os.path.join(MOUNT_PATH, SWARM_DIR, file_name)
+        if not record:
+            if os.path.isfile(file_path):
+                os.remove(file_path)
+            return
+        temp_path = f"{file_path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(record, f, indent=4, sort_keys=True)
+        os.replace(temp_path, file_path)
+
+    def scale_services(self, replicas_dict, max_workers=8):
+        """
+        Scale services concurrently by docker API.
+
+        :param replicas_dict: dict of {docker service object: replicas}.
+        :param max_workers: max number of services scaled concurrently.
+        :return: list of names of services scaled successfully.
+        """
+        import docker
+        from concurrent.futures import ThreadPoolExecutor, as_completed
+
+        def scale_service(service, replicas):
+            try:
+                # reload to get the latest version of service to avoid out of sequence update.
+                service.reload()
+                service.scale(replicas)
+            except (docker.errors.APIError, docker.errors.InvalidArgument) as e:
+                return service.name, f"{e}"
+            return service.name, ""
+
+        succeeded = []
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+            futures = [
+                executor.submit(scale_service, service, replicas)
+                for service, replicas in replicas_dict.items()
+            ]
+            for i, future in enumerate(as_completed(futures), start=1):
+                name, error = future.result()
+                if error:
+                    print(f"[{i}/{len(futures)}] {name}: Failed to scale, {error}.")
+                else:
+                    succeeded.append(name)
+                    print(f"[{i}/{len(futures)}] {name}: Scaled.")
+        return succeeded
+
+    def pause_iocs(self, iocs=None, max_workers=8):
+        """
+        Scale deployed IOC services to 0 replicas for maintenance, original replicas are recorded
+        at swarm data dir for resuming.
+
+        :param iocs: names or shell-style patterns of IOC projects, all IOC services if not given.
+        :param max_workers: max number of services scaled concurrently.
+        """
+        import time
+
+        record = self.read_pause_record()
+        replicas_dict = {}
+        for service in self.get_ioc_services_matched(iocs):
+            replicas = (
+                service.attrs.get("Spec", {})
+                .get("Mode", {})
+                .get("Replicated", {})
+                .get("Replicas")
+            )
+            if replicas is None:
+                print(f"SwarmManager: Skipped pausing non-replicated service {service.name}.")
+                continue
+            if replicas == 0:
+                continue
+            replicas_dict[service] = replicas
+        if not replicas_dict:
+            print(f"SwarmManager: No running IOC service to pause.")
+            return
+        start_time = time.time()
+        succeeded = self.scale_services(
+            {service: 0 for service in replicas_dict.keys()}, max_workers=max_workers
+        )
+        for service, replicas in replicas_dict.items():
+            if service.name in succeeded:
+                record[service.name] = replicas
+        self.write_pause_record(record)
+        print(
+            f"SwarmManager: Finished pausing in {time.time() - start_time:.1f}s, "
+            f"{len(succeeded)} paused, {len(replicas_dict) - len(succeeded)} failed."
+        )
+
+    def resume_iocs(self, iocs=None, max_workers=8):
+        """
+        Scale paused IOC services back to the replicas recorded when pausing.
+
+        :param iocs: names or shell-style patterns of IOC projects, all paused IOC services if not given.
+        :param max_workers: max number of services scaled concurrently.
+        """
+        import time
+
+        record = self.read_pause_record()
+        replicas_dict = {
+            service: record[service.name]
+            for service in self.get_ioc_services_matched(iocs)
+            if service.name in record
+        }
+        if not replicas_dict:
+            print(f"SwarmManager: No paused IOC service to resume.")
+            return
+        start_time = time.time()
+        succeeded = self.scale_services(replicas_dict, max_workers=max_workers)
+        for name in succeeded:
+            record.pop(name, None)
+        self.write_pause_record(record)
+        print(
+            f"SwarmManager: Finished resuming in {time.time() - start_time:.1f}s, "
+            f"{len(succeeded)} resumed, {len(replicas_dict) - len(succeeded)} failed."
+        )
 
     def update_deployed_services(self):
         print(
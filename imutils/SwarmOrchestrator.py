@@ -0,0 +1,488 @@
+import os
+import time
+import configparser
+from datetime import datetime, timezone
+
+from imutils.IMConfig import *
+from imutils.SocketClient import read_info
+
+
+def collect_node_info():
+    """
+    Collect information of swarm nodes and services tasks running on each node by docker API.
+
+    :return: dict of {hostname: node information}, "tasks" of node information is a dict of
+        {service name: task state} for the tasks of stack services desired to be running on that node.
+    """
+    import docker
+
+    docker_client = docker.from_env()
+    services = {
+        item.id: item.name
+        for item in docker_client.services.list(
+            filters={"label": f"com.docker.stack.namespace={PREFIX_STACK_NAME}"}
+        )
+    }
+    node_tasks = {}
+    for task in docker_client.api.tasks(filters={"desired-state": "running"}):
+        service_name = services.get(task.get("ServiceID"))
+        if not service_name or not task.get("NodeID"):
+            continue
+        node_tasks.setdefault(task["NodeID"], {})[service_name] = task.get(
+            "Status", {}
+        ).get("State", "")
+    res = {}
+    for node in docker_client.nodes.list():
+        res[node.attrs["Description"]["Hostname"]] = {
+            "id": node.id,
+            "ip": node.attrs["Status"]["Addr"],
+            "state": node.attrs["Status"]["State"],
+            "role": node.attrs["Spec"]["Role"],
+            "availability": node.attrs["Spec"]["Availability"],
+            "labels": node.attrs["Spec"]["Labels"],
+            "cpus": node.attrs["Description"]
+            .get("Resources", {})
+            .get("NanoCPUs", 0)
+            / 1e9,
+            "memory": node.attrs["Description"].get("Resources", {}).get("MemoryBytes", 0),
+            "tasks": node_tasks.get(node.id, {}),
+            "update_at": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+    return res
+
+
+def format_task_state(task):
+    # task state like "Running since 2024-01-01 08:00:00", timestamp of docker API is in UTC.
+    status = task.get("Status", {})
+    state = status.get("State", "").capitalize() or "Unknown"
+    try:
+        since = datetime.strptime(status.get("Timestamp", "")[:19], "%Y-%m-%dT%H:%M:%S")
+    except ValueError:
+        return state
+    since = since.replace(tzinfo=timezone.utc).astimezone()
+    return f'{state} since {since.strftime("%Y-%m-%d %H:%M:%S")}'
+
+
+def collect_service_info(service_names=None):
+    """
+    Collect task states and replicas of stack services by docker API, with one request for services and one
+    for their tasks, so that it costs the same for one service or all.
+
+    :param service_names: names of docker services, all stack services if None.
+    :return: (dict of {service name: {"status", "replicas"}}, dict of {service name: {node ID: task state}}),
+        services not deployed are not included. "status" is the set of states of tasks desired to be running,
+        one per line, "replicas" is "running/desired". Node tasks are those desired to be running.
+    """
+    import docker
+
+    if service_names is not None and not service_names:
+        return {}, {}
+    docker_client = docker.from_env()
+    services = {
+        item.id: item
+        for item in docker_client.services.list(
+            filters={"label": f"com.docker.stack.namespace={PREFIX_STACK_NAME}"}
+        )
+        if service_names is None or item.name in service_names
+    }
+    if not services:
+        return {}, {}
+    filters = {"desired-state": ["running", "ready"]}
+    if service_names is not None:
+        filters["service"] = list(services.keys())
+    service_tasks = {}
+    for task in docker_client.api.tasks(filters=filters):
+        if task.get("ServiceID") in services:
+            service_tasks.setdefault(task["ServiceID"], []).append(task)
+    res = {}
+    node_tasks = {}
+    for service_id, service in services.items():
+        tasks = service_tasks.get(service_id, [])
+        running_tasks = [item for item in tasks if item.get("DesiredState") == "running"]
+        mode = service.attrs["Spec"].get("Mode", {})
+        if "Replicated" in mode:
+            desired = mode["Replicated"].get("Replicas", 0)
+        else:
+            desired = len(running_tasks)
+        running = sum(
+            1 for item in running_tasks if item.get("Status", {}).get("State") == "running"
+        )
+        states = sorted({format_task_state(item) for item in tasks})
+        res[service.name] = {
+            "status": "\n".join(states) if states else "Unknown",
+            "replicas": f"{running}/{desired}",
+        }
+        node_tasks[service.name] = {
+            item["NodeID"]: item.get("Status", {}).get("State", "")
+            for item in running_tasks
+            if item.get("NodeID")
+        }
+    return res, node_tasks
+
+
+def get_nodes_info():
+    # get node information published by IocDockServer if it is running, otherwise collect it by docker API.
+    res = read_info("node info", verbose=False).get("data", {})
+    if res and all("tasks" in item for item in res.values()):
+        return res
+    return collect_node_info()
+
+
+def get_ioc_deploy_option(name, option, default=""):
+    # read option of section "DEPLOY" from config file of IOC project exported at swarm data dir.
+    conf = configparser.ConfigParser()
+    if conf.read(os.path.join(MOUNT_PATH, SWARM_DIR, name, IOC_CONFIG_FILE)):
+        if conf.has_option("DEPLOY", option) and conf.get("DEPLOY", option).strip():
+            return conf.get("DEPLOY", option).strip()
+    return default
+
+
+def get_ioc_priority(name):
+    # larger value means higher priority, IOC projects without valid priority setting get 0.
+    try:
+        return int(get_ioc_deploy_option(name, "priority", default="0"))
+    except ValueError:
+        print(f'get_ioc_priority: Warning. Invalid priority for IOC "{name}", use 0.')
+        return 0
+
+
+def is_service_running(service, exclude_node_id=None):
+    """
+    Check whether all tasks of a service desired to be running are in running state,
+    and none of them is placed on the excluded node.
+    """
+    tasks = service.tasks(filters={"desired-state": "running"})
+    if not tasks:
+        return False
+    for task in tasks:
+        if task.get("Status", {}).get("State") != "running":
+            return False
+        if exclude_node_id and task.get("NodeID") == exclude_node_id:
+            return False
+    return True
+
+
+def wait_services_running(services, timeout=300, exclude_node_id=None, interval=2):
+    """
+    Wait until all given services are running, or timeout.
+
+    :param services: list of docker service objects.
+    :param timeout: seconds to wait.
+    :param exclude_node_id: tasks on this node are not considered running.
+    :param interval: seconds between two checks.
+    :return: list of names of services that are still not running.
+    """
+    pending = list(services)
+    start_time = time.time()
+    while pending:
+        pending = [
+            item
+            for item in pending
+            if not is_service_running(item, exclude_node_id=exclude_node_id)
+        ]
+        if not pending or time.time() - start_time > timeout:
+            break
+        time.sleep(interval)
+    return [item.name for item in pending]
+
+
+def get_service_constraints(service):
+    # placement constraints in spec of a docker service object.
+    return list(
+        service.attrs["Spec"]["TaskTemplate"].get("Placement", {}).get("Constraints") or []
+    )
+
+
+def drain_node(node_name, batch_size=5, timeout=300, verbose=False):
+    """
+    Evacuate IOC services from a swarm node in batches, IOC services with lower priority are moved first.
+    The node is paused so that no new task is scheduled to it, each batch is force updated to be rescheduled
+    to other nodes and the next batch starts after it is running elsewhere. The node is set to drain at last
+    to move the remaining non-IOC tasks.
+
+    :param node_name: hostname or ID of the node.
+    :param batch_size: number of IOC services moved in each batch.
+    :param timeout: seconds to wait for each batch to be running.
+    :param verbose:
+    """
+    import docker
+
+    from imutils.IocClass import get_ioc_placement, write_ioc_placement
+
+    nodes_info = get_nodes_info()
+    hostname = node_name
+    node_info = nodes_info.get(node_name)
+    if not node_info:
+        for key, item in nodes_info.items():
+            if item.get("id") == node_name:
+                hostname = key
+                node_info = item
+                break
+        else:
+            print(f'drain_node: Failed. Node "{node_name}" not found in swarm.')
+            return
+    node_id = node_info["id"]
+    batch_size = max(1, int(batch_size))
+
+    docker_client = docker.from_env()
+    services = {
+        item.name: item
+        for item in docker_client.services.list(
+            filters={"label": f"com.docker.stack.namespace={PREFIX_STACK_NAME}"}
+        )
+    }
+    to_move = []
+    for service_name in node_info.get("tasks", {}).keys():
+        service = services.get(service_name)
+        if not service:
+            continue
+        container_spec = service.attrs["Spec"]["TaskTemplate"]["ContainerSpec"]
+        if container_spec.get("Labels", {}).get("service-type") != "ioc":
+            continue
+        name = service_name.removeprefix(f"{PREFIX_STACK_NAME}_srv-")
+        to_move.append((get_ioc_priority(name), name, service))
+    to_move.sort(key=lambda x: (x[0], x[1]))
+    # IOC services pinned to the node by placement planner can only run there, the pin is removed when
+    # they are moved, and their assignments are removed from placement file.
+    pin = f"node.hostname=={hostname}"
+    pinned = [item[1] for item in to_move if pin in get_service_constraints(item[2])]
+    batches = [
+        to_move[i : i + batch_size] for i in range(0, len(to_move), batch_size)
+    ]
+    print(
+        f'drain_node: {len(to_move)} IOC services on node "{node_name}" will be moved '
+        f"in {len(batches)} batches."
+    )
+    if pinned:
+        print(
+            f'drain_node: {len(pinned)} IOC services are pinned to node "{node_name}" by placement planner, '
+            f"the pin will be removed to move them: {' '.join(pinned)}."
+        )
+    if verbose:
+        for i, batch in enumerate(batches, start=1):
+            print(f"batch {i}: " + " ".join(f"{item[1]}({item[0]})" for item in batch))
+    ans = input(f"Confirm to drain node {node_name}[y|n]?")
+    if not (ans.lower() == "y" or ans.lower() == "yes"):
+        print(f"Operation exit.")
+        return
+
+    placement = get_ioc_placement()
+    if any(item == hostname for item in placement.values()):
+        write_ioc_placement(
+            {name: item for name, item in placement.items() if item != hostname}
+        )
+        print(
+            f'drain_node: Assignments to node "{node_name}" removed from placement plan, '
+            f'run "swarm --plan-placement" to plan again after the node is back.'
+        )
+
+    # pause node to prevent tasks from being scheduled to it.
+    node = docker_client.nodes.get(node_id)
+    node_spec = node.attrs["Spec"]
+    node_spec["Availability"] = "pause"
+    node.update(node_spec)
+
+    start_time = time.time()
+    for i, batch in enumerate(batches, start=1):
+        batch_start_time = time.time()
+        for item in batch:
+            # reload to get the latest version of service to avoid out of sequence update.
+            item[2].reload()
+            constraints = get_service_constraints(item[2])
+            if pin in constraints:
+                item[2].update(
+                    constraints=[c for c in constraints if c != pin], force_update=True
+                )
+            else:
+                item[2].force_update()
+        pending = wait_services_running(
+            [item[2] for item in batch], timeout=timeout, exclude_node_id=node_id
+        )
+        if pending:
+            print(
+                f"drain_node: Failed. Batch {i}/{len(batches)} not running elsewhere after "
+                f'{timeout}s: {" ".join(pending)}. Node "{node_name}" is left paused, '
+                f"run the command again to continue."
+            )
+            return
+        print(
+            f"[{i}/{len(batches)}] moved {len(batch)} IOC services in "
+            f"{time.time() - batch_start_time:.1f}s: "
+            + " ".join(item[1] for item in batch)
+        )
+
+    node.reload()
+    node_spec = node.attrs["Spec"]
+    node_spec["Availability"] = "drain"
+    node.update(node_spec)
+    print(
+        f'drain_node: Finished. {len(to_move)} IOC services evacuated from node "{node_name}" '
+        f"in {time.time() - start_time:.1f}s, node is set to drain."
+    )
+
+
+def get_ioc_start_group(name):
+    # IOC projects in smaller start group are started earlier, IOC projects without valid setting get 0.
+    try:
+        return int(get_ioc_deploy_option(name, "start_group", default="0"))
+    except ValueError:
+        print(f'get_ioc_start_group: Warning. Invalid start_group for IOC "{name}", use 0.')
+        return 0
+
+
+def get_service_replicas(service):
+    # desired replicas of a replicated docker service, None for other modes.
+    return (
+        service.attrs.get("Spec", {}).get("Mode", {}).get("Replicated", {}).get("Replicas")
+    )
+
+
+def prepare_cold_start(iocs=None, max_workers=8):
+    """
+    Stop IOC services before a planned power off of the cluster, so that swarm restores them with 0 replicas
+    after the power cycle instead of starting all of them at the same moment, then "cold_start_iocs" starts
+    them group by group. Replicas of IOC services stopped are recorded at swarm data dir, IOC services with
+    0 replicas are paused on purpose and left as they are.
+
+    :param iocs: names or shell-style patterns of IOC projects, all IOC services if not given.
+    :param max_workers: max number of IOC services stopped at the same time.
+    """
+    from imutils.SwarmClass import SwarmManager
+
+    swarm_manager = SwarmManager()
+    replicas_dict = {
+        service: get_service_replicas(service)
+        for service in swarm_manager.get_ioc_services_matched(iocs)
+        if get_service_replicas(service)
+    }
+    if not replicas_dict:
+        print(f"prepare_cold_start: No running IOC service to stop.")
+        return
+    print(
+        f"prepare_cold_start: {len(replicas_dict)} IOC services will be stopped and started by "
+        f'"swarm --cold-start" after power on.'
+    )
+    ans = input(f"Confirm to stop IOC services for cold start[y|n]?")
+    if not (ans.lower() == "y" or ans.lower() == "yes"):
+        print(f"Operation exit.")
+        return
+
+    # record replicas of all IOC services before stopping, so that those failed to stop are started too.
+    record = swarm_manager.read_pause_record(file_name=IOC_COLD_START_RECORD_FILE)
+    for service, replicas in replicas_dict.items():
+        record[service.name] = replicas
+    swarm_manager.write_pause_record(record, file_name=IOC_COLD_START_RECORD_FILE)
+    succeeded = swarm_manager.scale_services(
+        {service: 0 for service in replicas_dict.keys()}, max_workers=max_workers
+    )
+    print(
+        f"prepare_cold_start: Finished. {len(succeeded)} IOC services stopped, "
+        f"{len(replicas_dict) - len(succeeded)} failed, power off the cluster now."
+    )
+
+
+def cold_start_iocs(iocs=None, max_workers=8, timeout=300, verbose=False):
+    """
+    Start IOC services stopped by "prepare_cold_start" group by group after a cluster power cycle, to avoid
+    all IOC services reading startup files from NFS at the same moment.
+
+    Each start group (ascending "start_group", higher "priority" first in a group) is scaled back to the
+    recorded replicas in waves of at most "max_workers" services, each wave is gated on being running.
+    IOC services not stopped for cold start are never stopped or restarted: running ones are left as they are,
+    and those with 0 replicas not recorded are paused on purpose.
+
+    :param iocs: names or shell-style patterns of IOC projects, all IOC services if not given.
+    :param max_workers: max number of IOC services started at the same time.
+    :param timeout: seconds to wait for each wave to be running.
+    :param verbose:
+    """
+    from imutils.SwarmClass import SwarmManager
+
+    swarm_manager = SwarmManager()
+    services = swarm_manager.get_ioc_services_matched(iocs)
+    if not services:
+        print(f"cold_start_iocs: No deployed IOC service to start.")
+        return
+    max_workers = max(1, int(max_workers))
+
+    record = swarm_manager.read_pause_record(file_name=IOC_COLD_START_RECORD_FILE)
+    replicas_dict = {}
+    running = []
+    skipped = []
+    for service in services:
+        name = service.name.removeprefix(f"{PREFIX_STACK_NAME}_srv-")
+        if get_service_replicas(service):
+            # started meanwhile by other means, not to be started again.
+            record.pop(service.name, None)
+            running.append(name)
+        elif service.name in record:
+            replicas_dict[service] = record[service.name]
+        else:
+            skipped.append(name)
+    if verbose and running:
+        print(
+            f"cold_start_iocs: {len(running)} IOC services already started by swarm are left as they are: "
+            f'{" ".join(sorted(running))}.'
+        )
+    if skipped:
+        print(
+            f"cold_start_iocs: {len(skipped)} IOC services with 0 replicas not stopped for cold start are "
+            f'skipped: {" ".join(sorted(skipped))}.'
+        )
+    if not replicas_dict:
+        print(
+            f"cold_start_iocs: No IOC service stopped for cold start, "
+            f'run "swarm --prepare-cold-start" before powering off the cluster.'
+        )
+        return
+
+    # make start groups.
+    groups = {}
+    for service in replicas_dict.keys():
+        name = service.name.removeprefix(f"{PREFIX_STACK_NAME}_srv-")
+        groups.setdefault(get_ioc_start_group(name), []).append(
+            (get_ioc_priority(name), name, service)
+        )
+    for group in groups.values():
+        group.sort(key=lambda x: (-x[0], x[1]))
+    print(
+        f"cold_start_iocs: {len(replicas_dict)} IOC services will be started in {len(groups)} groups, "
+        f"at most {max_workers} at the same time."
+    )
+    ans = input(f"Confirm to cold start IOC services[y|n]?")
+    if not (ans.lower() == "y" or ans.lower() == "yes"):
+        print(f"Operation exit.")
+        return
+
+    start_time = time.time()
+    not_running = []
+    for group_index in sorted(groups.keys()):
+        group = groups[group_index]
+        group_start_time = time.time()
+        for i in range(0, len(group), max_workers):
+            wave = group[i : i + max_workers]
+            succeeded = swarm_manager.scale_services(
+                {item[2]: replicas_dict[item[2]] for item in wave},
+                max_workers=max_workers,
+            )
+            pending = wait_services_running([item[2] for item in wave], timeout=timeout)
+            if pending:
+                not_running.extend(pending)
+                print(
+                    f"cold_start_iocs: Warning. Not running after {timeout}s: {' '.join(pending)}."
+                )
+            for name in succeeded:
+                record.pop(name, None)
+            swarm_manager.write_pause_record(record, file_name=IOC_COLD_START_RECORD_FILE)
+            if verbose:
+                print(f"start group {group_index}: " + " ".join(item[1] for item in wave))
+        print(
+            f"cold_start_iocs: Start group {group_index} with {len(group)} IOC services "
+            f"finished in {time.time() - group_start_time:.1f}s."
+        )
+    print(
+        f"cold_start_iocs: Finished. {len(replicas_dict) - len(not_running)}/{len(replicas_dict)} "
+        f"IOC services running, time to full fleet availability: {time.time() - start_time:.1f}s."
+    )
+    if not_running:
+        print(f'cold_start_iocs: IOC services not running: {" ".join(not_running)}.')
@@ -0,0 +1,442 @@
+import os
+
+from imutils.IMConfig import *
+from imutils.IMFunc import try_makedirs, file_remove, cpus_to_nano, memory_to_bytes
+from imutils.IocClass import (
+    gen_swarm_files,
+    get_ioc_placement,
+    get_ioc_service_definition,
+)
+
+# fields of service specification compared between compose definition and deployed service.
+PLAN_FIELDS = ["image", "resources", "labels", "environment", "constraints", "mounts"]
+# fields that can be patched on a deployed service in place by docker API, others need a stack deploy.
+IN_PLACE_FIELDS = ["image", "resources", "labels", "environment"]
+
+
+def normalize_image(image):
+    # strip digest pinned by "--with-registry-auth" and add default tag, so that images can be compared.
+    image = str(image).split("@", maxsplit=1)[0]
+    if ":" not in image.rsplit("/", maxsplit=1)[-1]:
+        image = f"{image}:latest"
+    return image
+
+
+def get_desired_ioc_services(iocs=None, verbose=False):
+    """
+    Build compose service definitions of swarm IOC projects at swarm data dir in memory,
+    the same as what "gen_swarm_files" would write.
+
+    :param iocs: names of IOC projects, all IOC projects will be processed if not given.
+    :param verbose:
+    :return: dict of {IOC name: service definition}.
+    """
+    top_path = os.path.join(MOUNT_PATH, SWARM_DIR)
+    if not os.path.isdir(top_path):
+        print(f"get_desired_ioc_services: Failed. Working directory {top_path} is not exist!")
+        return {}
+    res = {}
+    placement = get_ioc_placement(available_only=True)
+    for service_dir in sorted(os.listdir(top_path)):
+        if iocs and service_dir not in iocs:
+            continue
+        if not os.path.isdir(os.path.join(top_path, service_dir)):
+            continue
+        service_data = get_ioc_service_definition(
+            service_dir, verbose=verbose, placement=placement
+        )
+        if service_data:
+            res[service_dir] = service_data[f"srv-{service_dir}"]
+    return res
+
+
+def desired_spec_digest(service_dir, definition):
+    """
+    Return comparable fields of a compose service definition of IOC project, in the format docker API uses.
+    """
+    compose_dir = os.path.join(MOUNT_PATH, SWARM_DIR, service_dir)
+    resources = definition.get("deploy", {}).get("resources", {})
+    resources_digest = {}
+    for key in ("limits", "reservations"):
+        resources_digest[key] = {
+            "nano_cpus": cpus_to_nano(resources.get(key, {}).get("cpus")),
+            "memory_bytes": memory_to_bytes(resources.get(key, {}).get("memory")),
+        }
+    mounts = []
+    for item in definition.get("volumes", []):
+        source = item.get("source", "")
+        if not os.path.isabs(source):
+            source = os.path.normpath(os.path.join(compose_dir, source))
+        mounts.append(
+            (
+                item.get("type", "bind"),
+                source,
+                item.get("target", ""),
+                bool(item.get("read_only", False)),
+            )
+        )
+    return {
+        "image": normalize_image(definition.get("image", "")),
+        "resources": resources_digest,
+        "labels": {str(k): str(v) for k, v in definition.get("labels", {}).items()},
+        "environment": sorted(
+            f"{k}={v}" for k, v in definition.get("environment", {}).items()
+        ),
+        "constraints": sorted(
+            str(item).replace(" ", "")
+            for item in definition.get("deploy", {})
+            .get("placement", {})
+            .get("constraints", [])
+        ),
+        "mounts": sorted(mounts),
+    }
+
+
+def live_spec_digest(service):
+    """
+    Return comparable fields of a deployed service from its specification got by docker API.
+
+    :param service: docker.models.services.Service object.
+    """
+    task_template = service.attrs.get("Spec", {}).get("TaskTemplate", {})
+    container_spec = task_template.get("ContainerSpec", {})
+    resources = task_template.get("Resources", {})
+    resources_digest = {}
+    for key, api_key in (("limits", "Limits"), ("reservations", "Reservations")):
+        resources_digest[key] = {
+            "nano_cpus": resources.get(api_key, {}).get("NanoCPUs", 0),
+            "memory_bytes": resources.get(api_key, {}).get("MemoryBytes", 0),
+        }
+    return {
+        "image": normalize_image(container_spec.get("Image", "")),
+        "resources": resources_digest,
+        "labels": {
+            k: v
+            for k, v in container_spec.get("Labels", {}).items()
+            if not k.startswith("com.docker.stack.")
+        },
+        "environment": sorted(container_spec.get("Env", [])),
+        "constraints": sorted(
+            str(item).replace(" ", "")
+            for item in task_template.get("Placement", {}).get("Constraints", [])
+        ),
+        "mounts": sorted(
+            (
+                item.get("Type", "bind"),
+                item.get("Source", ""),
+                item.get("Target", ""),
+                bool(item.get("ReadOnly", False)),
+            )
+            for item in container_spec.get("Mounts", [])
+        ),
+    }
+
+
+def diff_spec(desired, live):
+    """
+    Return dict of {field: (desired value, live value)} for the fields that differ.
+    """
+    return {
+        field: (desired[field], live[field])
+        for field in PLAN_FIELDS
+        if desired[field] != live[field]
+    }
+
+
+def get_live_services():
+    # return dict of {service name: docker service object} of services deployed in the stack.
+    import docker
+
+    docker_client = docker.from_env()
+    return {
+        item.name: item
+        for item in docker_client.services.list(
+            filters={"label": f"com.docker.stack.namespace={PREFIX_STACK_NAME}"}
+        )
+    }
+
+
+def get_ioc_service_plan(iocs=None, verbose=False):
+    """
+    Compare compose service definitions of IOC projects with deployed services and get a deploy plan.
+
+    :param iocs: names of IOC projects, all IOC projects will be planned if not given.
+    :param verbose:
+    :return: list of dict with keys "name", "service_name", "action", "changes", "definition", "service",
+        action is one of "create", "update", "unchanged" and "orphaned".
+    """
+    desired_services = get_desired_ioc_services(iocs=iocs, verbose=verbose)
+    live_services = get_live_services()
+    plan = []
+    for name, definition in desired_services.items():
+        service_name = f"{PREFIX_STACK_NAME}_srv-{name}"
+        item = {
+            "name": name,
+            "service_name": service_name,
+            "action": "create",
+            "changes": {},
+            "definition": definition,
+            "service": live_services.get(service_name),
+        }
+        if service_name in live_services:
+            item["changes"] = diff_spec(
+                desired_spec_digest(name, definition),
+                live_spec_digest(live_services[service_name]),
+            )
+            item["action"] = "update" if item["changes"] else "unchanged"
+        plan.append(item)
+    # deployed IOC services with no IOC project available at swarm data dir.
+    planned_services = [item["service_name"] for item in plan]
+    for service_name, service in sorted(live_services.items()):
+        if service_name in planned_services:
+            continue
+        container_spec = (
+            service.attrs.get("Spec", {}).get("TaskTemplate", {}).get("ContainerSpec", {})
+        )
+        if container_spec.get("Labels", {}).get("service-type") != "ioc":
+            continue
+        name = service_name.removeprefix(f"{PREFIX_STACK_NAME}_srv-")
+        if iocs and name not in iocs:
+            continue
+        plan.append(
+            {
+                "name": name,
+                "service_name": service_name,
+                "action": "orphaned",
+                "changes": {},
+                "definition": None,
+                "service": service,
+            }
+        )
+    return plan
+
+
+def show_ioc_service_plan(plan, verbose=False):
+    from tabulate import tabulate
+
+    order = {"create": 0, "update": 1, "orphaned": 2, "unchanged": 3}
+    raw_print = [["Name", "ServiceName", "Action", "Changes"]]
+    for item in sorted(plan, key=lambda x: (order[x["action"]], x["name"])):
+        if item["action"] == "unchanged" and not verbose:
+            continue
+        raw_print.append(
+            [
+                item["name"],
+                item["service_name"],
+                item["action"],
+                ", ".join(item["changes"].keys()),
+            ]
+        )
+        if verbose:
+            for field, (desired, live) in item["changes"].items():
+                raw_print.append(["", "", "", f"{field}: {live} -> {desired}"])
+    print(tabulate(raw_print, headers="firstrow", tablefmt="plain"))
+    counts = {key: 0 for key in order.keys()}
+    for item in plan:
+        counts[item["action"]] += 1
+    print(
+        f"Plan: {counts['create']} to create, {counts['update']} to update, "
+        f"{counts['unchanged']} unchanged, {counts['orphaned']} orphaned."
+    )
+
+
+def apply_ioc_service_plan(iocs=None, verbose=False):
+    """
+    Deploy only IOC services that are not deployed or whose specification has changed, by a single
+    "docker stack deploy" with a stack file of those services. Orphaned services are only reported.
+    """
+    plan = get_ioc_service_plan(iocs=iocs, verbose=verbose)
+    show_ioc_service_plan(plan, verbose=verbose)
+    to_apply = [item for item in plan if item["action"] in ("create", "update")]
+    if not to_apply:
+        print(f"apply_ioc_service_plan: Nothing to apply.")
+        return
+    if any(item["action"] == "update" for item in to_apply):
+        ans = input(
+            f"Services to update will be restarted, confirm to apply the above plan[y|n]?"
+        )
+        if not (ans.lower() == "y" or ans.lower() == "yes"):
+            print(f"Operation exit.")
+            return
+
+    # keep compose files at swarm data dir consistent with what is applied.
+    gen_swarm_files(iocs=[item["name"] for item in to_apply], verbose=verbose)
+    deploy_ioc_services_by_stack(to_apply, verbose=verbose)
+
+
+def deploy_ioc_services_by_stack(items, verbose=False):
+    """
+    Deploy given IOC services of a plan by a single "docker stack deploy" with a stack file of those services.
+    """
+    import yaml
+
+    stack_path = os.path.join(MOUNT_PATH, SWARM_DIR, IOC_STACK_DIR)
+    try_makedirs(stack_path, verbose=verbose)
+    file_path = os.path.join(stack_path, IOC_PLAN_FILE)
+    if os.path.exists(file_path):
+        file_remove(file_path, verbose=False)
+    yaml_data = {
+        "services": {f'srv-{item["name"]}': item["definition"] for item in items},
+        "networks": {"hostnet": {"external": True, "name": "host"}},
+    }
+    with open(file_path, "w") as f:
+        yaml.dump(yaml_data, f, default_flow_style=False)
+    os.chmod(file_path, 0o444)
+
+    print(f"deploy_ioc_services_by_stack: Start to deploy {len(items)} IOC services.")
+    print(f"=================================================================")
+    command = (
+        f"cd {stack_path}; "
+        f"docker stack deploy --compose-file {IOC_PLAN_FILE} {PREFIX_STACK_NAME} "
+        f"--detach --with-registry-auth"
+    )
+    os.system(command)
+
+
+def parse_duration_ns(duration):
+    # return nanoseconds of a compose duration value, for example "1m30s" will get 90000000000.
+    import re
+
+    units = {"ns": 1, "us": 1e3, "ms": 1e6, "s": 1e9, "m": 60e9, "h": 3600e9}
+    res = 0
+    for value, unit in re.findall(r"(\d+(?:\.\d+)?)(ns|us|ms|s|m|h)", str(duration)):
+        res += float(value) * units[unit]
+    return int(res)
+
+
+def patch_service_spec(spec, definition):
+    """
+    Return a copy of deployed service specification with the fields that can be updated in place
+    (image, resources, labels, environment and update_config) replaced by those of compose definition.
+    """
+    import copy
+
+    spec = copy.deepcopy(spec)
+    task_template = spec.setdefault("TaskTemplate", {})
+    container_spec = task_template.setdefault("ContainerSpec", {})
+    container_spec["Image"] = definition["image"]
+    labels = {
+        k: v
+        for k, v in container_spec.get("Labels", {}).items()
+        if k.startswith("com.docker.stack.")
+    }
+    labels.update({str(k): str(v) for k, v in definition.get("labels", {}).items()})
+    container_spec["Labels"] = labels
+    container_spec["Env"] = [
+        f"{k}={v}" for k, v in definition.get("environment", {}).items()
+    ]
+    resources = definition.get("deploy", {}).get("resources", {})
+    resources_spec = {}
+    for key, api_key in (("limits", "Limits"), ("reservations", "Reservations")):
+        temp_dict = {}
+        nano_cpus = cpus_to_nano(resources.get(key, {}).get("cpus"))
+        memory_bytes = memory_to_bytes(resources.get(key, {}).get("memory"))
+        if nano_cpus:
+            temp_dict["NanoCPUs"] = nano_cpus
+        if memory_bytes:
+            temp_dict["MemoryBytes"] = memory_bytes
+        if temp_dict:
+            resources_spec[api_key] = temp_dict
+    task_template["Resources"] = resources_spec
+    update_config = definition.get("deploy", {}).get("update_config", {})
+    update_config_spec = spec.get("UpdateConfig") or {}
+    if "parallelism" in update_config:
+        update_config_spec["Parallelism"] = int(update_config["parallelism"])
+    if "delay" in update_config:
+        update_config_spec["Delay"] = parse_duration_ns(update_config["delay"])
+    if "failure_action" in update_config:
+        update_config_spec["FailureAction"] = update_config["failure_action"]
+    spec["UpdateConfig"] = update_config_spec
+    return spec
+
+
+def update_service_in_place(item):
+    """
+    Patch a deployed IOC service of a plan with docker API "service update", without a stack deploy.
+
+    :return: (IOC name, whether succeeded, message)
+    """
+    import docker
+
+    service = item["service"]
+    spec = patch_service_spec(service.attrs["Spec"], item["definition"])
+    try:
+        service.client.api.update_service(
+            service.id,
+            service.version,
+            task_template=spec["TaskTemplate"],
+            name=spec["Name"],
+            labels=spec.get("Labels"),
+            mode=spec.get("Mode"),
+            update_config=spec.get("UpdateConfig"),
+            rollback_config=spec.get("RollbackConfig"),
+            endpoint_spec=spec.get("EndpointSpec"),
+        )
+    except docker.errors.APIError as e:
+        return item["name"], False, f"{e}"
+    return item["name"], True, ", ".join(item["changes"].keys())
+
+
+def update_ioc_services_in_place(iocs=None, max_workers=8, verbose=False):
+    """
+    Update changed IOC services concurrently by patching their specifications in place with docker API.
+    Services whose placement constraints or mounts changed and services not deployed yet are
+    deployed by a single stack deploy instead. Compose files at swarm data dir are regenerated before
+    applying, so that they keep consistent with deployed services.
+
+    :param iocs: names of IOC projects, all IOC projects will be processed if not given.
+    :param max_workers: max number of services updated concurrently.
+    :param verbose:
+    """
+    import time
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    plan = get_ioc_service_plan(iocs=iocs, verbose=verbose)
+    show_ioc_service_plan(plan, verbose=verbose)
+    to_patch = []
+    to_deploy = []
+    for item in plan:
+        if item["action"] == "update" and set(item["changes"]).issubset(
+            IN_PLACE_FIELDS
+        ):
+            to_patch.append(item)
+        elif item["action"] in ("create", "update"):
+            to_deploy.append(item)
+    if not to_patch and not to_deploy:
+        print(f"update_ioc_services_in_place: Nothing to update.")
+        return
+    print(
+        f"update_ioc_services_in_place: {len(to_patch)} services to update in place, "
+        f"{len(to_deploy)} services to deploy by stack file."
+    )
+    ans = input(
+        f"Services to update will be restarted, confirm to apply the above plan[y|n]?"
+    )
+    if not (ans.lower() == "y" or ans.lower() == "yes"):
+        print(f"Operation exit.")
+        return
+
+    # keep compose files at swarm data dir consistent with what is applied.
+    gen_swarm_files(iocs=[item["name"] for item in to_patch + to_deploy], verbose=verbose)
+
+    start_time = time.time()
+    failed = []
+    if to_patch:
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers))) as executor:
+            futures = [executor.submit(update_service_in_place, item) for item in to_patch]
+            for i, future in enumerate(as_completed(futures), start=1):
+                name, success, message = future.result()
+                if success:
+                    print(f"[{i}/{len(to_patch)}] {name}: Updated ({message}).")
+                else:
+                    failed.append(name)
+                    print(f"[{i}/{len(to_patch)}] {name}: Failed, {message}.")
+    if to_deploy:
+        deploy_ioc_services_by_stack(to_deploy, verbose=verbose)
+    print(
+        f"update_ioc_services_in_place: Finished in {time.time() - start_time:.1f}s, "
+        f"{len(to_patch) - len(failed)} updated in place, {len(failed)} failed, "
+        f"{len(to_deploy)} deployed by stack file."
+    )
+    if failed:
+        print(f'update_ioc_services_in_place: Failed services: {" ".join(failed)}.')
@@ -0,0 +1,267 @@
+import heapq
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ScheduledTask:
+    """
+    Task run repeatedly by a TaskScheduler, with the same interface as DockerEventWatcher.
+
+    Next run is scheduled after the current one finishes, so a task never runs back to back or concurrently
+    with itself. If the function returns True (changes seen) the interval is shortened toward
+    interval * min_factor, if it returns False (nothing changed) the interval is lengthened toward
+    interval * max_factor, if it returns None the interval is kept. Exceptions back off the interval
+    exponentially up to max_backoff seconds, and random jitter is added to avoid synchronized runs.
+    """
+
+    def __init__(
+        self,
+        scheduler,
+        interval,
+        function,
+        *args,
+        min_factor=1.0,
+        max_factor=1.0,
+        jitter=0.1,
+        max_backoff=300,
+        **kwargs,
+    ):
+        self.scheduler = scheduler
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.min_factor = min_factor
+        self.max_factor = max_factor
+        self.jitter = jitter
+        self.max_backoff = max_backoff
+        self._interval = interval
+        self.current_interval = interval
+
+        self.runs = 0
+        self.overruns = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.last_run_at = None
+        self.last_error = None
+        self.next_run_at = None
+
+        self._running = False
+        self._in_progress = False
+        self._lock = threading.Lock()
+
+    @property
+    def interval(self):
+        return self._interval
+
+    @interval.setter
+    def interval(self, value):
+        # base interval changed (e.g. reconcile mode), adaptation starts from it again.
+        with self._lock:
+            self._interval = value
+            self.current_interval = value
+            delay = value * (1 + self.jitter * random.uniform(-1, 1))
+            # a run in progress schedules the next one by the new interval when it finishes, and a run
+            # pending is only brought forward, so that a longer interval takes effect after it.
+            reschedule = (
+                self._running
+                and not self._in_progress
+                and (
+                    self.next_run_at is None
+                    or time.monotonic() + delay < self.next_run_at
+                )
+            )
+        if reschedule:
+            self.scheduler.reschedule(self, delay)
+
+    def start(self):
+        with self._lock:
+            if self._running:
+                return
+            self._running = True
+            in_progress = self._in_progress
+        if not in_progress:
+            self.scheduler.reschedule(self, self.jitter * self._interval * random.random())
+
+    def stop(self):
+        with self._lock:
+            self._running = False
+            self.next_run_at = None
+
+    def shutdown(self):
+        self.stop()
+
+    @property
+    def is_running(self):
+        with self._lock:
+            return self._running
+
+    def run(self):
+        """
+        Run function once and compute delay of next run, called by TaskScheduler in its worker threads.
+
+        :return: seconds to next run, None if task is stopped.
+        """
+        with self._lock:
+            self._in_progress = True
+        start_time = time.monotonic()
+        self.last_run_at = time.time()
+        result = None
+        error = None
+        try:
+            result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            error = e
+            print(f"Error in ScheduledTask.run ({self.function.__name__}): {e}")
+        duration = time.monotonic() - start_time
+        with self._lock:
+            self._in_progress = False
+            self.runs += 1
+            self.last_duration = duration
+            self.max_duration = max(self.max_duration, duration)
+            self.total_duration += duration
+            if duration > self.current_interval:
+                self.overruns += 1
+            if error is not None:
+                self.errors += 1
+                self.consecutive_errors += 1
+                self.last_error = (
+                    f'{time.strftime("%Y-%m-%d %H:%M:%S")} {type(error).__name__}: {error}'
+                )
+                delay = min(
+                    self.current_interval * 2**self.consecutive_errors,
+                    max(self.max_backoff, self.current_interval),
+                )
+            else:
+                self.consecutive_errors = 0
+                if result is True:
+                    self.current_interval = max(
+                        self._interval * self.min_factor, self.current_interval / 2
+                    )
+                elif result is False:
+                    self.current_interval = min(
+                        self._interval * self.max_factor, self.current_interval * 1.5
+                    )
+                # next run is counted from the start of this run, but a run overrunning its interval
+                # waits a whole interval rather than starting again right away.
+                delay = self.current_interval - duration
+                if delay <= 0:
+                    delay = self.current_interval
+            if not self._running:
+                return None
+        return delay * (1 + self.jitter * random.uniform(-1, 1))
+
+    def get_status(self):
+        with self._lock:
+            return {
+                "status": "running" if self._running else "stopped",
+                "interval": self._interval,
+                "current_interval": round(self.current_interval, 3),
+                "function": self.function.__name__,
+                "args": self.args,
+                "kwargs": self.kwargs,
+                "runs": self.runs,
+                "last_duration": round(self.last_duration, 4),
+                "max_duration": round(self.max_duration, 4),
+                "total_duration": round(self.total_duration, 4),
+                "overruns": self.overruns,
+                "errors": self.errors,
+                "last_error": self.last_error,
+                "last_run_at": (
+                    time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.last_run_at))
+                    if self.last_run_at
+                    else None
+                ),
+                "next_run_in": (
+                    round(max(self.next_run_at - time.monotonic(), 0), 3)
+                    if self.next_run_at is not None
+                    else None
+                ),
+            }
+
+
+class TaskScheduler:
+    """
+    Run ScheduledTask objects by one dispatching thread and a pool of worker threads, instead of a thread
+    sleeping for each task.
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self._heap = []
+        self._seq = 0
+        self._condition = threading.Condition()
+        self._thread = None
+        self._executor = None
+        self._stopping = False
+
+    def task(self, interval, function, *args, **kwargs):
+        # create a task run by this scheduler, see ScheduledTask for arguments.
+        return ScheduledTask(self, interval, function, *args, **kwargs)
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.max_workers, thread_name_prefix="TaskScheduler"
+            )
+            self._thread = threading.Thread(target=self._dispatch, daemon=True)
+            self._thread.start()
+
+    def shutdown(self):
+        with self._condition:
+            if self._thread is None:
+                return
+            self._stopping = True
+            self._heap.clear()
+            self._condition.notify_all()
+            thread = self._thread
+            self._thread = None
+        thread.join()
+        # wait for tasks in progress.
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    def reschedule(self, task, delay):
+        with self._condition:
+            if self._stopping:
+                return
+            task.next_run_at = time.monotonic() + delay
+            self._seq += 1
+            # entries of earlier schedule of the same task are skipped as their due time does not match.
+            heapq.heappush(self._heap, (task.next_run_at, self._seq, task))
+            self._condition.notify()
+
+    def _dispatch(self):
+        while True:
+            with self._condition:
+                if self._stopping:
+                    return
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                due, _, task = self._heap[0]
+                wait_time = due - time.monotonic()
+                if wait_time > 0:
+                    self._condition.wait(wait_time)
+                    continue
+                heapq.heappop(self._heap)
+                if due != task.next_run_at or not task.is_running:
+                    continue
+                task.next_run_at = None
+                try:
+                    self._executor.submit(self._run_task, task)
+                except RuntimeError:
+                    # executor is shut down on interpreter exit.
+                    return
+
+    def _run_task(self, task):
+        delay = task.run()
+        if delay is not None:
+            self.reschedule(task, delay)
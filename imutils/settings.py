@@ -16,6 +16,11 @@ RESOURCE_IOC_CPU_LIMIT = "1"
 # IOC容器内存限制
 RESOURCE_IOC_MEMORY_LIMIT = "1G"
 
+# Prometheus HTTP API地址, 用于根据IOC历史资源占用推荐资源限制
+PROMETHEUS_URL = "http://127.0.0.1:9090"
+# IocDockServer 暴露Prometheus指标(/metrics)的HTTP端口, 0为不启用; 启用时按 scrape-config-iocdock-server.yaml.example 配置抓取
+METRICS_PORT = 0
+
 ################# Ansible 配置 #############################
 
 # swarm集群管理节点
@@ -51,6 +56,8 @@ REGISTRY_NFS_MOUNT_SRC = "192.168.1.50:/NFS/registry-data"
 REGISTRY_MASTER_IP = "192.168.1.50"
 REGISTRY_LOGIN_USERNAME = "admin"
 REGISTRY_LOGIN_PASSWORD = "admin"
+# registry查询结果的本地缓存有效期(秒)
+REGISTRY_CACHE_TTL = 300
 
 ################# AlertManager 配置 ########################
 
@@ -0,0 +1,160 @@
+import json
+import configparser
+import threading
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import imutils.IMConfig as IMConfig
+import imutils.PlacementPlanner as PlacementPlanner
+import imutils.ResourceRecommender as ResourceRecommender
+from imutils.IocClass import IOC
+
+PREFIX = f"{IMConfig.PREFIX_STACK_NAME}_srv-"
+
+# canned range query results, values of one series for each service.
+CPU_SERIES = [
+    ({"service": f"{PREFIX}ioc1"}, [i / 100 for i in range(1, 51)]),
+    # values of the same service from another series are grouped together.
+    ({"service": f"{PREFIX}ioc1"}, [i / 100 for i in range(51, 101)]),
+    ({"service": f"{PREFIX}ioc2"}, [0.2] * 10 + ["NaN"]),
+    # series without "service" label are ignored.
+    ({"instance": "node1"}, [5.0]),
+]
+MEMORY_SERIES = [
+    ({"service": f"{PREFIX}ioc1"}, [100 << 20, 300 << 20, 200 << 20]),
+    ({"service": f"{PREFIX}ioc2"}, [40 << 20]),
+]
+
+
+class PrometheusHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        form = urllib.parse.parse_qs(self.rfile.read(length).decode())
+        self.server.requests.append(
+            (self.path, {key: value[0] for key, value in form.items()})
+        )
+        query = form["query"][0]
+        if "container_cpu_usage_seconds_total" in query:
+            series = CPU_SERIES
+        elif "container_memory_working_set_bytes" in query:
+            series = MEMORY_SERIES
+        else:
+            series = []
+        body = {
+            "status": "success",
+            "data": {
+                "resultType": "matrix",
+                "result": [
+                    {
+                        "metric": metric,
+                        "values": [[i * 60, str(value)] for i, value in enumerate(values)],
+                    }
+                    for metric, values in series
+                ],
+            },
+        }
+        data = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def prometheus():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PrometheusHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def prometheus_url(server):
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def test_get_ioc_usage_batched_queries(prometheus):
+    usage = ResourceRecommender.get_ioc_usage(
+        window="1d", prometheus_url=prometheus_url(prometheus)
+    )
+    assert len(prometheus.requests) == 2
+    paths = {item[0] for item in prometheus.requests}
+    assert paths == {"/api/v1/query_range"}
+    queries = [item[1]["query"] for item in prometheus.requests]
+    for query in queries:
+        assert query.startswith("sum by (service) (")
+        assert f'stack="{IMConfig.PREFIX_STACK_NAME}"' in query
+        assert 'service_type="ioc"' in query
+    assert any("rate(container_cpu_usage_seconds_total" in item for item in queries)
+    assert any("container_memory_working_set_bytes" in item for item in queries)
+    for _, form in prometheus.requests:
+        assert float(form["end"]) - float(form["start"]) == pytest.approx(86400)
+        assert form["step"] == "60"
+    assert set(usage.keys()) == {"ioc1", "ioc2"}
+
+
+def test_get_ioc_usage_percentiles(prometheus):
+    usage = ResourceRecommender.get_ioc_usage(
+        window="7d", prometheus_url=prometheus_url(prometheus)
+    )
+    assert usage["ioc1"]["cpu-p95"] == pytest.approx(0.95)
+    assert usage["ioc1"]["cpu-p99"] == pytest.approx(0.99)
+    assert usage["ioc1"]["memory-peak"] == 300 << 20
+    assert usage["ioc2"]["cpu-p95"] == pytest.approx(0.2)
+    assert usage["ioc2"]["cpu-p99"] == pytest.approx(0.2)
+    assert usage["ioc2"]["memory-peak"] == 40 << 20
+    # 7 days in steps of 61s to keep under 11000 points per series.
+    assert {item[1]["step"] for item in prometheus.requests} == {"61"}
+
+
+def test_get_ioc_usage_failed():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), PrometheusHandler)
+    port = server.server_port
+    server.server_close()
+    assert (
+        ResourceRecommender.get_ioc_usage(
+            window="1d", prometheus_url=f"http://127.0.0.1:{port}"
+        )
+        is None
+    )
+    assert ResourceRecommender.get_ioc_usage(window="bad") is None
+
+
+def test_recommend_ioc_resources_write(prometheus, tmp_path, monkeypatch):
+    mount_path = tmp_path / "mount"
+    repository_path = tmp_path / "repository"
+    repository_path.mkdir()
+    for name in ("ioc1", "ioc2"):
+        (repository_path / name).mkdir()
+        IOC(dir_path=str(repository_path / name), create=True)
+        (mount_path / IMConfig.SWARM_DIR / name).mkdir(parents=True)
+        (mount_path / IMConfig.SWARM_DIR / name / IMConfig.IOC_CONFIG_FILE).write_text(
+            (repository_path / name / IMConfig.IOC_CONFIG_FILE).read_text()
+        )
+    monkeypatch.setattr(PlacementPlanner, "MOUNT_PATH", str(mount_path))
+    monkeypatch.setattr(IMConfig, "REPOSITORY_PATH", str(repository_path))
+
+    ResourceRecommender.recommend_ioc_resources(
+        window="1d", prometheus_url=prometheus_url(prometheus), write=True
+    )
+
+    conf = configparser.ConfigParser()
+    conf.read(repository_path / "ioc1" / IMConfig.IOC_CONFIG_FILE)
+    assert conf.get("DEPLOY", "cpu-reserve") == "0.95"
+    assert conf.get("DEPLOY", "cpu-limit") == "1.5"
+    assert conf.get("DEPLOY", "memory-reserve") == "304M"
+    assert conf.get("DEPLOY", "memory-limit") == "464M"
+    conf = configparser.ConfigParser()
+    conf.read(repository_path / "ioc2" / IMConfig.IOC_CONFIG_FILE)
+    assert conf.get("DEPLOY", "cpu-reserve") == "0.2"
+    assert conf.get("DEPLOY", "cpu-limit") == "0.3"
+    assert conf.get("DEPLOY", "memory-reserve") == "48M"
+    assert conf.get("DEPLOY", "memory-limit") == "64M"